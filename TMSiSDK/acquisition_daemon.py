@@ -0,0 +1,487 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+TMSiSDK: Headless acquisition daemon
+
+Runs a measurement without any GUI and records the sample-data to file. The
+recording is controlled with a local HTTP/JSON-API, which also exposes the
+throughput- and sample-loss-metrics:
+
+    GET  /status              state of the device, measurement and recording
+    GET  /metrics             throughput, sample-loss and latency statistics
+    POST /recording/start     start recording to a new file
+    POST /recording/stop      stop recording
+    POST /recording/rotate    continue the recording in a new file
+    POST /config              change the configuration, e.g.
+                              {"config_file": "../TMSiSDK/configs/EEG32.xml"}
+                              {"base_sample_rate": 4000, "reference_method": "average"}
+
+The measurement keeps running between recordings. Every recording is written
+by a segmented <FileWriter>: rotating continues the recording in a new
+segment-file without losing or duplicating sample-data, and the segments of
+a recording are listed in its manifest-file.
+
+Usage (from a directory next to 'TMSiSDK'):
+    python -m TMSiSDK.acquisition_daemon --dr-interface docked --directory ../measurements
+    curl -X POST http://127.0.0.1:8765/recording/start
+
+'''
+
+import argparse
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .error import TMSiError, TMSiErrorCode
+from .device import DeviceInterfaceType, ReferenceMethod
+from .file_writer import FileWriter, FileFormat
+from . import sample_data_server, latency_monitor, settings
+
+_QUEUE_SIZE = 1000
+_DEFAULT_PORT = 8765
+
+
+class AcquisitionDaemon:
+    """ <AcquisitionDaemon> keeps a measurement running and records its
+        sample-data into a sequence of files.
+
+        Args:
+            device : <Device> An opened device.
+
+            directory : <string> The directory into which the files are written.
+
+            file_format : <FileFormat> The data-format of the files.
+
+            prefix : <string> Prefix of the file names. The files are named
+                     <prefix>-<recording>-<segment>-<date>_<time>.<extension>
+
+            rotate_interval : <float> When set, the recording continues in a new
+                              segment-file every 'rotate_interval' seconds.
+    """
+    def __init__(self, device, directory, file_format = FileFormat.poly5, prefix = 'recording', rotate_interval = None):
+        if file_format not in (FileFormat.poly5, FileFormat.xdf):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        self.device = device
+        self.directory = directory
+        self.file_format = file_format
+        self.prefix = prefix
+        self.rotate_interval = rotate_interval
+
+        self._q = queue.Queue(_QUEUE_SIZE)
+        self._lock = threading.RLock()
+        self._monitor_thread = None
+        self._file_writer = None
+        self._num_recordings = 0
+        self._files = []
+
+        self._start_time = None
+        self._num_blocks = 0
+        self._num_sample_sets = 0
+        self._num_lost_sample_sets = 0
+        self._num_gaps = 0
+        self._rate_time = None
+        self._rate_sample_sets = 0
+        self._sample_sets_per_second = 0.0
+
+    @property
+    def running(self):
+        """ 'bool' True when the measurement of the daemon is running."""
+        return self._monitor_thread is not None
+
+    @property
+    def recording(self):
+        """ 'bool' True when the sample-data is being recorded to file."""
+        return self._file_writer is not None
+
+    def start(self):
+        """ Starts the measurement. The sample-data is not recorded until
+            start_recording() is called.
+        """
+        with self._lock:
+            if self.running:
+                raise TMSiError(TMSiErrorCode.api_invalid_command)
+            sample_data_server.registerConsumer(self.device.id, self._q, 'acquisition-daemon')
+            self._monitor_thread = _MonitorThread(self)
+            self._monitor_thread.start()
+            self._start_time = time.time()
+            self._rate_time = time.perf_counter()
+            self.device.start_measurement()
+
+    def stop(self):
+        """ Stops the recording, when active, and the measurement."""
+        with self._lock:
+            if not self.running:
+                return
+            self.device.stop_measurement()
+            # The file-writer writes the sample-data which is still underway,
+            # when it is closed
+            self._monitor_thread.stop()
+            self._monitor_thread.join()
+            self._monitor_thread = None
+            sample_data_server.unregisterConsumer(self.device.id, self._q)
+            if self.recording:
+                self._close_file()
+
+    def start_recording(self):
+        """ Starts recording the sample-data to a new file.
+
+            Returns:
+                <string> The name of the file.
+        """
+        with self._lock:
+            if not self.running or self.recording:
+                raise TMSiError(TMSiErrorCode.api_invalid_command)
+            return self._open_file()
+
+    def stop_recording(self):
+        """ Stops recording the sample-data.
+
+            Returns:
+                <string> The name of the closed file.
+        """
+        with self._lock:
+            if not self.recording:
+                raise TMSiError(TMSiErrorCode.api_invalid_command)
+            return self._close_file()
+
+    def rotate(self):
+        """ Closes the current segment-file and continues the recording in a
+            new segment-file, without losing any sample-data.
+
+            Returns:
+                <string> The name of the new file.
+        """
+        with self._lock:
+            if not self.recording:
+                raise TMSiError(TMSiErrorCode.api_invalid_command)
+            self._file_writer.rotate()
+            return self._file_writer.filename
+
+    def change_config(self, config_file = None, base_sample_rate = None, reference_method = None):
+        """ Changes the configuration of the device.
+
+            The measurement is stopped while the configuration is changed. An
+            active recording continues in a new file, as the channel list and
+            sample rate may have changed.
+
+            Args:
+                config_file : <string> An xml-file with the configuration to load.
+
+                base_sample_rate : <int> The base sample rate, 4000 or 4096 Hz.
+
+                reference_method : <string> 'common' or 'average'.
+
+            Raises:
+                TMSiError(api_incorrect_argument) when the config-file does not
+                exist or a setting is invalid, before the measurement is stopped.
+        """
+        if (config_file is None) and (base_sample_rate is None) and (reference_method is None):
+            return
+        # Check the arguments first: the device only prints a message for an
+        # invalid sample rate or config-file and keeps its configuration
+        if (config_file is not None) and not (isinstance(config_file, str) and os.path.isfile(config_file)):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        if (base_sample_rate is not None) and ((type(base_sample_rate) is not int) or (base_sample_rate not in (4000, 4096))):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        if reference_method is not None:
+            if not isinstance(reference_method, str) or (reference_method not in ReferenceMethod.__members__):
+                raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+            reference_method = ReferenceMethod[reference_method]
+        with self._lock:
+            was_running = self.running
+            was_recording = self.recording
+            if was_running:
+                self.stop()
+            try:
+                if config_file is not None:
+                    self.device.load_config(config_file)
+                if (base_sample_rate is not None) or (reference_method is not None):
+                    self._apply_settings(base_sample_rate, reference_method)
+            finally:
+                if was_running:
+                    self.start()
+                    if was_recording:
+                        self.start_recording()
+
+    def _apply_settings(self, base_sample_rate, reference_method):
+        config = self.device.config
+        batch = getattr(config, 'batch', None)
+        if batch is None:
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+        with batch():
+            if base_sample_rate is not None:
+                config.base_sample_rate = base_sample_rate
+            if reference_method is not None:
+                config.reference_method = reference_method
+
+    def status(self):
+        """ Returns the state of the device, the measurement and the recording.
+
+            Returns:
+                <dict> with the 'device_state', 'running', 'recording', the
+                current 'file', its 'segment', the 'manifest' of the recording
+                and the closed 'files'.
+        """
+        with self._lock:
+            return {'device_state': self.device.status.state.name,
+                    'running': self.running,
+                    'recording': self.recording,
+                    'sample_rate': self.device.config.sample_rate,
+                    'num_channels': len(self.device.channels),
+                    'file': self._file_writer.filename if self.recording else None,
+                    'segment': len(self._file_writer.segments) if self.recording else None,
+                    'manifest': self._file_writer.manifest_filename if self.recording else None,
+                    'files': self._closed_files()}
+
+    def metrics(self):
+        """ Returns the throughput- and sample-loss-metrics.
+
+            Returns:
+                <dict> with the 'uptime', the number of received 'blocks' and
+                'sample_sets', the 'sample_sets_per_second' over the last second,
+                the sample-loss ('lost_sample_sets', 'gaps') and, when the
+                device tracks it, its detailed 'sample_loss'-statistics. When
+                the latency_monitor is enabled also its statistics.
+        """
+        metrics = {'uptime': (time.time() - self._start_time) if self._start_time else 0.0,
+                   'blocks': self._num_blocks,
+                   'sample_sets': self._num_sample_sets,
+                   'sample_sets_per_second': self._sample_sets_per_second,
+                   'lost_sample_sets': self._num_lost_sample_sets,
+                   'gaps': self._num_gaps,
+                   'queue_depth': self._q.qsize()}
+        sample_loss = getattr(self.device, 'sample_loss', None)
+        if sample_loss is not None:
+            metrics['sample_loss'] = sample_loss.get_statistics()
+        if latency_monitor.is_enabled():
+            metrics['latency'] = latency_monitor.get_statistics()
+        return metrics
+
+    def _open_file(self):
+        self._num_recordings += 1
+        extension = 'poly5' if (self.file_format == FileFormat.poly5) else 'xdf'
+        name = '{}-{:04d}.{}'.format(self.prefix, self._num_recordings, extension)
+        self._file_writer = FileWriter(self.file_format, os.path.join(self.directory, name),
+                                       segment_duration = self.rotate_interval, segmented = True)
+        self._file_writer.open(self.device)
+        return self._file_writer.filename
+
+    def _closed_files(self):
+        # The segment-files of the previous recordings and the closed
+        # segment-files of the current recording
+        if not self.recording:
+            return list(self._files)
+        return self._files + self._segment_files()[:-1]
+
+    def _segment_files(self):
+        # The paths of the segment-files of the current recording
+        directory = os.path.dirname(self._file_writer.manifest_filename)
+        return [os.path.join(directory, segment['filename']) for segment in self._file_writer.segments]
+
+    def _close_file(self):
+        filename = self._file_writer.filename
+        self._file_writer.close()
+        self._files += self._segment_files()
+        self._file_writer = None
+        return filename
+
+    def _count(self, sd):
+        # Called by the monitor-thread for every sample-data-block of the device
+        self._num_blocks += 1
+        self._num_sample_sets += sd.num_sample_sets
+        for _, num_lost in sd.gaps:
+            self._num_lost_sample_sets += num_lost
+            self._num_gaps += 1
+
+        now = time.perf_counter()
+        self._rate_sample_sets += sd.num_sample_sets
+        if (now - self._rate_time) >= 1.0:
+            self._sample_sets_per_second = self._rate_sample_sets / (now - self._rate_time)
+            self._rate_time = now
+            self._rate_sample_sets = 0
+
+
+class _MonitorThread(threading.Thread):
+    def __init__(self, daemon):
+        super(_MonitorThread, self).__init__(name = 'acquisition-daemon', daemon = True)
+        self._daemon = daemon
+        self._q = daemon._q
+        self.sampling = True
+
+    def run(self):
+        while self.sampling or not self._q.empty():
+            try:
+                sd = self._q.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            self._daemon._count(sd)
+
+    def stop(self):
+        self.sampling = False
+
+
+class ControlServer(ThreadingHTTPServer):
+    """ <ControlServer> serves the control-API of an <AcquisitionDaemon>.
+
+        Args:
+            daemon : <AcquisitionDaemon> The daemon to control.
+
+            host : <string> The address to listen on. By default the API is
+                   only reachable from the local machine.
+
+            port : <int> The port to listen on.
+    """
+    daemon_threads = True
+
+    def __init__(self, daemon, host = '127.0.0.1', port = _DEFAULT_PORT):
+        super(ControlServer, self).__init__((host, port), _ControlRequestHandler)
+        self.acquisition_daemon = daemon
+
+
+class _ControlRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        daemon = self.server.acquisition_daemon
+        if self.path == '/status':
+            self._respond(200, daemon.status())
+        elif self.path == '/metrics':
+            self._respond(200, daemon.metrics())
+        else:
+            self._respond(404, {'error': 'unknown path'})
+
+    def do_POST(self):
+        daemon = self.server.acquisition_daemon
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(body, dict):
+                raise ValueError
+        except ValueError:
+            self._respond(400, {'error': 'invalid json'})
+            return
+
+        # The fields of the configuration are strings, or an integer
+        for field, types in (('config_file', str), ('base_sample_rate', int), ('reference_method', str)):
+            value = body.get(field)
+            if (value is not None) and (type(value) is not types):
+                self._respond(400, {'error': 'invalid ' + field})
+                return
+
+        try:
+            if self.path == '/recording/start':
+                self._respond(200, {'file': daemon.start_recording()})
+            elif self.path == '/recording/stop':
+                self._respond(200, {'file': daemon.stop_recording()})
+            elif self.path == '/recording/rotate':
+                self._respond(200, {'file': daemon.rotate()})
+            elif self.path == '/config':
+                daemon.change_config(config_file = body.get('config_file'),
+                                     base_sample_rate = body.get('base_sample_rate'),
+                                     reference_method = body.get('reference_method'))
+                self._respond(200, daemon.status())
+            else:
+                self._respond(404, {'error': 'unknown path'})
+        except TMSiError as e:
+            self._respond(409, {'error': e.code.name})
+        except Exception as e:
+            # Every request gets a response, also on an unexpected error
+            self._respond(500, {'error': type(e).__name__})
+
+    def _respond(self, code, content):
+        data = json.dumps(content).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Keep the output of the daemon for the measurement itself
+        pass
+
+
+def _create_device(args):
+    if args.replay:
+        from .devices.replay.replay_device import ReplayDevice
+        device = ReplayDevice(args.replay, loop = True)
+    else:
+        from . import tmsi_device
+        device = tmsi_device.create(tmsi_device.DeviceType.saga,
+                                    DeviceInterfaceType[args.dr_interface],
+                                    DeviceInterfaceType[args.ds_interface])
+    device.open()
+    if args.config:
+        device.load_config(args.config)
+    return device
+
+
+def main(argv = None):
+    """ Entry point of the acquisition daemon. Runs until it receives SIGINT or
+        SIGTERM.
+    """
+    parser = argparse.ArgumentParser(description = 'Headless acquisition daemon with a local control-API.')
+    parser.add_argument('--dr-interface', default = 'docked', choices = ['docked', 'optical', 'wifi'])
+    parser.add_argument('--ds-interface', default = 'usb', choices = ['usb', 'network'])
+    parser.add_argument('--replay', help = 'replay a Poly5- or XDF-file instead of using a SAGA-system')
+    parser.add_argument('--config', help = 'xml-file with the device configuration to load at start-up')
+    parser.add_argument('--directory', default = '../measurements', help = 'directory of the recorded files')
+    parser.add_argument('--format', default = 'poly5', choices = ['poly5', 'xdf'])
+    parser.add_argument('--prefix', default = 'recording', help = 'prefix of the recorded file names')
+    parser.add_argument('--rotate', type = float, help = 'continue the recording in a new file every ROTATE seconds')
+    parser.add_argument('--record', action = 'store_true', help = 'start recording at start-up')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = _DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    settings._initialize()
+    device = _create_device(args)
+    daemon = AcquisitionDaemon(device, args.directory, FileFormat[args.format], args.prefix, args.rotate)
+    server = ControlServer(daemon, args.host, args.port)
+
+    stopped = threading.Event()
+    def _stop(signum, frame):
+        stopped.set()
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    server_thread = threading.Thread(target = server.serve_forever, name = 'control-server', daemon = True)
+    server_thread.start()
+    try:
+        daemon.start()
+        if args.record:
+            daemon.start_recording()
+        print('Acquisition daemon running, control-API on http://{}:{}'.format(args.host, args.port))
+        while not stopped.wait(1.0):
+            pass
+    finally:
+        server.shutdown()
+        daemon.stop()
+        device.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,9 @@ TMSiSDK: Main Device Interface
 '''
 
 from enum import Enum, unique
+import numpy as np
+
+from .error import TMSiError, TMSiErrorCode
 
 @unique
 class DeviceInterfaceType(Enum):
@@ -83,8 +86,10 @@ class DeviceChannel:
         enabled : 'bool' Indicates if a channel is enabled for measuring
 
         Note: The properties 'name' and 'enabled' can be modified. The other properties
-              are read-only.
+              are read-only. The channels of a 'ChannelTable', like 'Device.channels',
+              are completely read-only.
     """
+    __slots__ = ('__type', '__sample_rate', '__unit_name', '__name', '__enabled', '__sensor', '__frozen')
 
     def __init__(self, type, sample_rate, name, unit_name, enabled, sensor = None):
         self.__type = type
@@ -93,6 +98,12 @@ class DeviceChannel:
         self.__name = name
         self.__enabled = enabled
         self.__sensor = sensor
+        self.__frozen = False
+
+    def _freeze(self):
+        # Makes the channel read-only, used for the channels of a ChannelTable
+        self.__frozen = True
+        return self
 
     @property
     def type(self):
@@ -112,6 +123,8 @@ class DeviceChannel:
     @name.setter
     def name(self, var):
         """'string' Sets the name of the channel."""
+        if self.__frozen:
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
         self.__name = var
 
     @property
@@ -127,6 +140,8 @@ class DeviceChannel:
     @enabled.setter
     def enabled(self, var):
         """'bool' Enables (True) or disables (False) a channel for measurement"""
+        if self.__frozen:
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
         self.__enabled = var
 
     @property
@@ -134,6 +149,36 @@ class DeviceChannel:
         """'DeviceSensor' contains an object if a sensor is attached to the channel."""
         return(self.__sensor)
 
+class ChannelTable:
+    """ 'ChannelTable' is a read-only snapshot of a channel list. Devices keep it
+        cached and only rebuild it when their configuration changes. It has the
+        next properties:
+
+        channels : 'tuple of DeviceChannel' The read-only channels.
+
+        indices : 'dict' Per 'ChannelType' a read-only NumPy-array with the
+                  positions of the channels of that type within 'channels'.
+                  'ChannelType.all_types' holds the positions of all channels.
+
+        version : 'int' The version of the device-configuration the table was
+                  built from.
+    """
+    __slots__ = ('channels', 'indices', 'version')
+
+    def __init__(self, channels, version = 0):
+        self.channels = tuple(ch._freeze() for ch in channels)
+        self.version = version
+
+        types = np.array([ch.type.value for ch in self.channels], dtype=int)
+        self.indices = {}
+        for chan_type in ChannelType:
+            if (chan_type == ChannelType.all_types):
+                idx = np.arange(len(self.channels))
+            else:
+                idx = np.flatnonzero(types == chan_type.value)
+            idx.flags.writeable = False
+            self.indices[chan_type] = idx
+
 class DeviceInfo:
     """ 'DeviceInfo' holds the static device information. It has the next properties:
 
@@ -227,6 +272,8 @@ class DeviceSensor:
 
     """
 
+    __slots__ = ('__channel_list_idx', '__id', '__serial_nr', '__name', '__unit_name', '__product_id', '__exp')
+
     def __init__(self, channel_list_idx, id, serial_nr, product_id, name, unit_name, exp):
         self.__channel_list_idx = channel_list_idx
         self.__id = id
@@ -445,6 +492,13 @@ class Device:
         """
         pass
 
+    @property
+    def channel_indices(self):
+        """ 'dict' : Per 'ChannelType' a NumPy-array with the positions of the
+            channels of that type within 'Device.channels'.
+        """
+        return ChannelTable(self.channels).indices
+
     @property
     def imp_channels(self):
         """ 'list of class DeviceChannel' : The list of impedance channels.
@@ -0,0 +1,468 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+TMSiSDK: Multi-Device Interface
+
+'''
+
+import threading
+import time
+import queue
+import numpy as np
+
+from ...error import TMSiError, TMSiErrorCode
+from ...device import Device, ChannelType, MeasurementType, DeviceInfo, DeviceState, DeviceStatus
+from ..replay.replay_device import ReplayConfig, ReplayChannel
+
+from ... import sample_data, sample_data_server
+
+_QUEUE_SIZE = 1000
+
+class MultiDevice(Device):
+    """ 'MultiDevice' combines the measurements of multiple devices, e.g. two 
+        SAGA-systems for a 128+ channel setup, into one time-aligned measurement.
+
+        The devices are started together. Their sample-data is aligned on the
+        COUNTER-channels and forwarded to the 'sample_data_server' as one stream
+        of sample-sets, which holds the channels of all devices. File-writers,
+        filters and plotters can be used on the 'MultiDevice' as on one device.
+        The channel names are prefixed with the device number ('D1-', 'D2-', ...).
+
+        Without a sync-channel, sample-sets with the same COUNTER-value are
+        aligned: the accuracy is limited by the difference in start-up time of
+        the devices. With a sync-channel, a common trigger fed to the sync-inputs
+        of all devices is used: the first change of the sync-channel marks the
+        same moment on all devices. Sample-data received before the trigger
+        is not forwarded.
+
+        Sample-sets lost by a device are filled with NaN-values, to keep the
+        devices aligned, and reported in the 'gaps' of the <SampleData>.
+
+        Args:
+            devices : 'list of class Device' The devices to combine. All devices
+                      must have the same sample-rate.
+
+            sync_channel : 'string' Name of the channel, present on all devices,
+                           which records the common sync-trigger. 'None' aligns
+                           on the COUNTER-channels only.
+
+            max_sync_wait : 'float' The number of seconds of sample-data that is
+                            buffered while waiting for the sync-trigger.
+    """
+
+    def __init__(self, devices, sync_channel = None, max_sync_wait = 10.0):
+        if (len(devices) < 2):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        self._devices = list(devices)
+        self._sync_channel = sync_channel
+        self._max_sync_wait = max_sync_wait
+        self._id = sample_data_server.createProducerId()
+        self._config = None
+        self._queues = []
+        self._alignment_thread = None
+        self._state = DeviceState.disconnected
+
+    @property
+    def id(self):
+        """ 'int' : Unique id within all available devices. The id can be used to
+            register as a client at the 'sample_data_server' for retrieval of
+            the aligned sample-data of all devices
+        """
+        return self._id
+
+    @property
+    def devices(self):
+        """ 'list of class Device' : The combined devices."""
+        return list(self._devices)
+
+    @property
+    def info(self):
+        """ 'class DeviceInfo' : The combined devices have no interfaces of their
+            own. Use the 'info' of the individual devices.
+        """
+        return DeviceInfo()
+
+    @property
+    def status(self):
+        """ 'class DeviceStatus' : Runtime information like the device state
+        """
+        return DeviceStatus(self._state, 0)
+
+    @property
+    def config(self):
+        """ 'class DeviceConfig' : The read-only configuration of the combined
+            channel list. Use the 'config' of the individual devices to change
+            their configuration.
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        self._config._parent = self
+        return self._config
+
+    @property
+    def channels(self):
+        """ 'list of class DeviceChannel' : The enabled channels of all devices,
+            in the order of the devices.
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        return self._config.channels
+
+    @property
+    def channel_indices(self):
+        """ 'dict' : Per 'ChannelType' a NumPy-array with the positions of the
+            channels of that type within 'Device.channels'.
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        return self._config._get_channel_table().indices
+
+    @property
+    def imp_channels(self):
+        """ 'list of class DeviceChannel' : Impedance measurements are done per device.
+        """
+        return []
+
+    @property
+    def sensors(self):
+        """ 'list of class DeviceSensor' : Sensor-information is available per device.
+        """
+        return []
+
+    @property
+    def datetime(self):
+        """ 'datetime' Current date and time of the first device
+        """
+        return self._devices[0].datetime
+
+    @datetime.setter
+    def datetime(self, dt):
+        """ Sets the date and time of all devices."""
+        for dev in self._devices:
+            dev.datetime = dt
+
+    @property
+    def _channels(self):
+        # Active channel list, the same as the total channel list
+        return self._config._channels
+
+    def open(self):
+        """ Opens the connection to all devices that are not connected yet and
+            combines their channel lists.
+        """
+        for dev in self._devices:
+            if (dev.status.state == DeviceState.disconnected):
+                dev.open()
+        self._update_channels()
+        self._state = DeviceState.connected
+
+    def close(self):
+        """ Closes the connection to all devices.
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        if (self._state == DeviceState.sampling):
+            self.stop_measurement()
+        for dev in self._devices:
+            if (dev.status.state != DeviceState.disconnected):
+                dev.close()
+        self._state = DeviceState.disconnected
+
+    def start_measurement(self, measurement_type = MeasurementType.normal):
+        """ Starts a measurement on all devices at the same time.
+            Clients, which want to receive the aligned sample-data, must be
+            registered at the 'sample data server' with the id of the
+            'MultiDevice' before the measurement is started.
+
+        Args:
+            measurement_type : Only MeasurementType.normal is supported.
+                               Impedance measurements are done per device.
+        """
+        if (self._state == DeviceState.sampling):
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+        if (self._state != DeviceState.connected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        if (measurement_type != MeasurementType.normal):
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+        # The channel lists might have changed since the devices were opened
+        self._update_channels()
+
+        self._queues = [queue.Queue(_QUEUE_SIZE) for dev in self._devices]
+        self._alignment_thread = _AlignmentThread(self, name='multi-device-' + str(self._id))
+        for dev, q in zip(self._devices, self._queues):
+            sample_data_server.registerConsumer(dev.id, q, 'multi-device')
+        self._alignment_thread.start()
+
+        # Start all devices from their own thread, released at the same moment
+        barrier = threading.Barrier(len(self._devices))
+        errors = [None] * len(self._devices)
+
+        def start(idx, dev):
+            barrier.wait()
+            try:
+                dev.start_measurement(MeasurementType.normal)
+            except Exception as e:
+                # Any error, not only a TMSiError, means the device did not
+                # start: it must not be treated as started
+                errors[idx] = e
+
+        start_threads = [threading.Thread(target=start, args=(idx, dev)) for idx, dev in enumerate(self._devices)]
+        for t in start_threads:
+            t.start()
+        for t in start_threads:
+            t.join()
+
+        if any(errors):
+            # Not all devices could be started: stop the started ones and report error
+            for dev, error in zip(self._devices, errors):
+                if error is None:
+                    dev.stop_measurement()
+            self._stop_alignment()
+            raise TMSiError(TMSiErrorCode.device_error)
+
+        self._state = DeviceState.sampling
+
+    def stop_measurement(self):
+        """ Stops the ongoing measurement on all devices."""
+        if (self._state != DeviceState.sampling):
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+        for dev in self._devices:
+            dev.stop_measurement()
+        self._stop_alignment()
+
+        self._state = DeviceState.connected
+
+    def set_factory_defaults(self):
+        """ Not supported, the configuration is done per device."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    def load_config(self, filename):
+        """ Not supported, the configuration is done per device."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    def save_config(self, filename):
+        """ Not supported, the configuration is done per device."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    def update_sensors(self):
+        """ Updates the sensor-information of all devices."""
+        for dev in self._devices:
+            dev.update_sensors()
+        self._update_channels()
+
+    def _update_channels(self):
+        # Combine the enabled channels of all devices into one channel list
+        sample_rate = self._devices[0].config.sample_rate
+        channels = []
+        for idx, dev in enumerate(self._devices):
+            if (dev.config.sample_rate != sample_rate):
+                raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+            prefix = 'D' + str(idx + 1) + '-'
+            for ch in dev.channels:
+                channels.append(ReplayChannel(ch.type, sample_rate, prefix + ch.name, ch.unit_name))
+        self._config = ReplayConfig(sample_rate, channels)
+
+    def _stop_alignment(self):
+        self._alignment_thread.stop()
+        self._alignment_thread.join()
+        for dev, q in zip(self._devices, self._queues):
+            sample_data_server.unregisterConsumer(dev.id, q)
+        self._queues = []
+
+class _StreamBuffer:
+    """ Buffers the sample-data of one device, indexed on its COUNTER-values.
+        Lost sample-sets are filled with NaN-values, so the buffer always holds
+        consecutive COUNTER-values: from 'first' up to 'next'.
+    """
+    def __init__(self, num_channels, idx_counter, idx_sync):
+        self.num_channels = num_channels
+        self.idx_counter = idx_counter
+        self.idx_sync = idx_sync
+        self.blocks = []
+        self.first = None
+        self.next = None
+        self.offset = 0
+        self.sync_counter = None
+        self.gaps = []
+        self._sync_baseline = None
+
+    @property
+    def start(self):
+        # Aligned position of the first buffered sample-set
+        return self.first - self.offset
+
+    @property
+    def end(self):
+        # Aligned position following the last buffered sample-set
+        return self.next - self.offset
+
+    def append(self, block):
+        counter = block[self.idx_counter].astype(np.int64)
+        if self.next is None:
+            self.first = self.next = int(counter[0])
+
+        # Drop repeated and backwards COUNTER-values
+        previous = np.maximum.accumulate(np.concatenate(([self.next - 1], counter)))[:-1]
+        keep = counter > previous
+        if not np.all(keep):
+            block = block[:, keep]
+            counter = counter[keep]
+        if counter.size == 0:
+            return
+
+        # Fill lost sample-sets with NaN-values
+        steps = np.diff(counter, prepend=self.next - 1)
+        if np.any(steps != 1):
+            for i in np.flatnonzero(steps != 1):
+                self.gaps.append((int(counter[i]), int(steps[i] - 1)))
+            filled = np.full((self.num_channels, int(counter[-1]) - self.next + 1), np.nan)
+            filled[:, counter - self.next] = block
+            filled[self.idx_counter] = np.arange(self.next, counter[-1] + 1)
+            block = filled
+
+        # The first change of the sync-channel marks the sync-trigger
+        if (self.idx_sync != -1) and (self.sync_counter is None):
+            values = block[self.idx_sync]
+            valid = ~np.isnan(values)
+            if (self._sync_baseline is None) and np.any(valid):
+                self._sync_baseline = values[np.argmax(valid)]
+            edges = np.flatnonzero(valid & (values != self._sync_baseline))
+            if edges.size:
+                self.sync_counter = self.next + int(edges[0])
+
+        self.blocks.append(block)
+        self.next = int(counter[-1]) + 1
+
+    def take(self, num_sets):
+        """ Removes the first 'num_sets' sample-sets from the buffer and returns them."""
+        parts = []
+        remaining = min(num_sets, self.next - self.first)
+        while remaining > 0:
+            block = self.blocks[0]
+            if block.shape[1] <= remaining:
+                parts.append(self.blocks.pop(0))
+                remaining -= block.shape[1]
+            else:
+                parts.append(block[:, :remaining])
+                self.blocks[0] = block[:, remaining:]
+                remaining = 0
+        if parts:
+            self.first += sum(part.shape[1] for part in parts)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts, axis=1) if parts else np.empty((self.num_channels, 0))
+
+class _AlignmentThread(threading.Thread):
+    def __init__(self, multi_device, name):
+        super(_AlignmentThread, self).__init__()
+        self.name = name
+        self._id = multi_device.id
+        self._queues = multi_device._queues
+        self._num_channels = len(multi_device._config._channels)
+        self._max_unsynced_sets = int(multi_device._max_sync_wait * multi_device._config.sample_rate)
+        self.sampling = True
+
+        self._buffers = []
+        for dev in multi_device._devices:
+            channels = dev.channels
+            idx_counter = -1
+            idx_sync = -1
+            for idx, ch in enumerate(channels):
+                if (ch.type == ChannelType.counter):
+                    idx_counter = idx
+                if (multi_device._sync_channel is not None) and (ch.name == multi_device._sync_channel):
+                    idx_sync = idx
+            if (idx_counter == -1) or ((multi_device._sync_channel is not None) and (idx_sync == -1)):
+                raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+            self._buffers.append(_StreamBuffer(len(channels), idx_counter, idx_sync))
+        self._synced = multi_device._sync_channel is None
+
+    def run(self):
+        print(self.name, " started")
+
+        while (self.sampling) or any(not q.empty() for q in self._queues):
+            for buffer, q in zip(self._buffers, self._queues):
+                while not q.empty():
+                    sd = q.get()
+                    q.task_done()
+                    if sd.num_sample_sets > 0:
+                        buffer.append(np.reshape(sd.samples, (sd.num_samples_per_sample_set, sd.num_sample_sets), order='F'))
+
+            if not self._synced:
+                self._sync()
+            if self._synced:
+                self._merge()
+
+            time.sleep(0.010)
+
+        print(self.name, " ready")
+
+    def _sync(self):
+        # Wait until the sync-trigger is seen by all devices: the COUNTER-offsets
+        # between the devices follow from the COUNTER-values at the trigger
+        if any(buffer.sync_counter is None for buffer in self._buffers):
+            for buffer in self._buffers:
+                if (buffer.next is not None) and (buffer.next - buffer.first > self._max_unsynced_sets):
+                    buffer.take(buffer.next - buffer.first - self._max_unsynced_sets)
+            return
+
+        for buffer in self._buffers:
+            buffer.offset = buffer.sync_counter - self._buffers[0].sync_counter
+            buffer.take(buffer.sync_counter - buffer.first)
+        self._synced = True
+
+    def _merge(self):
+        # Forward the sample-sets that are available from all devices
+        if any(buffer.next is None for buffer in self._buffers):
+            return
+        start = max(buffer.start for buffer in self._buffers)
+        for buffer in self._buffers:
+            buffer.take(start - buffer.start)
+        num_sets = min(buffer.end for buffer in self._buffers) - start
+        if num_sets <= 0:
+            return
+
+        gaps = []
+        blocks = []
+        for buffer in self._buffers:
+            blocks.append(buffer.take(num_sets))
+            remaining_gaps = []
+            for counter, num_lost in buffer.gaps:
+                pos = counter - buffer.offset - start
+                if pos >= num_sets:
+                    remaining_gaps.append((counter, num_lost))
+                elif pos >= 0:
+                    gaps.append((pos, num_lost))
+            buffer.gaps = remaining_gaps
+
+        samples = np.concatenate(blocks, axis=0)
+        sd = sample_data.SampleData(num_sets, self._num_channels, samples.flatten('F').tolist())
+        sd.gaps = sorted(gaps)
+        sample_data_server.putSampleData(self._id, sd, 'published-multi-device')
+
+    def stop(self):
+        print(self.name, " stop sampling")
+        self.sampling = False
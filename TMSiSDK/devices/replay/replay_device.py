@@ -0,0 +1,484 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+TMSiSDK: Replay Device Interface
+
+'''
+
+import datetime
+import threading
+import time
+import numpy as np
+
+from ...error import TMSiError, TMSiErrorCode
+from ...device import Device, DeviceChannel, DeviceConfig, ChannelTable, ChannelType, MeasurementType, \
+                      DeviceInfo, DeviceState, DeviceStatus, ReferenceMethod, ReferenceSwitch
+
+from ... import sample_data, sample_data_server, latency_monitor
+
+# Channel-types as written by the XdfWriter into the <type>-element of a channel
+_XDF_CHANNEL_TYPES = {'EEG': ChannelType.UNI,
+                      'CREF': ChannelType.UNI,
+                      'BIP': ChannelType.BIP,
+                      'AUX': ChannelType.AUX,
+                      'sensor': ChannelType.sensor,
+                      'status': ChannelType.status,
+                      'counter': ChannelType.counter}
+
+class ReplayDevice(Device):
+    """ 'ReplayDevice' replays a recorded measurement (Poly5 or XDF) as if it
+        were a measurement of an attached system.
+
+        The sample-data of the recording is forwarded to the 'sample_data_server'
+        in blocks of sample-sets, in the same format as a 'SagaDevice' does.
+        This way file-writers, filters and plotters can be used unchanged on
+        recorded data, e.g. for offline batch processing or benchmarking.
+
+        Args:
+            filename : 'string' The path and name of the Poly5- or XDF-file to replay.
+
+            speed : 'float' The replay speed relative to real-time, e.g. 1.0 for
+                    real-time or 10.0 for 10 times faster. When 'None' or 0
+                    the sample-data is replayed as fast as the consumers can
+                    handle it.
+
+            loop : 'bool' Restart the replay at the start of the recording when
+                   the end of the recording is reached. The COUNTER-channel
+                   continues counting over the restarts.
+
+            block_duration : 'float' The duration in seconds of the recording
+                             that is forwarded per block of sample-sets.
+    """
+
+    def __init__(self, filename, speed = 1.0, loop = False, block_duration = 0.1):
+        self._filename = filename
+        self._speed = speed
+        self._loop = loop
+        self._block_duration = block_duration
+        self._config = None
+        self._samples = None
+        self._start_time = None
+        self._id = sample_data_server.createProducerId()
+        self._state = DeviceState.disconnected
+        self._replay_thread = None
+
+    @classmethod
+    def from_samples(cls, samples, sample_rate, channels, speed = None, loop = False, block_duration = 0.1):
+        """ Creates a 'ReplayDevice' that replays sample-data which is already
+            available in memory, e.g. synthetic data for benchmarks.
+
+            Args:
+                samples : 'ndarray' Sample-data with shape (num_channels, num_sample_sets)
+
+                sample_rate : 'int' The sample-rate of the sample-data.
+
+                channels : 'list of class DeviceChannel' Description of the
+                           channels, in the same order as the rows of 'samples'.
+
+            Returns:
+                'ReplayDevice' The device in 'connected' state.
+        """
+        dev = cls(None, speed, loop, block_duration)
+        dev._samples = np.asarray(samples)
+        dev._config = ReplayConfig(sample_rate, [ReplayChannel(ch.type, sample_rate, ch.name, ch.unit_name) for ch in channels])
+        dev._start_time = datetime.datetime.now()
+        dev._state = DeviceState.connected
+        return dev
+
+    @property
+    def id(self):
+        """ 'int' : Unique id within all available devices. The id can be used to
+            register as a client at the 'sample_data_server' for retrieval of
+            sample-data of a specific device
+        """
+        return self._id
+
+    @property
+    def info(self):
+        """ 'class DeviceInfo' : Static information of a device. A replayed
+            recording has no interfaces.
+        """
+        return DeviceInfo()
+
+    @property
+    def status(self):
+        """ 'class DeviceStatus' : Runtime information of a device like device state
+        """
+        return DeviceStatus(self._state, 0)
+
+    @property
+    def config(self):
+        """ 'class DeviceConfig' : The configuration of the recording. The
+            configuration is read-only.
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        self._config._parent = self
+        return self._config
+
+    @property
+    def channels(self):
+        """ 'list of class DeviceChannel' : The list of channels of the recording.
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        return self._config.channels
+
+    @property
+    def channel_indices(self):
+        """ 'dict' : Per 'ChannelType' a NumPy-array with the positions of the
+            channels of that type within 'Device.channels'.
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        return self._config._get_channel_table().indices
+
+    @property
+    def imp_channels(self):
+        """ 'list of class DeviceChannel' : A recording has no impedance channels.
+        """
+        return []
+
+    @property
+    def sensors(self):
+        """ 'list of class DeviceSensor' : A recording has no sensor-information.
+        """
+        return []
+
+    @property
+    def datetime(self):
+        """ 'datetime' Start date and time of the recording
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        return self._start_time
+
+    @datetime.setter
+    def datetime(self, dt):
+        """ The date and time of a recording can not be changed."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    @property
+    def _channels(self):
+        # Active channel list, the same as the total channel list of the recording
+        return self._config._channels
+
+    def open(self):
+        """ Opens the recording: the channel list, sample rate and sample-data
+            are read from file.
+        """
+        if (self._state != DeviceState.disconnected):
+            return
+
+        if (self._samples is None):
+            if self._filename.lower().endswith('.xdf'):
+                self._read_xdf(self._filename)
+            elif self._filename.lower().endswith('.poly5'):
+                self._read_poly5(self._filename)
+            else:
+                raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+
+        self._state = DeviceState.connected
+
+    def close(self):
+        """ Closes the recording.
+        """
+        if (self._state == DeviceState.disconnected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        if (self._state == DeviceState.sampling):
+            self.stop_measurement()
+        self._state = DeviceState.disconnected
+
+    def start_measurement(self, measurement_type = MeasurementType.normal):
+        """ Starts replaying the recording.
+            Clients, which want to receive the sample-data of a measurement,
+            must be registered at the 'sample data server' before the measurement is started.
+
+        Args:
+            measurement_type : Only MeasurementType.normal is supported.
+        """
+        if (self._state == DeviceState.sampling):
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+        if (self._state != DeviceState.connected):
+            raise TMSiError(TMSiErrorCode.device_not_connected)
+        if (measurement_type != MeasurementType.normal):
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+        self._replay_thread = _ReplayThread(self, name='replay-' + str(self._id))
+        self._replay_thread.start()
+        self._state = DeviceState.sampling
+
+    def stop_measurement(self):
+        """ Stops replaying the recording."""
+        if (self._state != DeviceState.sampling):
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+        self._replay_thread.stop()
+        self._replay_thread.join()
+
+        self._state = DeviceState.connected
+
+    def wait(self, timeout = None):
+        """ Waits until the complete recording has been replayed.
+
+            Args:
+                timeout : 'float' Maximum time in seconds to wait, or 'None' to
+                          wait until the replay is ready.
+
+            Returns:
+                'bool' True when the replay is ready, False when the timeout expired.
+        """
+        if (self._replay_thread is None):
+            return True
+        self._replay_thread.join(timeout)
+        return not self._replay_thread.is_alive()
+
+    def set_factory_defaults(self):
+        """ Not supported for a recording."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    def load_config(self, filename):
+        """ Not supported for a recording."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    def save_config(self, filename):
+        """ Not supported for a recording."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    def update_sensors(self):
+        """ A recording has no sensors that can be attached or detached."""
+        pass
+
+    def _read_poly5(self, filename):
+        # The Poly5-file holds no channel-types: these are derived from the
+        # channel names and the position of the STATUS- and COUNTER-channel,
+        # which are always the last 2 channels of a SAGA-measurement.
+        from ...file_readers.poly5reader import Poly5Reader
+
+        reader = Poly5Reader(filename)
+        num_channels = len(reader.channels)
+        channels = []
+        for idx, ch in enumerate(reader.channels):
+            if (idx == num_channels - 1) or (ch.name == 'COUNTER'):
+                ch_type = ChannelType.counter
+            elif (idx == num_channels - 2) or (ch.name == 'STATUS'):
+                ch_type = ChannelType.status
+            elif ch.name.startswith('BIP'):
+                ch_type = ChannelType.BIP
+            elif ch.name.startswith('AUX'):
+                ch_type = ChannelType.AUX
+            else:
+                ch_type = ChannelType.UNI
+            channels.append(ReplayChannel(ch_type, reader.sample_rate, ch.name, ch.unit_name))
+
+        self._config = ReplayConfig(reader.sample_rate, channels)
+        self._samples = reader.samples
+        self._start_time = reader.start_time
+
+    def _read_xdf(self, filename):
+        # Replay the first stream with a regular sample rate and numeric samples
+        from pyxdf import load_xdf
+
+        streams, header = load_xdf(filename)
+        for stream in streams:
+            info = stream['info']
+            sample_rate = float(info['nominal_srate'][0])
+            if (sample_rate > 0) and (info['channel_format'][0] != 'string'):
+                break
+        else:
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+
+        if sample_rate == int(sample_rate):
+            sample_rate = int(sample_rate)
+
+        num_channels = int(info['channel_count'][0])
+        try:
+            xdf_channels = info['desc'][0]['channels'][0]['channel']
+        except (KeyError, IndexError, TypeError):
+            xdf_channels = []
+
+        channels = []
+        for idx in range(num_channels):
+            if idx < len(xdf_channels):
+                ch = xdf_channels[idx]
+                name = ch['label'][0]
+                ch_type = _XDF_CHANNEL_TYPES.get(ch['type'][0], ChannelType.unknown)
+                unit_name = ch['unit'][0]
+            else:
+                name = 'Ch' + str(idx + 1)
+                ch_type = ChannelType.unknown
+                unit_name = '-'
+            channels.append(ReplayChannel(ch_type, sample_rate, name, unit_name))
+
+        self._config = ReplayConfig(sample_rate, channels)
+        try:
+            if info['desc'][0]['reference'][0]['label'][0] == 'average':
+                self._config._reference_method = ReferenceMethod.average.value
+        except (KeyError, IndexError, TypeError):
+            pass
+
+        self._samples = np.transpose(stream['time_series'])
+        self._start_time = datetime.datetime.now()
+
+class ReplayConfig(DeviceConfig):
+    """'DeviceConfig' holds the configuration of a replayed recording"""
+    def __init__(self, sample_rate, channels):
+        self._parent = None
+        self._sample_rate = sample_rate
+        self._base_sample_rate = sample_rate
+        self._channels = channels
+        self._num_channels = len(channels)
+        self._reference_method = ReferenceMethod.common.value
+        self._auto_reference_method = ReferenceSwitch.fixed.value
+        self._channel_table = None
+
+    def _get_channel_table(self):
+        # The channel list of a recording never changes: build the table once
+        if (self._channel_table is None):
+            self._channel_table = ChannelTable([DeviceChannel(ch.type, ch.sample_rate, ch.alt_name, ch.unit_name, True) for ch in self._channels])
+        return self._channel_table
+
+    @property
+    def num_channels(self):
+        """'int' The total number of channels"""
+        return self._num_channels
+
+    @property
+    def channels(self):
+        """'tuple DeviceChannel' The read-only list of channels"""
+        return self._get_channel_table().channels
+
+    @channels.setter
+    def channels(self, ch_list):
+        """The channel list of a recording can not be changed."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    @property
+    def base_sample_rate(self):
+        """'int' The sample-rate of the recording"""
+        return self._base_sample_rate
+
+    @base_sample_rate.setter
+    def base_sample_rate(self, sample_rate):
+        """The sample-rate of a recording can not be changed."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    @property
+    def sample_rate(self):
+        """'int' The rate with which sample-sets are replayed."""
+        return self._sample_rate
+
+    def get_sample_rate(self, channel_type):
+        """'int' the sample-rate of the specified channel-type-group. All
+            channels of a recording have the same sample-rate.
+
+        Args:
+            channel_type : 'ChannelType' The channel-type-group.
+        """
+        return self._sample_rate
+
+    def set_sample_rate(self, channel_type, base_sample_rate_divider):
+        """The sample-rate of a recording can not be changed."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    def set_interface_type(self, dr_interface_type):
+        """A recording has no interfaces."""
+        raise TMSiError(TMSiErrorCode.api_invalid_command)
+
+    @property
+    def reference_method(self):
+        """ 'ReferenceMethod' the reference method applied to the UNI channels,
+        'ReferenceSwitch' the switching of reference mode when common reference is disconnected"""
+        return ReferenceMethod(self._reference_method).name,  ReferenceSwitch(self._auto_reference_method).name
+
+class ReplayChannel():
+    """ <ReplayChannel> represents a channel of a replayed recording, with the
+        same properties as a <SagaChannel>. Every channel of a recording is enabled.
+    """
+    def __init__(self, type, sample_rate, name, unit_name):
+        self.type = type
+        self.sample_rate = sample_rate
+        self.chan_divider = 0
+        self.unit_name = unit_name
+        self.def_name = name
+        self.alt_name = name
+        self.sensor = None
+
+class _ReplayThread(threading.Thread):
+    def __init__(self, device, name):
+        super(_ReplayThread, self).__init__()
+        self.name = name
+        self._id = device.id
+        self._samples = device._samples
+        self._sample_rate = device._config.sample_rate
+        self._speed = device._speed
+        self._loop = device._loop
+        self._num_sets_per_block = max(1, int(round(self._sample_rate * device._block_duration)))
+        self.sampling = True
+
+        # The COUNTER-channel is increased over the restarts of a looped replay
+        self._idx_counter = -1
+        for idx, ch in enumerate(device._config._channels):
+            if (ch.type == ChannelType.counter):
+                self._idx_counter = idx
+
+    def run(self):
+        print(self.name, " started")
+
+        num_samples_per_set, num_sets = np.shape(self._samples)
+        pos = 0
+        counter_offset = 0
+        num_replayed_sets = 0
+        start_time = time.perf_counter()
+
+        while self.sampling:
+            if (pos >= num_sets):
+                if not self._loop:
+                    break
+                pos = 0
+                counter_offset += num_sets
+
+            num_block_sets = min(self._num_sets_per_block, num_sets - pos)
+            block = np.array(self._samples[:, pos:pos + num_block_sets])
+            if (counter_offset != 0) and (self._idx_counter != -1):
+                block[self._idx_counter] += counter_offset
+
+            sd = sample_data.SampleData(num_block_sets, num_samples_per_set, block.flatten('F').tolist())
+            latency_monitor.stamp(sd, 'acquired')
+            sample_data_server.putSampleData(self._id, sd, 'published-replay')
+
+            pos += num_block_sets
+            num_replayed_sets += num_block_sets
+
+            # Pace the replay: wait until the replayed sample-sets are 'due'
+            if self._speed:
+                delay = start_time + num_replayed_sets / (self._sample_rate * self._speed) - time.perf_counter()
+                if (delay > 0):
+                    time.sleep(delay)
+
+        print(self.name, " ready")
+
+    def stop(self):
+        print(self.name, " stop sampling")
+        self.sampling = False
@@ -28,30 +28,35 @@ import sys
 
 from .saga_types import *
 from ...error import TMSiError, TMSiErrorCode
-from ...device import Device, DeviceChannel, ChannelType, MeasurementType, \
+from ...device import Device, DeviceChannel, ChannelTable, ChannelType, MeasurementType, \
                       DeviceInfo, DeviceState, DeviceStatus, DeviceSensor
 from .TMSi_Device_API import *
 
 import array
+import json
+import os
 from copy import copy,deepcopy
 import datetime
-import struct
 import threading
 import time
 import queue
 import warnings
 import numpy as np
 
-import tkinter as tk
-from tkinter import messagebox
-
-from ... import sample_data, sample_data_server
+from ... import sample_data, sample_data_server, latency_monitor, settings
+from ...sample_loss_monitor import SampleLossMonitor
 
 from .xml_saga_config import *
 
 _tmsi_sdk = None
 _device_info_list = []
 _MAX_NUM_DEVICES = 2
+_discovery_lock = threading.RLock()   # guards the local device-list and discovery-cache
+_discovery_cache = None               # loaded from <settings._cache_dir> on first use
+_DISCOVERY_CACHE_FILE = 'saga_discovery.json'
+_refresh_threads = {}
+_sdk_lock = threading.RLock()         # serializes discoveries and opening of devices in the
+                                      # SagaSDK-library, which is not known to be re-entrant
 _MAX_NUM_BATTERIES = 2
 
 class SagaDevice(Device):
@@ -82,7 +87,15 @@ class SagaDevice(Device):
         self._idx_device_list_info = -1;
         self._last_error_code = TMSiDeviceRetVal.TMSI_OK
         self._sampling_thread = None
+        self._conversion_thread = None
         self._measurement_type = MeasurementType.normal
+        self._config_version = 0 # Incremented every time the configuration is downloaded from the device
+        self._channel_table = None # Cached ChannelTable of the enabled channels
+        self._imp_channel_table = None # Cached ChannelTable of the impedance channels
+        self._sensors = None # Cached (version, sensor-list)
+        self._calibration = SagaCalibrationTable([]) # Calibration of the enabled channels
+        self._device_settings = None # Device-wide settings as last downloaded from the device
+        self._device_channel_settings = [] # Channel settings as last downloaded from the device
 
     @property
     def id(self):
@@ -109,52 +122,77 @@ class SagaDevice(Device):
 
     @property
     def channels(self):
-        """ 'list of class DeviceChannel' : The list of enabled channels.
+        """ 'tuple of class DeviceChannel' : The read-only list of enabled channels.
             Enabled channels are active during an 'normal' measurement.
+            The list is cached and only rebuilt when the configuration changes.
+        """
+        if (self._channel_table is None) or (self._channel_table.version != self._config_version):
+            chan_list = []
+            for ch in self._config._channels:
+                if (ch.enabled == True):
+                    sensor = ch.sensor
+                    if (ch.sensor != None):
+                        sensor = DeviceSensor(ch.sensor.idx_total_channel_list,
+                                              ch.sensor.id,
+                                              ch.sensor.serial_nr,
+                                              ch.sensor.product_id,
+                                              ch.sensor.name,
+                                              ch.sensor.unit_name,
+                                              ch.sensor.exp)
+                    dev_ch = DeviceChannel(ch.type, ch.sample_rate, ch.alt_name, ch.unit_name, (ch.chan_divider != -1), sensor)
+                    chan_list.append(dev_ch)
+            self._channel_table = ChannelTable(chan_list, self._config_version)
+        return self._channel_table.channels
+
+    @property
+    def channel_indices(self):
+        """ 'dict' : Per 'ChannelType' a NumPy-array with the positions of the
+            channels of that type within 'Device.channels'.
         """
-        chan_list = []
-        for ch in self._config._channels:
-            if (ch.enabled == True):
-                sensor = ch.sensor
-                if (ch.sensor != None):
-                    sensor = DeviceSensor(ch.sensor.idx_total_channel_list,
-                                          ch.sensor.id,
-                                          ch.sensor.serial_nr,
-                                          ch.sensor.product_id,
-                                          ch.sensor.name,
-                                          ch.sensor.unit_name,
-                                          ch.sensor.exp)
-                dev_ch = DeviceChannel(ch.type, ch.sample_rate, ch.alt_name, ch.unit_name, (ch.chan_divider != -1), sensor)
-                chan_list.append(dev_ch)
-        return chan_list
+        self.channels # (re)builds the channel table when needed
+        return self._channel_table.indices
+
+    @property
+    def sample_loss(self):
+        """ 'class SampleLossMonitor' : Sample-loss statistics of the current or
+            last 'normal' measurement, based on the COUNTER-channel. None when
+            no such measurement has been started.
+        """
+        if self._conversion_thread is None:
+            return None
+        return self._conversion_thread.sample_loss
 
     @property
     def imp_channels(self):
-        """ 'list of class DeviceChannel' : The list of impedance channels.
+        """ 'tuple of class DeviceChannel' : The read-only list of impedance channels.
             Impedance channels are active during an 'impedance' measurement.
         """
-        imp_chan_list = []
-        for ch in self._imp_channels:
-            dev_ch = DeviceChannel(ch.type, 0, ch.alt_name, 'kOhm', True)
-            imp_chan_list.append(dev_ch)
-        return imp_chan_list
-    @property
+        if (self._imp_channel_table is None) or (self._imp_channel_table.version != self._config_version):
+            imp_chan_list = []
+            for ch in self._imp_channels:
+                dev_ch = DeviceChannel(ch.type, 0, ch.alt_name, 'kOhm', True)
+                imp_chan_list.append(dev_ch)
+            self._imp_channel_table = ChannelTable(imp_chan_list, self._config_version)
+        return self._imp_channel_table.channels
 
+    @property
     def sensors(self):
-        """ 'list of class DeviceSensor' : The complete list of sensor-information
+        """ 'tuple of class DeviceSensor' : The complete list of sensor-information
             for the  sensor-type channels : BIP and AUX
         """
-        sensor_list = []
-        for sensor in self._sensor_list:
-            dev_sensor = DeviceSensor(sensor.idx_total_channel_list,
-                                      sensor.id,
-                                      sensor.serial_nr,
-                                      sensor.product_id,
-                                      sensor.name,
-                                      sensor.unit_name,
-                                      sensor.exp)
-            sensor_list.append(dev_sensor)
-        return sensor_list
+        if (self._sensors is None) or (self._sensors[0] != self._config_version):
+            sensor_list = []
+            for sensor in self._sensor_list:
+                dev_sensor = DeviceSensor(sensor.idx_total_channel_list,
+                                          sensor.id,
+                                          sensor.serial_nr,
+                                          sensor.product_id,
+                                          sensor.name,
+                                          sensor.unit_name,
+                                          sensor.exp)
+                sensor_list.append(dev_sensor)
+            self._sensors = (self._config_version, tuple(sensor_list))
+        return self._sensors[1]
 
     @property
     def config(self):
@@ -218,32 +256,48 @@ class SagaDevice(Device):
             The functionailty a device offers will only be available when a connection
             to the system has been established.
         """
-        idx_device_list_info = -1
+        # No discovery runs while the device is opened and its configuration is read
+        with _sdk_lock:
+            from_cache = self._open()
+
+        if from_cache:
+            # Keep the discovery-cache up-to-date for a next session
+            _refresh_discovery_async(self.info.ds_interface, self.info.dr_interface)
+
+    def _open(self):
+        # Opens the connection and reads the configuration. Returns True when the
+        # device was found in the discovery-cache
+        from_cache = False
 
         # Check if the local device-list contains an available device for opening
-        for i in range (_MAX_NUM_DEVICES):
-            if (_device_info_list[i].ds_interface == self.info.ds_interface) and (_device_info_list[i].dr_interface == self.info.dr_interface):
-                if (_device_info_list[i].state != DeviceState.connected):
-                    idx_device_list_info = i
-                else:
-                    idx_device_list_info = _MAX_NUM_DEVICES
+        idx_device_list_info = _find_available_device(self.info.ds_interface, self.info.dr_interface)
+
+        # Use the devices found by an earlier discovery with the devices' given
+        # interfaces (DS/DR), before falling back to a discovery on the attached systems.
+        if (idx_device_list_info == -1) and _restore_cached_devices(self.info.ds_interface, self.info.dr_interface):
+            idx_device_list_info = _find_available_device(self.info.ds_interface, self.info.dr_interface)
+            from_cache = (idx_device_list_info != -1)
 
         # Execute a device-discovery if the local device-list does not contain any device
         # with the devices' given interfaces (DS/DR)
         if (idx_device_list_info == -1):
             _discover(self.info.ds_interface, self.info.dr_interface)
-            for i in range (_MAX_NUM_DEVICES):
-                if (_device_info_list[i].state != DeviceState.connected) and (_device_info_list[i].ds_interface == self.info.ds_interface) and (_device_info_list[i].dr_interface == self.info.dr_interface):
-                    idx_device_list_info = i
-                    break
+            idx_device_list_info = _find_available_device(self.info.ds_interface, self.info.dr_interface)
 
-        if (idx_device_list_info != -1) and ((idx_device_list_info != _MAX_NUM_DEVICES)):
+        if (idx_device_list_info != -1):
             # A device is found. Open the connection and adapt the information of the opened device
-            self._last_error_code = _tmsi_sdk.TMSiOpenDevice(pointer(self._device_handle), _device_info_list[idx_device_list_info].id, self.info.dr_interface.value)
-            if (self._last_error_code == TMSiDeviceRetVal.TMSI_DS_DEVICE_ALREADY_OPEN):
-                # The found device is available but in it's open-state: Close and re-open the connection
-                self._last_error_code = _tmsi_sdk.TMSiCloseDevice(self._device_handle)
-                self._last_error_code = _tmsi_sdk.TMSiOpenDevice(pointer(self._device_handle), _device_info_list[idx_device_list_info].id, self.info.dr_interface.value)
+            self._open_device(idx_device_list_info)
+
+            if (self._last_error_code != TMSiDeviceRetVal.TMSI_OK) and from_cache:
+                # The cached device-id is no longer valid (e.g. the system has been
+                # re-attached): Rediscover the devices and retry once
+                _forget_cached_devices(self.info.ds_interface, self.info.dr_interface)
+                _discover(self.info.ds_interface, self.info.dr_interface)
+                idx_device_list_info = _find_available_device(self.info.ds_interface, self.info.dr_interface)
+                if (idx_device_list_info == -1):
+                    raise TMSiError(TMSiErrorCode.no_devices_found)
+                self._open_device(idx_device_list_info)
+                from_cache = False
 
             if (self._last_error_code == TMSiDeviceRetVal.TMSI_OK):
                 # The device is opened succesfully. Update the device information.
@@ -260,12 +314,22 @@ class SagaDevice(Device):
 
                 # Read the device's configuration
                 self.__read_config_from_device()
+                return from_cache
 
             else:
                 raise TMSiError(TMSiErrorCode.device_error)
         else:
             raise TMSiError(TMSiErrorCode.no_devices_found)
 
+    def _open_device(self, idx_device_list_info):
+        # Opens the connection to the device at the given index of the local device-list
+        device_id = _device_info_list[idx_device_list_info].id
+        self._last_error_code = _tmsi_sdk.TMSiOpenDevice(pointer(self._device_handle), device_id, self.info.dr_interface.value)
+        if (self._last_error_code == TMSiDeviceRetVal.TMSI_DS_DEVICE_ALREADY_OPEN):
+            # The found device is available but in it's open-state: Close and re-open the connection
+            self._last_error_code = _tmsi_sdk.TMSiCloseDevice(self._device_handle)
+            self._last_error_code = _tmsi_sdk.TMSiOpenDevice(pointer(self._device_handle), device_id, self.info.dr_interface.value)
+
     def close(self):
         """ Closes the connection to the device.
         """
@@ -301,7 +365,7 @@ class SagaDevice(Device):
         # For a normal measurement sample_conversion must be applied
         self._sampling_thread = _SamplingThread(name='producer-' + str(self._device_handle.value))
         if (self._measurement_type == MeasurementType.normal):
-            self._sampling_thread.initialize(self._device_handle, self._channels, True)
+            self._sampling_thread.initialize(self._device_handle, self._channels, True, self._calibration)
         else:
             self._sampling_thread.initialize(self._device_handle, self._imp_channels, False)
             
@@ -399,9 +463,16 @@ class SagaDevice(Device):
             "6. Press the Power-button of the Data Recorder untill the LED-indicators start flashing.\n"\
             "7. The default settings are now activated."
             
-        root = tk.Tk()
-        root.withdraw()
-        messagebox.showwarning("Factory Reset", message)
+        # tkinter is only needed here; headless applications never load it
+        try:
+            import tkinter as tk
+            from tkinter import messagebox
+            root = tk.Tk()
+            root.withdraw()
+            messagebox.showwarning("Factory Reset", message)
+        except Exception:
+            # No tkinter or no display available (tkinter.TclError)
+            print("Factory Reset\n" + message)
 
 
     def save_config(self, filename):
@@ -438,13 +509,18 @@ class SagaDevice(Device):
         #  2. Write these settings to the Saga device
         #  3. Read back the device configuration from the Saga-device. This to be sure
         #     that the configuration of the Saga-device and the Python-interface are in sync.
+        # When the device already holds the configuration of the file, step 2 and 3
+        # are skipped.
         result, read_xml_config = xml_read_config(filename)
         if (result == True):
             # The configuration has been successfully read, Now merge these configuration settings
             # with the unmutable configuration settings of the device
             # Do not overwrite configured interface
-            read_xml_config._configured_interface=self._config._configured_interface
-            self._config = read_xml_config
+            if not self._config._merge(read_xml_config):
+                # The file does not match the channel list of the device: upload it as is
+                read_xml_config._configured_interface=self._config._configured_interface
+                self._config = read_xml_config
+                self._config._parent = self
             self._update_config()
 
     def update_sensors(self):
@@ -460,8 +536,18 @@ class SagaDevice(Device):
 
     def _update_config(self):
         # Upload the configuration to the device and always download it again
-        # to certify that sdk-configuration and device-configuration keep in sync
-        self.__write_config_to_device()
+        # to certify that sdk-configuration and device-configuration keep in sync.
+        # Only the channels that differ from the downloaded configuration are
+        # uploaded; when nothing differs the device is not accessed at all.
+        channel_settings = self._config._channel_settings()
+        if (len(channel_settings) != len(self._device_channel_settings)):
+            changed_channels = list(range(len(channel_settings)))
+        else:
+            changed_channels = [idx for idx, (new, old) in enumerate(zip(channel_settings, self._device_channel_settings)) if new != old]
+        if (not changed_channels) and (self._config._settings() == self._device_settings):
+            return
+
+        self.__write_config_to_device(changed_channels)
         self.__read_config_from_device()
 
     def __read_config_from_device(self):
@@ -522,6 +608,13 @@ class SagaDevice(Device):
                 # which is always the last channel in the active channel list
                 self._config._sample_rate = self._channels[len(self._channels) - 1].sample_rate
 
+                # Invalidate the cached channel tables
+                self._config_version += 1
+
+                # Keep the downloaded settings to determine what changes on a next upload
+                self._device_settings = self._config._settings()
+                self._device_channel_settings = self._config._channel_settings()
+
                 # Read the sensor data, parse the sensor-metadata and when appropriate
                 # attach a SagaSensor-object to the SagaChannel.
                 device_sensor_list = (TMSiDevGetSens * self._config._num_sensors)()
@@ -541,9 +634,10 @@ class SagaDevice(Device):
             # Failure TMSiGetDeviceStatus()
             raise TMSiError(TMSiErrorCode.device_error)
 
-    def __write_config_to_device(self):
+    def __write_config_to_device(self, channel_indices = None):
         # Upload the current sdk-configuration to the device, mark it also
-        # as the new default configuration
+        # as the new default configuration. Only the channels in 'channel_indices'
+        # are uploaded, by default all channels.
         dev_set_config = TMSiDevSetConfig()
 
         dev_set_config.DRSerialNumber = self._info.dr_serial_number
@@ -564,16 +658,23 @@ class SagaDevice(Device):
 
         dev_set_config.PerformFactoryReset = 0
 
-        dev_channel_list = (TMSiDevSetChCfg * self._config._num_channels)()
-        for idx, saga_channel in enumerate(self._config._channels):
+        if (channel_indices is None):
+            channel_indices = range(self._config._num_channels)
+        if (len(channel_indices) == 0):
+            # Only device-wide settings changed: the channel list holds at least one entry
+            channel_indices = [0]
 
-            dev_channel_list[idx].ChanNr = idx
-            dev_channel_list[idx].ChanDivider = saga_channel.chan_divider
+        dev_channel_list = (TMSiDevSetChCfg * len(channel_indices))()
+        for i, idx in enumerate(channel_indices):
+            saga_channel = self._config._channels[idx]
+
+            dev_channel_list[i].ChanNr = idx
+            dev_channel_list[i].ChanDivider = saga_channel.chan_divider
             max_len = len( saga_channel.alt_name)
             name = bytearray(saga_channel.alt_name, 'utf-8')
-            dev_channel_list[idx].AltChanName[:max_len] = name[:max_len]
+            dev_channel_list[i].AltChanName[:max_len] = name[:max_len]
 
-        self._last_error_code = _tmsi_sdk.TMSiSetDeviceConfig(self._device_handle, pointer(dev_set_config), pointer(dev_channel_list), self._config.num_channels);
+        self._last_error_code = _tmsi_sdk.TMSiSetDeviceConfig(self._device_handle, pointer(dev_set_config), pointer(dev_channel_list), len(channel_indices));
         if (self._last_error_code != TMSiDeviceRetVal.TMSI_OK):
             # Failure TMSiSetDeviceConfig()
             raise TMSiError(TMSiErrorCode.device_error)
@@ -584,59 +685,55 @@ class SagaDevice(Device):
         # Reset the current list
         self._sensor_list = []
         for i in range(sensor_list_len.value):
-            sensor = SagaSensor()
-
-            sensor.idx_total_channel_list = device_sensor_list[i].ChanNr
-            sensor.id = device_sensor_list[i].SensorID
-            sensor.IOMode = device_sensor_list[i].IOMode
+            idx_channel = device_sensor_list[i].ChanNr
 
             # 2. Parse the sensor metadata
-            idx = 0
-            manufacturer_id, serial_nr, product_id, channel_count, additional_structs = struct.unpack_from('<HIQBB', device_sensor_list[i].SensorMetaData, idx)
-            if (channel_count > 0):
-                if (self._config._channels[sensor.idx_total_channel_list].type == ChannelType.AUX):
-                    # It concerns an AUX-channel-group: AUX-1, AUX-2 or AUX-3
-                    sensor.manufacturer_id = manufacturer_id
-                    sensor.serial_nr = serial_nr
-                    sensor.product_id = product_id
-                    idx += 16
-                    for j in range(channel_count):
-                        struct_id = struct.unpack_from('<H', device_sensor_list[i].SensorMetaData, idx)
-                        # Parse the data if it concerns a 'SensorDefaultChannel'
-                        if (struct_id[0] == 0x0000):
-                            idx += 2
-                            chan_name, unit_name, exp, gain, offset = struct.unpack_from('<10s10shff', device_sensor_list[i].SensorMetaData, idx)
-
-                            sensor.name = chan_name
-                            sensor.unit_name = unit_name
-                            sensor.exp = exp
-                            sensor.gain = gain
-                            sensor.offset = offset
-
-                            # append sensor-into to the device-sensor-list and ...
-                            self._sensor_list.append(copy(sensor))
-                            # attach a copy of the sensor-object also to the specified channel
-                            self._config._channels[sensor.idx_total_channel_list].sensor = copy(sensor)
-                            # Overrule the channel's alt_name with the name of the sensor-channel
-                            self._config._channels[sensor.idx_total_channel_list].alt_name = sensor.name
-                            # Overrule the channel's unit_name with the uint name of the sensor-channel
-                            self._config._channels[sensor.idx_total_channel_list].unit_name = sensor.unit_name
-
-                            # Prepare for next sensor-channel
-                            sensor.idx_total_channel_list += 1
-                            idx += 30
-                        else:
-                            # ran into an 'empty struct', no more sensor info expected
-                            break
+            header, sensor_channels = parse_sensor_metadata(bytes(device_sensor_list[i].SensorMetaData))
+            if (header['channel_count'] > 0):
+                if (self._config._channels[idx_channel].type == ChannelType.AUX):
+                    # It concerns an AUX-channel-group: AUX-1, AUX-2 or AUX-3.
+                    # Every 'SensorDefaultChannel' describes the next channel of the group
+                    for j, sensor_channel in enumerate(sensor_channels):
+                        sensor = self._create_sensor(device_sensor_list[i], idx_channel + j)
+                        sensor.manufacturer_id = int(header['manufacturer_id'])
+                        sensor.serial_nr = int(header['serial_nr'])
+                        sensor.product_id = int(header['product_id'])
+                        sensor.name = bytes(sensor_channel['name'])
+                        sensor.unit_name = bytes(sensor_channel['unit_name'])
+                        sensor.exp = int(sensor_channel['exp'])
+                        sensor.gain = float(sensor_channel['gain'])
+                        sensor.offset = float(sensor_channel['offset'])
+
+                        # append sensor-into to the device-sensor-list and ...
+                        self._sensor_list.append(sensor)
+                        # attach a copy of the sensor-object also to the specified channel
+                        self._config._channels[idx_channel + j].sensor = copy(sensor)
+                        # Overrule the channel's alt_name with the name of the sensor-channel
+                        self._config._channels[idx_channel + j].alt_name = sensor.name
+                        # Overrule the channel's unit_name with the uint name of the sensor-channel
+                        self._config._channels[idx_channel + j].unit_name = sensor.unit_name
             else:
                 # Always add the sensor-data to the device-sensor-list
-                self._sensor_list.append(copy(sensor))
+                sensor = self._create_sensor(device_sensor_list[i], idx_channel)
+                self._sensor_list.append(sensor)
                 # Add sensor-object to both BIP-channels when a sensor is detected on a BIP-channel
-                if (self._config._channels[sensor.idx_total_channel_list].type == ChannelType.BIP) and (sensor.id != -1):
-                    self._config._channels[sensor.idx_total_channel_list].sensor = copy(sensor)
-                    sensor.idx_total_channel_list += 1
-                    self._sensor_list.append(copy(sensor))
-                    self._config._channels[sensor.idx_total_channel_list+1].sensor = copy(sensor)
+                if (self._config._channels[idx_channel].type == ChannelType.BIP) and (sensor.id != -1):
+                    self._config._channels[idx_channel].sensor = copy(sensor)
+                    second_sensor = self._create_sensor(device_sensor_list[i], idx_channel + 1)
+                    self._sensor_list.append(second_sensor)
+                    self._config._channels[idx_channel + 2].sensor = copy(second_sensor)
+
+        # 3. Update the calibration of the enabled channels, only the channels
+        #    with changed sensors are recalculated
+        self._calibration = self._calibration.updated(self._channels)
+
+    @staticmethod
+    def _create_sensor(device_sensor, idx_total_channel_list):
+        sensor = SagaSensor()
+        sensor.idx_total_channel_list = idx_total_channel_list
+        sensor.id = device_sensor.SensorID
+        sensor.IOMode = device_sensor.IOMode
+        return sensor
 
 def initialize():
     """Initialize the interface-environment."""
@@ -654,43 +751,191 @@ def initialize():
         _tmsi_sdk = None
         raise TMSiError(TMSiErrorCode.api_no_driver)
 
-def _discover(ds_interface, dr_interface):
-        # 1. Executes a discovery on devices based on the given interfaces for DS and DR
-        # 2. Updates the local device-list with the result
-        device_list = (TMSiDevList * _MAX_NUM_DEVICES)()
-        
-        if dr_interface == DeviceInterfaceType.wifi:
-            _num_retries = 10
-        else:
-            _num_retries = 5
-        for i in range (_MAX_NUM_DEVICES):
-            device_list[i].TMSiDeviceID = SagaConst.TMSI_DEVICE_ID_NONE
-        
-        while _num_retries > 0:
+def discover(ds_interfaces = (DeviceInterfaceType.usb, DeviceInterfaceType.network),
+             dr_interfaces = (DeviceInterfaceType.docked, DeviceInterfaceType.optical, DeviceInterfaceType.wifi),
+             use_cache = True):
+    """ Discovers the attached systems on all combinations of the given DS- and
+        DR-interfaces.
+
+        The interface-combinations are probed on concurrent threads. The calls
+        into the SagaSDK-library are serialized, but the retries and their
+        waiting time of interfaces without a system (typically wifi) overlap
+        with the probing of the other interfaces.
+
+        When use_cache is True and an earlier discovery (possibly of a previous
+        session) found devices on the given interface-combinations, the cached
+        devices are returned immediately and the discovery of all combinations
+        is refreshed in the background.
+
+        Returns a list of 'SagaInfo'-objects with the interfaces and serial numbers
+        of the found devices.
+    """
+    if _tmsi_sdk is None:
+        initialize()
+
+    interfaces = [(ds, dr) for ds in ds_interfaces for dr in dr_interfaces]
+    cached = [ds_dr for ds_dr in interfaces if _restore_cached_devices(*ds_dr)] if use_cache else []
+
+    if cached:
+        for ds_interface, dr_interface in interfaces:
+            _refresh_discovery_async(ds_interface, dr_interface)
+    else:
+        threads = [threading.Thread(target = _discover_quietly, args = ds_dr, daemon = True)
+                   for ds_dr in interfaces]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    with _discovery_lock:
+        return [copy(info) for info in _device_info_list
+                if (info.id != SagaConst.TMSI_DEVICE_ID_NONE) and ((info.ds_interface, info.dr_interface) in interfaces)]
+
+def _discover(ds_interface, dr_interface, verbose = True):
+    # 1. Executes a discovery on devices based on the given interfaces for DS and DR
+    # 2. Updates the local device-list and the discovery-cache with the result
+    device_list = (TMSiDevList * _MAX_NUM_DEVICES)()
+
+    if dr_interface == DeviceInterfaceType.wifi:
+        _num_retries = 10
+    else:
+        _num_retries = 5
+    for i in range (_MAX_NUM_DEVICES):
+        device_list[i].TMSiDeviceID = SagaConst.TMSI_DEVICE_ID_NONE
+
+    while _num_retries > 0:
+        with _sdk_lock:
             ret = _tmsi_sdk.TMSiGetDeviceList(pointer(device_list), _MAX_NUM_DEVICES, ds_interface.value, dr_interface.value )
 
-            if (ret == TMSiDeviceRetVal.TMSI_OK):
-                # Devices are found, update the local device list with the found result
-                for i in range (_MAX_NUM_DEVICES):
-                    if (device_list[i].TMSiDeviceID != SagaConst.TMSI_DEVICE_ID_NONE):
-                        for ii in range (_MAX_NUM_DEVICES):
-                            if (_device_info_list[ii].id == SagaConst.TMSI_DEVICE_ID_NONE):
-                                _device_info_list[ii].id = device_list[i].TMSiDeviceID
-                                _device_info_list[ii].ds_interface = ds_interface
-                                _device_info_list[ii].dr_interface = dr_interface
-                                _device_info_list[ii].ds_serial_number = device_list[i].DSSerialNr
-                                _device_info_list[ii].dr_serial_number = device_list[i].DRSerialNr
-                                _device_info_list[ii].state = DeviceState.disconnected
-                                
-                                _num_retries = 0
-                                break
-                _num_retries -= 1
-            else: 
-                _num_retries -= 1
+        if (ret == TMSiDeviceRetVal.TMSI_OK):
+            # Devices are found, update the local device list with the found result
+            found = []
+            for i in range (_MAX_NUM_DEVICES):
+                if (device_list[i].TMSiDeviceID != SagaConst.TMSI_DEVICE_ID_NONE):
+                    found.append({'id' : device_list[i].TMSiDeviceID,
+                                  'ds_serial_number' : device_list[i].DSSerialNr,
+                                  'dr_serial_number' : device_list[i].DRSerialNr})
+            if found:
+                with _discovery_lock:
+                    for entry in found:
+                        _register_device(ds_interface, dr_interface, entry)
+                    _store_cached_devices(ds_interface, dr_interface, found)
+                return
+            _num_retries -= 1
+        else:
+            _num_retries -= 1
+            if verbose:
                 print('Trying to open connection to device. Number of retries left: ' + str(_num_retries))
-                time.sleep(0.5)
-                if _num_retries == 0:
-                    raise TMSiError(TMSiErrorCode.no_devices_found)
+            time.sleep(0.5)
+            if _num_retries == 0:
+                raise TMSiError(TMSiErrorCode.no_devices_found)
+
+def _discover_quietly(ds_interface, dr_interface):
+    # Discovery for a single interface-combination on a probing- or refresh-thread:
+    # Interfaces without any attached system are not an error here
+    try:
+        _discover(ds_interface, dr_interface, verbose = False)
+    except TMSiError:
+        pass
+
+def _find_available_device(ds_interface, dr_interface):
+    # Returns the index of a not-connected device in the local device-list with the
+    # given interfaces, or -1 when there is none
+    with _discovery_lock:
+        for i in range (len(_device_info_list)):
+            info = _device_info_list[i]
+            if (info.id != SagaConst.TMSI_DEVICE_ID_NONE) and (info.state != DeviceState.connected) and \
+               (info.ds_interface == ds_interface) and (info.dr_interface == dr_interface):
+                return i
+    return -1
+
+def _register_device(ds_interface, dr_interface, entry):
+    # Adds a found device to the local device-list. A device which is already
+    # present (same serial numbers and interfaces) only gets its id updated, so
+    # its connection-state is kept.
+    free_index = -1
+    for i in range (len(_device_info_list)):
+        info = _device_info_list[i]
+        if (info.id == SagaConst.TMSI_DEVICE_ID_NONE):
+            if (free_index == -1):
+                free_index = i
+        elif (info.ds_interface == ds_interface) and (info.dr_interface == dr_interface) and \
+             (info.ds_serial_number == entry['ds_serial_number']) and (info.dr_serial_number == entry['dr_serial_number']):
+            info.id = entry['id']
+            return
+    if (free_index == -1):
+        _device_info_list.append(SagaInfo())
+        free_index = len(_device_info_list) - 1
+    info = _device_info_list[free_index]
+    info.id = entry['id']
+    info.ds_interface = ds_interface
+    info.dr_interface = dr_interface
+    info.ds_serial_number = entry['ds_serial_number']
+    info.dr_serial_number = entry['dr_serial_number']
+    info.state = DeviceState.disconnected
+
+def _cache_file():
+    return os.path.join(settings._cache_dir, _DISCOVERY_CACHE_FILE)
+
+def _cached_devices():
+    # The discovery-cache maps '<ds_interface>/<dr_interface>' on the devices found
+    # by the last successful discovery on these interfaces. It is loaded once
+    # from disk, so it survives a restart of the application.
+    global _discovery_cache
+    if _discovery_cache is None:
+        try:
+            with open(_cache_file(), 'r') as f:
+                _discovery_cache = json.load(f)
+        except (OSError, ValueError):
+            _discovery_cache = {}
+    return _discovery_cache
+
+def _cache_key(ds_interface, dr_interface):
+    return ds_interface.name + '/' + dr_interface.name
+
+def _store_cached_devices(ds_interface, dr_interface, found):
+    with _discovery_lock:
+        _cached_devices()[_cache_key(ds_interface, dr_interface)] = found
+        try:
+            os.makedirs(settings._cache_dir, exist_ok = True)
+            with open(_cache_file(), 'w') as f:
+                json.dump(_discovery_cache, f)
+        except OSError:
+            # The cache is an optimisation only; discovery keeps working without it
+            pass
+
+def _restore_cached_devices(ds_interface, dr_interface):
+    # Adds the cached devices of the given interfaces to the local device-list.
+    # Returns True when the cache contains any device for these interfaces.
+    with _discovery_lock:
+        found = _cached_devices().get(_cache_key(ds_interface, dr_interface), [])
+        for entry in found:
+            _register_device(ds_interface, dr_interface, entry)
+    return len(found) > 0
+
+def _forget_cached_devices(ds_interface, dr_interface):
+    # Removes the cached devices of the given interfaces from the local
+    # device-list and the cache, e.g. when their device-id is no longer valid
+    with _discovery_lock:
+        cached = _cached_devices().pop(_cache_key(ds_interface, dr_interface), [])
+        ids = [entry['id'] for entry in cached]
+        for info in _device_info_list:
+            if (info.id in ids) and (info.state != DeviceState.connected) and \
+               (info.ds_interface == ds_interface) and (info.dr_interface == dr_interface):
+                info.id = SagaConst.TMSI_DEVICE_ID_NONE
+
+def _refresh_discovery_async(ds_interface, dr_interface):
+    # Refreshes the discovery of the given interfaces on a background-thread. Only
+    # one refresh per interface-combination is active at a time.
+    key = _cache_key(ds_interface, dr_interface)
+    with _discovery_lock:
+        thread = _refresh_threads.get(key)
+        if (thread is not None) and thread.is_alive():
+            return
+        thread = threading.Thread(target = _discover_quietly, args = (ds_interface, dr_interface),
+                                  name = 'Discovery ' + key, daemon = True)
+        _refresh_threads[key] = thread
+    thread.start()
 
 class _SamplingThread(threading.Thread):
     def __init__(self, name):
@@ -714,18 +959,21 @@ class _SamplingThread(threading.Thread):
             ret = _tmsi_sdk.TMSiGetDeviceData(self._device_handle, pointer(self.sample_data_buffer), self.sample_data_buffer_size, pointer(self.retrieved_sample_sets), pointer(self.retrieved_data_type) )
             if (ret == TMSiDeviceRetVal.TMSI_OK):
                 if self.retrieved_sample_sets.value > 0:
-                    self.conversion_queue.put((deepcopy(self.sample_data_buffer), self.retrieved_sample_sets.value))
+                    self.conversion_queue.put((deepcopy(self.sample_data_buffer), self.retrieved_sample_sets.value, time.perf_counter()))
                     
             time.sleep(0.100)
             
         print(self.name, " ready")
         
 
-    def initialize(self, device_handle, channels, sample_conversion):
+    def initialize(self, device_handle, channels, sample_conversion, calibration = None):
         self._device_handle = device_handle
         self.channels = channels
         self.num_samples_per_set = len(channels)
         self.sample_conversion = sample_conversion
+        if (calibration is None):
+            calibration = SagaCalibrationTable(channels, sample_conversion)
+        self.calibration = calibration
 
         _MAX_SIZE_CONVERSION_QUEUE = 50
         self.conversion_queue = queue.Queue(_MAX_SIZE_CONVERSION_QUEUE)        
@@ -749,81 +997,60 @@ class _ConversionThread(threading.Thread):
         else:
             self._warn_message = False
             
-        # sort channels per channel type
-        self._float_chan=[]   
-        self._sensor_chan=[]
-        self._basic_conversion={}
-        for j in range(len(self.channels)):
-            if (self.channels[j].format == 0x0020):
-                self._float_chan.append(j)
-            else:
-                if (self.sample_conversion):
-                    if (self.channels[j].type == ChannelType.AUX) and (self.channels[j].sensor != None):
-                        self._sensor_chan.append(j)
-                    else:
-                        conversion_factor=10**self.channels[j].exp
-                        if not conversion_factor in self._basic_conversion:
-                            self._basic_conversion[conversion_factor]=[j]
-                        else:
-                            self._basic_conversion[conversion_factor].append(j)
+        # Conversion of the samples into their unit
+        self.calibration = sampling_thread.calibration
+        
+        # Track the COUNTER-sequence to detect lost sample-sets
+        if self.sample_conversion:
+            self.sample_loss = SampleLossMonitor(self.channels[-1].sample_rate)
+        else:
+            self.sample_loss = None
         
     def run(self):
         self.sampling = True
         
-        if self._warn_message:
-            # Initialise a sample counter that keeps track of whether samples might be lost
-            last_counter = 0
-        
         while (self.sampling) or (not self.q.empty()):
             while (not self.q.empty()):
                 
-                sample_data_buffer, retrieved_sample_sets = self.q.get()
+                latency_monitor.record_queue_depth('conversion', self.q)
+                sample_data_buffer, retrieved_sample_sets, acquisition_time = self.q.get()
                 
                 
                 if (retrieved_sample_sets > 0):
-                    # reshape data to matrix
-                    sample_mat=np.reshape(sample_data_buffer[:self.num_samples_per_set*retrieved_sample_sets], (self.num_samples_per_set, retrieved_sample_sets), order='F')
-                    if (self.sample_conversion):
-                        #basic unit conversion
-                        for conversion_factor in self._basic_conversion.keys():
-                            sample_mat[self._basic_conversion[conversion_factor]]=sample_mat[self._basic_conversion[conversion_factor]]/conversion_factor
-                        #sensor data conversion
-                        for j in self._sensor_chan:
-                            x= sample_mat[j]
-                            sensor = self.channels[j].sensor
-                            x = ((x + sensor.offset) * sensor.gain)/ (10**sensor.exp)
-                            sample_mat[j]=x
-                    
-                    #conversion of float channels
-                    for j in self._float_chan:
-                        sample_mat[j]=float_to_uint(sample_mat[j]) 
-                    
-                    # Check sample counter integrity
-                    if self._warn_message:
-                        counterstep=np.diff(sample_mat[-1])
-                        if not np.all(counterstep==1)or not ((sample_mat[-1,0]-last_counter)==1):
-                            warnings.warn('\n\n!!! \nSomething is wrong, samples might be lost..\n!!!\n', stacklevel = 1)
-                            self._warn_message = False
-                        last_counter=copy(sample_mat[-1,-1])
-                    
-                    samples=sample_mat.flatten('F')
-                    samples=samples.tolist()
-                    
-                    sd = sample_data.SampleData(retrieved_sample_sets, self.num_samples_per_set, samples )
-                    sample_data_server.putSampleData(self._device_handle.value, sd)
+                    sd = self._process(sample_data_buffer, retrieved_sample_sets)
+                    latency_monitor.stamp(sd, 'acquired', acquisition_time)
+                    latency_monitor.stamp(sd, 'converted')
+                    sample_data_server.putSampleData(self._device_handle.value, sd, 'published-device')
 
             time.sleep(0.010)
         
+    def _process(self, sample_data_buffer, retrieved_sample_sets):
+        # Converts the retrieved sample-sets and packs them into a SampleData-object
+        sample_mat = self._convert(sample_data_buffer, retrieved_sample_sets)
+        
+        # Check sample counter integrity
+        gaps = []
+        if self.sample_loss is not None:
+            gaps = self.sample_loss.update(sample_mat[-1])
+            if gaps and self._warn_message:
+                warnings.warn('\n\n!!! \nSomething is wrong, samples might be lost..\n!!!\n', stacklevel = 1)
+                self._warn_message = False
+        
+        samples=sample_mat.flatten('F')
+        samples=samples.tolist()
+        
+        sd = sample_data.SampleData(retrieved_sample_sets, self.num_samples_per_set, samples )
+        sd.gaps = gaps
+        return sd
+        
+    def _convert(self, sample_data_buffer, retrieved_sample_sets):
+        # reshape data to matrix, without copying the float32-samples
+        samples = np.ctypeslib.as_array(sample_data_buffer)[:self.num_samples_per_set*retrieved_sample_sets]
+        sample_mat = np.reshape(samples, (self.num_samples_per_set, retrieved_sample_sets), order='F')
+        
+        # unit conversion of all channels as one affine transform
+        return self.calibration.apply(sample_mat)
+        
     def stop(self):
         self.sampling = False
         
-
-def float_to_uint(f):
-    fmt_pack='f'*len(f)
-    fmt_unpack='I'*len(f)
-    pack_struct=struct.Struct(fmt_pack)
-    return struct.unpack(fmt_unpack, pack_struct.pack(*list(f)))
-
-
-
-
@@ -24,6 +24,10 @@ limitations under the License.
 TMSiSDK: SAGA Device Types 
 
 '''
+from contextlib import contextmanager
+import numpy as np
+
+from ...error import TMSiError, TMSiErrorCode
 from ...device import DeviceInterfaceType, DeviceState, DeviceConfig, ChannelType, DeviceChannel, DeviceSensor, ReferenceMethod, ReferenceSwitch
 
 _TMSI_DEVICE_ID_NONE = 0xFFFF
@@ -67,9 +71,122 @@ class SagaConfig(DeviceConfig):
         self._channels = [] # Total channel list : active and inactive
         self._sample_rates = [] # List with sample_rate per channel-type
         self._num_sensors = 0 # Number of sensors
+        self._batch_depth = 0 # Nesting level of open batch()-transactions
+        self._batch_modified = False # Changes made within the open batch()-transaction
         for chan_type in ChannelType:
             self._sample_rates.append(SagaSampleRate(chan_type))
 
+    @contextmanager
+    def batch(self):
+        """Groups configuration changes into one transaction.
+
+        Within the 'with'-block the changes are only made to the local
+        configuration. When the block ends, the changes are validated and
+        uploaded to the device in one write/read cycle. When the validation
+        fails or an exception is raised within the block, all changes are
+        rolled back.
+
+        Note:
+            Properties that are derived by the device, like the 'sample_rate',
+            are only updated when the transaction ends.
+
+        Example:
+            with dev.config.batch():
+                dev.config.base_sample_rate = 4000
+                dev.config.set_sample_rate(ChannelType.all_types, 2)
+                dev.config.reference_method = ReferenceMethod.common
+
+        Raises:
+            TMSiError 'api_incorrect_argument' when the changed configuration is invalid.
+        """
+        if (self._batch_depth == 0):
+            snapshot = self._snapshot()
+            self._batch_modified = False
+        self._batch_depth += 1
+        try:
+            yield self
+        except:
+            self._batch_depth -= 1
+            if (self._batch_depth == 0):
+                self._restore(snapshot)
+            raise
+        self._batch_depth -= 1
+        if (self._batch_depth == 0) and (self._batch_modified):
+            if not self._validate():
+                self._restore(snapshot)
+                raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+            if (self._parent != None):
+                self._parent._update_config()
+
+    def _update_device(self):
+        # Uploads a changed configuration to the device, which is postponed
+        # to the end of the transaction when a batch() is open
+        if (self._batch_depth > 0):
+            self._batch_modified = True
+        elif (self._parent != None):
+            self._parent._update_config()
+
+    def _settings(self):
+        # The device-wide settings that are uploaded to the device
+        return (self._base_sample_rate, self._configured_interface, self._triggers,
+                self._reference_method, self._auto_reference_method, self._dr_sync_out_divider,
+                self._dr_sync_out_duty_cycle, self._repair_logging)
+
+    def _channel_settings(self):
+        # The per-channel settings that are uploaded to the device
+        return [(ch.chan_divider, ch.alt_name) for ch in self._channels]
+
+    def _merge(self, other):
+        # Takes over the uploadable settings of another configuration, e.g. one
+        # read from an xml-file. Returns False when the channel lists differ in size.
+        if (len(other._channels) != len(self._channels)):
+            return False
+        (self._base_sample_rate, _, self._triggers,
+         self._reference_method, self._auto_reference_method, self._dr_sync_out_divider,
+         self._dr_sync_out_duty_cycle, self._repair_logging) = other._settings()
+        for ch, other_ch in zip(self._channels, other._channels):
+            ch.chan_divider = other_ch.chan_divider
+            ch.alt_name = other_ch.alt_name
+        return True
+
+    def _snapshot(self):
+        return (self._settings(),
+                [(ch.chan_divider, ch.alt_name, ch.sample_rate) for ch in self._channels],
+                [(sr.sample_rate, sr.chan_divider) for sr in self._sample_rates])
+
+    def _restore(self, snapshot):
+        settings, channels, sample_rates = snapshot
+        (self._base_sample_rate, self._configured_interface, self._triggers,
+         self._reference_method, self._auto_reference_method, self._dr_sync_out_divider,
+         self._dr_sync_out_duty_cycle, self._repair_logging) = settings
+        for ch, (chan_divider, alt_name, sample_rate) in zip(self._channels, channels):
+            ch.chan_divider = chan_divider
+            ch.alt_name = alt_name
+            ch.sample_rate = sample_rate
+        for sr, (sample_rate, chan_divider) in zip(self._sample_rates, sample_rates):
+            sr.sample_rate = sample_rate
+            sr.chan_divider = chan_divider
+
+    def _validate(self):
+        # Checks the configuration on values the device does not accept
+        if self._base_sample_rate not in (4000, 4096):
+            return False
+        if (self._reference_method not in (0, 1)) or (self._auto_reference_method not in (0, 1)):
+            return False
+        if (self._triggers not in (0, 1)) or (self._repair_logging not in (0, 1)):
+            return False
+        if (self._dr_sync_out_divider != -1) and (self._dr_sync_out_divider < 1):
+            return False
+        if not (0 <= self._dr_sync_out_duty_cycle <= 1000):
+            return False
+        for ch in self._channels:
+            if ch.chan_divider not in (-1, 0, 1, 2, 3):
+                return False
+            # AltChanName holds 9 characters and the zero-termination
+            if len(bytearray(ch.alt_name, 'utf-8')) > 9:
+                return False
+        return True
+
     def get_sample_rate(self, chan_type):
         """'int' the sample-rate of the specified channel-type-group.
 
@@ -110,8 +227,7 @@ class SagaConfig(DeviceConfig):
                     # Only update the chan_divider of active channels
                     if (ch.chan_divider != -1):
                         ch.chan_divider = bsr_shift
-            if (self._parent != None):
-                self._parent._update_config()
+            self._update_device()
         else:
             print('\nProvided base_sample_rate_divider is invalid. Sample rate can not be updated.\n')
 
@@ -177,8 +293,7 @@ class SagaConfig(DeviceConfig):
             print(dr_interface_type)
             self._configured_interface = dr_interface_type.value
         
-            if (self._parent != None):
-                self._parent._update_config()
+            self._update_device()
 
     @property
     def num_channels(self):
@@ -235,8 +350,7 @@ class SagaConfig(DeviceConfig):
                         self._channels[idx].chan_divider = self._sample_rates[self._channels[idx].type.value].chan_divider
                 else:
                     self._channels[idx].chan_divider = -1
-        if (self._parent != None):
-            self._parent._update_config()
+        self._update_device()
             
     @property
     def reference_method(self):
@@ -267,8 +381,7 @@ class SagaConfig(DeviceConfig):
                 elif isinstance(reference_type[ind], ReferenceSwitch):
                     self._auto_reference_method=reference_type[ind].value
 
-        if (self._parent != None):
-            self._parent._update_config()
+        self._update_device()
             
     @property
     def triggers(self):
@@ -279,8 +392,7 @@ class SagaConfig(DeviceConfig):
     def triggers(self, enable_triggers):
         """Sets the triggers to enabled or disabled"""
         self._triggers=enable_triggers
-        if (self._parent != None):
-            self._parent._update_config()
+        self._update_device()
         
     @property
     def repair_logging(self):
@@ -291,8 +403,7 @@ class SagaConfig(DeviceConfig):
     def repair_logging(self, enable_logging):
         """Sets repair logging to enabled or disabled"""
         self._repair_logging=enable_logging
-        if (self._parent != None):
-            self._parent._update_config()
+        self._update_device()
     
     def get_sync_out_config(self):
         """Sync out configuration, shows whether sync out is in marker mode or square wave mode with corresponding frequency and duty cycle"""
@@ -312,8 +423,7 @@ class SagaConfig(DeviceConfig):
             if duty_cycle:
                 self._dr_sync_out_duty_cycle=duty_cycle*10
                 
-        if (self._parent != None):
-            self._parent._update_config()  
+        self._update_device()
 
 class SagaSensor():
     """ <SagaSensor> represents the sensor-data of a channel. It has the next properties:
@@ -427,4 +537,111 @@ class SagaSampleRate():
     def __init__(self, type):
         self.type = type
         self.sample_rate = 0
-        self.chan_divider = -1
\ No newline at end of file
+        self.chan_divider = -1
+
+# Channel-format of channels of which the samples are unsigned integers, sent
+# as the bit-pattern of a float (e.g. STATUS and COUNTER)
+_FORMAT_UINT32 = 0x0020
+
+# Layout of the SensorMetaData: a header followed by 'SensorDefaultChannel'-structs
+_SENSOR_HEADER_DTYPE = np.dtype([('manufacturer_id', '<u2'), ('serial_nr', '<u4'), ('product_id', '<u8'),
+                                 ('channel_count', 'u1'), ('additional_structs', 'u1')])
+_SENSOR_CHANNEL_DTYPE = np.dtype([('struct_id', '<u2'), ('name', 'S10'), ('unit_name', 'S10'),
+                                  ('exp', '<i2'), ('gain', '<f4'), ('offset', '<f4')])
+
+def parse_sensor_metadata(meta_data):
+    """ Decodes the SensorMetaData of a sensor.
+
+        Args:
+            meta_data : 'bytes' The raw SensorMetaData.
+
+        Returns:
+            The header as a NumPy-record and a NumPy-record-array with the
+            'SensorDefaultChannel'-structs, up to the first empty struct.
+    """
+    header = np.frombuffer(meta_data, dtype=_SENSOR_HEADER_DTYPE, count=1)[0]
+    count = min(int(header['channel_count']), (len(meta_data) - _SENSOR_HEADER_DTYPE.itemsize) // _SENSOR_CHANNEL_DTYPE.itemsize)
+    channels = np.frombuffer(meta_data, dtype=_SENSOR_CHANNEL_DTYPE, count=count, offset=_SENSOR_HEADER_DTYPE.itemsize)
+    # Only 'SensorDefaultChannel'-structs (struct_id 0) are parsed, an other
+    # struct marks the end of the sensor-channels
+    num_default = int(np.cumprod(channels['struct_id'] == 0).sum())
+    return header, channels[:num_default]
+
+class SagaCalibrationTable():
+    """ <SagaCalibrationTable> holds per channel the affine transform that converts
+        the received samples into their unit, which is applied to a block of
+        samples at once. It has the next properties:
+
+    scale : <ndarray> Per channel the factor the samples are multiplied with.
+
+    offset : <ndarray> Per channel the value added after the multiplication.
+
+    uint_channels : <ndarray> Indices of the channels of which the samples are
+                    unsigned integers, which are passed as-is.
+
+    Args:
+        channels : 'list SagaChannel' The channels, in order of the sample-sets.
+
+        sample_conversion : 'bool' False when samples must not be converted
+                            into their unit, e.g. for an impedance measurement.
+    """
+    def __init__(self, channels, sample_conversion = True, previous = None):
+        self.sample_conversion = sample_conversion
+        self._keys = [SagaCalibrationTable._key(ch, sample_conversion) for ch in channels]
+        self.scale = np.ones(len(channels))
+        self.offset = np.zeros(len(channels))
+
+        # Only the channels with a changed calibration are recalculated
+        reuse = (previous is not None) and (len(previous._keys) == len(self._keys))
+        for idx, key in enumerate(self._keys):
+            if reuse and (key == previous._keys[idx]):
+                self.scale[idx] = previous.scale[idx]
+                self.offset[idx] = previous.offset[idx]
+            else:
+                self.scale[idx], self.offset[idx] = SagaCalibrationTable._coefficients(key)
+        self.uint_channels = np.array([idx for idx, key in enumerate(self._keys) if key[0]], dtype=int)
+
+    def updated(self, channels):
+        """ Returns the table for the changed channels, e.g. after sensors have
+            been attached or detached. The table itself is not modified, so it
+            can be used by an ongoing measurement.
+        """
+        return SagaCalibrationTable(channels, self.sample_conversion, self)
+
+    def apply(self, samples):
+        """ Converts a block of samples.
+
+            Args:
+                samples : 'ndarray' float32-samples with shape (channels, sample-sets).
+
+            Returns:
+                'ndarray' The converted samples with the same shape.
+        """
+        converted = samples * self.scale[:, np.newaxis] + self.offset[:, np.newaxis]
+        if self.uint_channels.size:
+            converted[self.uint_channels] = samples[self.uint_channels].view(np.uint32)
+        return converted
+
+    @staticmethod
+    def _key(ch, sample_conversion):
+        # All the channel-properties the calibration depends on
+        if (ch.format == _FORMAT_UINT32):
+            return (True, None)
+        if not sample_conversion:
+            return (False, None)
+        if (ch.type == ChannelType.AUX) and (ch.sensor != None):
+            return (False, ('sensor', ch.sensor.gain, ch.sensor.offset, ch.sensor.exp))
+        return (False, ('unit', ch.exp))
+
+    @staticmethod
+    def _coefficients(key):
+        is_uint, conversion = key
+        if is_uint or (conversion is None):
+            return 1.0, 0.0
+        if (conversion[0] == 'sensor'):
+            # ((x + offset) * gain) / 10**exp
+            gain, offset, exp = conversion[1:]
+            scale = gain / (10.0 ** exp)
+            return scale, offset * scale
+        # x / 10**exp
+        return 1.0 / (10.0 ** conversion[1]), 0.0
@@ -34,7 +34,7 @@ import struct
 import time
 
 from ..error import TMSiError, TMSiErrorCode
-from .. import sample_data_server
+from .. import latency_monitor
 from pylsl import StreamInfo, StreamOutlet, local_clock
 from ..device import ChannelType
 
@@ -66,6 +66,7 @@ class LSLConsumer:
             self._outlet.push_chunk(signals, local_clock())
         except:
             raise TMSiError(TMSiErrorCode.file_writer_error)
+        latency_monitor.stamp(sd, 'lsl_writer')
 
 class LSLWriter:
     '''
@@ -73,9 +74,15 @@ class LSLWriter:
     that streams data to labstreaminglayer
     '''
 
-    def __init__(self, stream_name = ''):
+    def __init__(self, stream_name = '', sample_rate = None):
+        '''
+        sample_rate: optional sample rate of the stream, lower than the sample
+        rate of the device. The sample data is then decimated (anti-aliased)
+        before it is streamed.
+        '''
 
         self._name = stream_name if stream_name else 'tmsi'
+        self._stream_rate = sample_rate
         self._consumer = None
         self.device = None
         self._date = None
@@ -92,7 +99,7 @@ class LSLWriter:
 
         try:
             self._date = datetime.now()
-            self._sample_rate = device.config.sample_rate
+            self._sample_rate = self._stream_rate if self._stream_rate else device.config.sample_rate
             self._num_channels = len(device.channels)
 
             # Calculate nr of sample-sets within one sample-data-block:
@@ -131,7 +138,8 @@ class LSLWriter:
             # start sampling data and pushing to LSL
             self._outlet = StreamOutlet(info, self._num_sample_sets_per_sample_data_block)
             self._consumer = LSLConsumer(self._outlet)
-            sample_data_server.registerConsumer(self.device.id, self._consumer)
+            from ..filters import decimation
+            decimation.registerConsumer(self.device, self._consumer, self._sample_rate, 'lsl-writer')
 
         except:
             raise TMSiError(TMSiErrorCode.file_writer_error)
@@ -140,7 +148,8 @@ class LSLWriter:
     def close(self):
 
         print("LSLWriter-close")
-        sample_data_server.unregisterConsumer(self.device.id, self._consumer)
+        from ..filters import decimation
+        decimation.unregisterConsumer(self.device, self._consumer, self._sample_rate)
         # let garbage collector take care of destroying LSL outlet
         self._consumer = None
         self._outlet = None
@@ -34,7 +34,7 @@ import time
 import numpy as np
 
 from ..error import TMSiError, TMSiErrorCode
-from .. import sample_data_server
+from .. import sample_data_server, latency_monitor
 
 _QUEUE_SIZE = 1000
 
@@ -50,6 +50,9 @@ class Poly5Writer:
             self.filename='.'.join(fileparts[:-1])+ '-' + filetime + '.poly5'
         else:
             self.filename = filename + '-' + filetime + '.poly5'
+        # Poly5 has no annotation section: annotations, like the gaps in the
+        # COUNTER-sequence, are written to a tab-delimited text-file next to it
+        self.annotations_filename = self.filename[:-len('.poly5')] + '-annotations.txt'
         self._fp = None
         self._date = None
 
@@ -86,7 +89,7 @@ class Poly5Writer:
             fmt='f'*self._num_channels*self._num_sample_sets_per_sample_data_block 
             self.pack_struct = struct.Struct(fmt)
 
-            sample_data_server.registerConsumer(self.device.id, self.q_sample_sets)
+            sample_data_server.registerConsumer(self.device.id, self.q_sample_sets, 'poly5-writer')
 
             self._sampling_thread = ConsumerThread(self, name='poly5-writer : dev-id-' + str(self.device.id))
             self._sampling_thread.start()
@@ -201,6 +204,9 @@ class ConsumerThread(threading.Thread):
         self._sample_sets_in_block = []
         self.pack_struct=file_writer.pack_struct 
         self._remaining_samples=np. array([])
+        self._num_received_sample_sets = 0
+        self._annotations_filename = file_writer.annotations_filename
+        self._fp_annotations = None
 
     def run(self):
         print(self.name, " started")   
@@ -219,7 +225,7 @@ class ConsumerThread(threading.Thread):
                
                 
                 try:
-                    for i in range(np.int(np.floor(n_samp/self._num_sample_sets_per_sample_data_block))):
+                    for i in range(int(np.floor(n_samp/self._num_sample_sets_per_sample_data_block))):
                         self._sample_sets_in_block=samples[i*self._num_sample_sets_per_sample_data_block*sd.num_samples_per_sample_set:(i+1)*self._num_sample_sets_per_sample_data_block*sd.num_samples_per_sample_set]
                         Poly5Writer._writeSignalBlock(self._fp,\
                                                         self._sample_set_block_index,\
@@ -249,7 +255,7 @@ class ConsumerThread(threading.Thread):
                             # Go back to end of file
                             self._fp.seek(0, os.SEEK_END)
                         
-                    i=np.int(np.floor(n_samp/self._num_sample_sets_per_sample_data_block))
+                    i=int(np.floor(n_samp/self._num_sample_sets_per_sample_data_block))
                     ind=np.arange(i*self._num_sample_sets_per_sample_data_block*sd.num_samples_per_sample_set, n_samp*sd.num_samples_per_sample_set)
                     if ind.any:
                         self._remaining_samples=samples[ind]
@@ -259,6 +265,12 @@ class ConsumerThread(threading.Thread):
                 except:
                     raise TMSiError(TMSiErrorCode.file_writer_error)
 
+                if sd.gaps:
+                    self._write_gap_annotations(sd.gaps)
+                self._num_received_sample_sets += sd.num_sample_sets
+
+                latency_monitor.stamp(sd, 'poly5_writer')
+
             time.sleep(0.01)
         
         if self._remaining_samples.any():
@@ -295,8 +307,22 @@ class ConsumerThread(threading.Thread):
         
         print(self.name, " ready, closing file")
         self._fp.close()
+        if self._fp_annotations is not None:
+            self._fp_annotations.close()
         return
 
+    def _write_gap_annotations(self, gaps):
+        # Writes an annotation (onset and duration in seconds) per gap in the
+        # COUNTER-sequence. The onset is the position in the file of the first
+        # sample-set after the gap.
+        if self._fp_annotations is None:
+            self._fp_annotations = open(self._annotations_filename, 'w')
+            self._fp_annotations.write('onset\tduration\tdescription\n')
+        for index, num_lost in gaps:
+            onset = (self._num_received_sample_sets + index) / self._sample_rate
+            self._fp_annotations.write('{:.6f}\t{:.6f}\tgap: {} sample-sets lost\n'.format(onset, num_lost / self._sample_rate, num_lost))
+        self._fp_annotations.flush()
+
     def stop_sampling(self):
         print(self.name, " stop sampling")
         self.sampling = False;
\ No newline at end of file
@@ -36,14 +36,17 @@ import xml.etree.ElementTree as ET
 
 from ..device import ChannelType
 from ..error import TMSiError, TMSiErrorCode
-from .. import sample_data_server
+from .. import latency_monitor
 import numpy as np
-import pandas as pd
 import os
 
 
 _QUEUE_SIZE_SAMPLE_SETS = 1000
 
+# Stream-ids of the sample-data stream and of the marker stream
+_SAMPLES_STREAM_ID = 1
+_MARKERS_STREAM_ID = 2
+
 #
 class ChunkTag(IntEnum):
     """ <ChunkTag> The chunk tag defines the type of the chunk."""
@@ -65,8 +68,14 @@ def xml_etree_to_string(elem):
     return rough_string
 
 class XdfWriter:
-    def __init__(self, filename, add_ch_locs):
+    def __init__(self, filename, add_ch_locs, sample_rate = None):
+        '''
+        sample_rate: optional sample rate of the file, lower than the sample
+        rate of the device. The sample data is then decimated (anti-aliased)
+        before it is written.
+        '''
         self.q_sample_sets = queue.Queue(_QUEUE_SIZE_SAMPLE_SETS)
+        self._stream_rate = sample_rate
         self.device = None
 
         self.filename=filename    
@@ -86,7 +95,7 @@ class XdfWriter:
         print("XdfWriter-open")
         self.device = device
         
-        self._sample_rate = device.config.sample_rate
+        self._sample_rate = self._stream_rate if self._stream_rate else device.config.sample_rate
         self._num_channels = len(device.channels)
         
         now = datetime.now()
@@ -106,6 +115,7 @@ class XdfWriter:
                 if (now-Impedance_time) < timedelta(minutes=2):
                     imp_file=file
                     #read impedance data
+                    import pandas as pd
                     imp_df = pd.read_csv('../measurements/'+file, delimiter = "\t", header=None)    
                     imp_df.columns=['ch_name', 'impedance', 'unit']
         if imp_df is not None:
@@ -123,6 +133,7 @@ class XdfWriter:
             self.device.config
           
             self._write_stream_header_chunk(self.device.channels, self._sample_rate, imp_df)
+            self._write_marker_stream_header_chunk()
                 
             # 4. Determine the number of sample-sets within one Samples-chunk:
             #   This is the number of sample-sets received within 150 milli-seconds or when the
@@ -136,7 +147,8 @@ class XdfWriter:
             self.pack_struct = struct.Struct(fmt)     
 
             # 5. Register at the sample-data-server and start the sampling-thread
-            sample_data_server.registerConsumer(self.device.id, self.q_sample_sets)
+            from ..filters import decimation
+            decimation.registerConsumer(self.device, self.q_sample_sets, self._sample_rate, 'xdf-writer')
             self._sampling_thread = ConsumerThread(self, name='Xdf-writer : dev-id-' + str(self.device.id))
             self._sampling_thread.start()
         except:
@@ -150,10 +162,12 @@ class XdfWriter:
             3. Closes the xdf-file (by the sampling-thread)
         """
         print("XdfWriter-close")
+        from ..filters import decimation
+        decimation.unregisterConsumer(self.device, self.q_sample_sets, self._sample_rate)
         self._sampling_thread.stop_sampling()
 
     @staticmethod
-    def _write_chunk(f, length_size, chunk_tag, chunk_data):
+    def _write_chunk(f, length_size, chunk_tag, chunk_data, stream_id = _SAMPLES_STREAM_ID):
         """ Writes a complete chunk to the xdf-file. Writes the chunk-meta-data and chunk-data.
 
             Args:
@@ -161,6 +175,7 @@ class XdfWriter:
                 length_size : 'int' variable-length indicator of the chunk-length (1, 4 or 8)
                 chunk_tag : 'ChunkTag' defines the type of the chunk
                 chunk_data : byte-array with the chunk-data to write
+                stream_id : 'int' the stream the chunk belongs to
         """
         # 1. Write the chunk meta-data :
         #       - chunk-length,
@@ -184,8 +199,7 @@ class XdfWriter:
         f.write(data_size.to_bytes(length_size, 'little'))
         f.write(chunk_tag.to_bytes(num_arbitrary_bytes, 'little'))
         if (chunk_tag != ChunkTag.file_header):
-            _stream_id = 1
-            f.write(_stream_id.to_bytes(4, 'little'))
+            f.write(stream_id.to_bytes(4, 'little'))
 
         # 2. Write the chunk-data
         f.write(chunk_data)
@@ -238,60 +252,70 @@ class XdfWriter:
         de_desc = ET.SubElement(de_info, 'desc')
         de_channels = ET.SubElement(de_desc, 'channels')
 
-        #read channel locations
-        chLocs=pd.read_csv('../TMSiSDK/_resources/EEGchannelsTMSi3D.txt', sep="\t", header=None)
-        chLocs.columns=['default_name', 'eeg_name', 'X', 'Y', 'Z']
-
-        # Meta-data per channel
-        i=0  #active channel counter
-        for j in range(len(self.device._config._channels)):
-            if self.device._config._channels[j].def_name==self.device._channels[i].def_name:
-                # description of one channel, repeated (one for each channel in the time series)
-                item_channel = ET.SubElement(de_channels, 'channel')
-                # channel label
-                item_label =  ET.SubElement(item_channel, 'label')
-                item_label.text = channels[i].name
-                # channel content-type (EEG, EMG, EOG, ...)
-                item_type = ET.SubElement(item_channel, 'type')
+        #read channel locations, only when they are added to the meta-data
+        if self.add_ch_locs:
+            import pandas as pd
+            chLocs=pd.read_csv('../TMSiSDK/_resources/EEGchannelsTMSi3D.txt', sep="\t", header=None)
+            chLocs.columns=['default_name', 'eeg_name', 'X', 'Y', 'Z']
+
+        # Meta-data per channel: the index of every channel in the configuration
+        # of the device. The channels of a producer of processed sample-data
+        # (e.g. a pipeline) are not in the configuration of the device.
+        if getattr(self.device, 'producer', None) is not None:
+            config_indices = [None] * num_channels
+        else:
+            config_indices = []
+            for j in range(len(self.device._config._channels)):
+                i = len(config_indices)
+                if (i < num_channels) and (self.device._config._channels[j].def_name==self.device._channels[i].def_name):
+                    config_indices.append(j)
+
+        for i, j in enumerate(config_indices):
+            # description of one channel, repeated (one for each channel in the time series)
+            item_channel = ET.SubElement(de_channels, 'channel')
+            # channel label
+            item_label =  ET.SubElement(item_channel, 'label')
+            item_label.text = channels[i].name
+            # channel content-type (EEG, EMG, EOG, ...)
+            item_type = ET.SubElement(item_channel, 'type')
+            
+            if (channels[i].type.value == ChannelType.UNI.value):
+                if not j==0:
+                    item_type.text = 'EEG'
+                    #channel location
+                    if self.add_ch_locs and (j is not None):
+                        item_location = ET.SubElement(item_channel, 'location')
+                        item_x = ET.SubElement(item_location, 'X')
+                        item_y = ET.SubElement(item_location, 'Y')
+                        item_z = ET.SubElement(item_location, 'Z')
+                        item_x.text=str(95*chLocs['X'].values[j-1])
+                        item_y.text=str(95*chLocs['Y'].values[j-1])
+                        item_z.text=str(95*chLocs['Z'].values[j-1])
+                else:
+                    item_type.text = 'CREF'
+            elif (channels[i].type.value == ChannelType.BIP.value):
+                item_type.text = 'BIP'
+            elif (channels[i].type.value == ChannelType.AUX.value):
+                item_type.text = 'AUX'
+            elif (channels[i].type.value == ChannelType.sensor.value):
+                item_type.text = 'sensor'
+            elif (channels[i].type.value == ChannelType.status.value):
+                item_type.text = 'status'
+            elif (channels[i].type.value == ChannelType.counter.value):
+                item_type.text = 'counter'
+            else:
+                item_type.text = '-'
                 
-                if (channels[i].type.value == ChannelType.UNI.value):
-                    if not j==0:
-                        item_type.text = 'EEG'
-                        #channel location
-                        if self.add_ch_locs:
-                            item_location = ET.SubElement(item_channel, 'location')
-                            item_x = ET.SubElement(item_location, 'X')
-                            item_y = ET.SubElement(item_location, 'Y')
-                            item_z = ET.SubElement(item_location, 'Z')
-                            item_x.text=str(95*chLocs['X'].values[j-1])
-                            item_y.text=str(95*chLocs['Y'].values[j-1])
-                            item_z.text=str(95*chLocs['Z'].values[j-1])
-                    else:
-                        item_type.text = 'CREF'
-                elif (channels[i].type.value == ChannelType.BIP.value):
-                    item_type.text = 'BIP'
-                elif (channels[i].type.value == ChannelType.AUX.value):
-                    item_type.text = 'AUX'
-                elif (channels[i].type.value == ChannelType.sensor.value):
-                    item_type.text = 'sensor'
-                elif (channels[i].type.value == ChannelType.status.value):
-                    item_type.text = 'status'
-                elif (channels[i].type.value == ChannelType.counter.value):
-                    item_type.text = 'counter'
+            if imp_df is not None:
+                #channel impedence
+                item_impedance = ET.SubElement(item_channel, 'impedance')
+                if (channels[i].type.value == ChannelType.UNI.value) and (j is not None):
+                    item_impedance.text=str(imp_df['impedance'].values[j]) 
                 else:
-                    item_type.text = '-'
-                    
-                if imp_df is not None:
-                    #channel impedence
-                    item_impedance = ET.SubElement(item_channel, 'impedance')
-                    if (channels[i].type.value == ChannelType.UNI.value):
-                        item_impedance.text=str(imp_df['impedance'].values[j]) 
-                    else:
-                        item_impedance.text='N.A.'
-                # measurement unit (strongly preferred unit: microvolts)
-                item_unit = ET.SubElement(item_channel, 'unit')
-                item_unit.text = channels[i].unit_name
-                i+=1
+                    item_impedance.text='N.A.'
+            # measurement unit (strongly preferred unit: microvolts)
+            item_unit = ET.SubElement(item_channel, 'unit')
+            item_unit.text = channels[i].unit_name
                 
         #Acquisition meta-data
         de_acquisition = ET.SubElement(de_desc, 'acquisition')
@@ -319,7 +343,26 @@ class XdfWriter:
         # Write the StreamHeader-cunk
         XdfWriter._write_chunk(self._fp, 4, ChunkTag.stream_header, xml_etree_to_string(de_info))
 
-    def _write_stream_footer_chunk(self, first_timestamp, last_timestamp, sample_count, sample_rate):
+    def _write_marker_stream_header_chunk(self):
+        """ Writes the StreamHeader-chunk of the marker stream, an irregular
+            stream with one string-channel. The gaps in the COUNTER-sequence
+            are written as markers to this stream.
+        """
+        de_info = ET.Element('info')
+        item_name = ET.SubElement(de_info, 'name')
+        item_name.text = 'SAGA-markers'
+        item_type = ET.SubElement(de_info, 'type')
+        item_type.text = 'Markers'
+        item_channel_count = ET.SubElement(de_info, 'channel_count')
+        item_channel_count.text = '1'
+        item_nominal_srate = ET.SubElement(de_info, 'nominal_srate')
+        item_nominal_srate.text = '0'
+        item_channel_format = ET.SubElement(de_info, 'channel_format')
+        item_channel_format.text = 'string'
+
+        XdfWriter._write_chunk(self._fp, 4, ChunkTag.stream_header, xml_etree_to_string(de_info), _MARKERS_STREAM_ID)
+
+    def _write_stream_footer_chunk(self, first_timestamp, last_timestamp, sample_count, sample_rate, stream_id = _SAMPLES_STREAM_ID):
         """ Writes the StreamFooter-chunk :
              - first timestamp in seconds
              - last timestamp in seconds
@@ -332,6 +375,7 @@ class XdfWriter:
                 sample_count : Total number of sample-sets written to the xdf-file
                 sample_rate : int' The rate of the current configuration, with which
                                    sample-sets are sent during a measurement.
+                stream_id : 'int' the stream the footer belongs to
 
         """
         data = ET.Element('info')
@@ -344,7 +388,7 @@ class XdfWriter:
         item_nominal_srate = ET.SubElement(data, 'measured_srate')
         item_nominal_srate.text =  str(sample_rate)
 
-        XdfWriter._write_chunk(self._fp, 4, ChunkTag.stream_footer, xml_etree_to_string(data))
+        XdfWriter._write_chunk(self._fp, 4, ChunkTag.stream_footer, xml_etree_to_string(data), stream_id)
 
 
     @staticmethod
@@ -370,6 +414,30 @@ class XdfWriter:
         
         XdfWriter._write_chunk(f, 4, ChunkTag.samples, sample_chunk)
 
+    @staticmethod
+    def _write_marker_chunk(f, markers):
+        """ Writes a Samples-chunk to the marker stream :
+
+            Args:
+                f : 'file-object' of the xdf-file
+                markers : list of (timestamp, text)-tuples
+        """
+        marker_chunk = bytearray()
+        num_sample_bytes = int(4)
+
+        marker_chunk += num_sample_bytes.to_bytes(1, 'little')
+        marker_chunk += len(markers).to_bytes(4, 'little')
+
+        for timestamp, text in markers:
+            text = text.encode('utf-8')
+            marker_chunk += int(8).to_bytes(1, 'little')
+            marker_chunk += struct.pack('<d', timestamp)
+            marker_chunk += int(4).to_bytes(1, 'little')
+            marker_chunk += len(text).to_bytes(4, 'little')
+            marker_chunk += text
+
+        XdfWriter._write_chunk(f, 4, ChunkTag.samples, marker_chunk, _MARKERS_STREAM_ID)
+
     @staticmethod
     def _write_boundary_chunk(f):
         """ Writes the Boundary-chunk :
@@ -398,6 +466,10 @@ class ConsumerThread(threading.Thread):
         self._boundary_chunk_counter = 0
         self.pack_struct=file_writer.pack_struct 
         self._remaining_samples=np. array([])
+        self._num_received_sample_sets = 0
+        self._num_written_markers = 0
+        self._first_marker_timestamp = 0
+        self._last_marker_timestamp = 0
 
     def run(self):
         
@@ -418,7 +490,7 @@ class ConsumerThread(threading.Thread):
                 try:
                     # Collect the sample-sets:
                     # When collected enough to fill a sample-data-block, write it to a Samples-chunk
-                    for i in range(np.int(np.floor(n_samp/self._num_sample_sets_per_sample_data_block))):
+                    for i in range(int(np.floor(n_samp/self._num_sample_sets_per_sample_data_block))):
                         self._sample_sets_in_block=samples[i*self._num_sample_sets_per_sample_data_block*sd.num_samples_per_sample_set:(i+1)*self._num_sample_sets_per_sample_data_block*sd.num_samples_per_sample_set]
                         XdfWriter._write_sample_chunk(self._fw._fp,\
                                                     self._sample_sets_in_block,\
@@ -434,7 +506,7 @@ class ConsumerThread(threading.Thread):
                             self._boundary_chunk_counter = 0        
                     
                     # Store remaining samples for next repetion        
-                    i=np.int(np.floor(n_samp/self._num_sample_sets_per_sample_data_block))
+                    i=int(np.floor(n_samp/self._num_sample_sets_per_sample_data_block))
                     ind=np.arange(i*self._num_sample_sets_per_sample_data_block*sd.num_samples_per_sample_set, n_samp*sd.num_samples_per_sample_set)
                     if ind.any:
                         self._remaining_samples=samples[ind]
@@ -444,6 +516,12 @@ class ConsumerThread(threading.Thread):
                 except:
                     raise TMSiError(TMSiErrorCode.file_writer_error)
 
+                if sd.gaps:
+                    self._write_gap_markers(sd.gaps)
+                self._num_received_sample_sets += sd.num_sample_sets
+
+                latency_monitor.stamp(sd, 'xdf_writer')
+
             time.sleep(0.01)
        
         #Handle remaining samples before closing file
@@ -459,12 +537,28 @@ class ConsumerThread(threading.Thread):
         # When done : write the StreamFoot-cunk and close the file
         elapsed_time = time.time() - self._start_time
         self._fw._write_stream_footer_chunk(0, int(elapsed_time), self._num_written_sample_sets, self._fw._sample_rate)
+        self._fw._write_stream_footer_chunk(self._first_marker_timestamp, self._last_marker_timestamp, self._num_written_markers, 0, _MARKERS_STREAM_ID)
 
         
         print(self.name, " ready, closing file")
         self._fw._fp.close()
         return
 
+    def _write_gap_markers(self, gaps):
+        # Writes a marker per gap in the COUNTER-sequence. Sample-sets are written
+        # without timestamps, a reader assigns them (index + 1) / sample_rate : the
+        # marker gets the timestamp of the first sample-set after the gap.
+        markers = []
+        for index, num_lost in gaps:
+            timestamp = (self._num_received_sample_sets + index + 1) / self._fw._sample_rate
+            markers.append((timestamp, 'gap: {} sample-sets lost'.format(num_lost)))
+        XdfWriter._write_marker_chunk(self._fw._fp, markers)
+
+        if self._num_written_markers == 0:
+            self._first_marker_timestamp = markers[0][0]
+        self._last_marker_timestamp = markers[-1][0]
+        self._num_written_markers += len(markers)
+
     def stop_sampling(self):
         print(self.name, " stop sampling")
         self.sampling = False;
\ No newline at end of file
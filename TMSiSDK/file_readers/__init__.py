@@ -24,4 +24,11 @@ limitations under the License.
 '''
 
 from .poly5reader import Poly5Reader
-from .xdf_reader import Xdf_Reader
\ No newline at end of file
+
+def __getattr__(name):
+    # The Xdf_Reader depends on pyxdf, MNE and pandas: only import these when
+    # the reader is used, so the Poly5Reader keeps working without them.
+    if name == 'Xdf_Reader':
+        from .xdf_reader import Xdf_Reader
+        return Xdf_Reader
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -27,13 +27,13 @@ TMSiSDK: Poly5 File Reader
 import numpy as np
 import struct
 import datetime
-import tkinter as tk
-from tkinter import filedialog
 
 class Poly5Reader: 
 
     def __init__(self, filename=None, readAll=True):
         if filename is None:
+            import tkinter as tk
+            from tkinter import filedialog
             root = tk.Tk()
 
             filename = filedialog.askopenfilename()
@@ -152,6 +152,16 @@ class Channel:
     def __init__(self, name, unit_name):
         self.__unit_name = unit_name
         self.__name = name
+
+    @property
+    def name(self):
+        """'string' The name of the channel."""
+        return self.__name
+
+    @property
+    def unit_name(self):
+        """'string' The name of the unit (e.g. 'μVolt)  of the sample-data of the channel."""
+        return self.__unit_name
         
         
         
@@ -29,8 +29,6 @@ TMSiSDK: XDF File Reader
 
 from pyxdf import load_xdf
 import mne
-import tkinter as tk
-from tkinter import filedialog
 import numpy as np
 import pandas as pd
 import copy
@@ -39,6 +37,8 @@ import copy
 class Xdf_Reader: 
     def __init__(self, filename=None, add_ch_locs=False):
         if filename==None:
+            import tkinter as tk
+            from tkinter import filedialog
             root = tk.Tk()
 
             filename = filedialog.askopenfilename()
@@ -25,9 +25,16 @@ TMSiSDK: File Writer Interface
 
 '''
 
+from datetime import datetime
 from enum import Enum
+import json
+import os
+import queue
+import threading
 
 from .error import TMSiError, TMSiErrorCode
+from .device import ChannelType, ChannelTable
+from . import sample_data_server
 
 
 class FileFormat(Enum):
@@ -41,30 +48,89 @@ class FileWriter:
     """ <FileWriter> implements a file-writer for writing sample-data, captured
         during a measurement, to a specific file in a specific data-format.
 
+        Long recordings can be written as a sequence of segment-files. A new
+        segment is started when the current one exceeds 'segment_duration' or
+        'segment_size', or when rotate() is called. The hand-over between 2
+        segments is done between 2 sample-data-blocks, so no sample-set is lost
+        or written twice. The segments are listed in a manifest-file
+        <filename>-manifest.json, with per segment the index of its first
+        sample-set and the value of the COUNTER-channel at that sample-set.
+
         Args:
             data_format_type : <FileFormat> Specifies the data-format of the file.
             This can be poly5, gdf+ or gdf.
 
             filename : <string> The path and name of the file, into which the
             measurement-data must be written.
+
+            segment_duration : <float> Maximum duration of a segment in seconds.
+
+            segment_size : <int> Maximum size of a segment in bytes. The size is
+            estimated from the number of written samples (4 bytes per sample).
+
+            segmented : <bool> Write segment-files, also when no maximum duration
+            or size is given (the segments are then only rotated by rotate()).
+            Segments are not supported for the lsl-format.
+
+            sample_rate : <int> Sample rate of the stream, lower than the sample
+            rate of the device: the sample-data is decimated (anti-aliased)
+            before it is written. Only supported for the xdf- and lsl-format,
+            and not for segmented recordings.
     """
-    def __init__(self, data_format_type, filename, add_ch_locs=False):
-        if (data_format_type == FileFormat.poly5):
+    def __init__(self, data_format_type, filename, add_ch_locs=False, segment_duration=None, segment_size=None, segmented=False, sample_rate=None):
+        self._data_format_type = data_format_type
+        self._filename = filename
+        self._add_ch_locs = add_ch_locs
+        self._segment_duration = segment_duration
+        self._segment_size = segment_size
+        self._segmented = segmented or (segment_duration is not None) or (segment_size is not None)
+        self._segment_thread = None
+        self._sample_rate = sample_rate
+
+        if (sample_rate is not None) and (data_format_type not in (FileFormat.xdf, FileFormat.lsl)):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        if self._segmented:
+            if (data_format_type not in (FileFormat.poly5, FileFormat.xdf)) or (sample_rate is not None):
+                raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+            self._file_writer = None
+        else:
+            self._file_writer = self._create_file_writer(filename)
+
+    def _create_file_writer(self, filename):
+        if (self._data_format_type == FileFormat.poly5):
             from .file_formats.poly5_file_writer import Poly5Writer
-            self._data_format_type = data_format_type
-            self._file_writer = Poly5Writer(filename)
-        elif (data_format_type == FileFormat.xdf):
+            return Poly5Writer(filename)
+        elif (self._data_format_type == FileFormat.xdf):
             from .file_formats.xdf_file_writer import XdfWriter
-            self._data_format_type = data_format_type
-            self._file_writer = XdfWriter(filename, add_ch_locs)
-        elif (data_format_type == FileFormat.lsl):
+            return XdfWriter(filename, self._add_ch_locs, self._sample_rate)
+        elif (self._data_format_type == FileFormat.lsl):
             from .file_formats.lsl_stream_writer import LSLWriter
-            self._data_format_type = data_format_type
-            self._file_writer = LSLWriter(filename)
+            return LSLWriter(filename, self._sample_rate)
         else:
             print("Unsupported data format")
             raise TMSiError(TMSiErrorCode.api_incorrect_argument)
 
+    @property
+    def filename(self):
+        """ 'string' The name of the file that is currently written."""
+        if self._segmented:
+            return self._segment_thread.filename if self._segment_thread else None
+        return getattr(self._file_writer, 'filename', self._filename)
+
+    @property
+    def segments(self):
+        """ 'list of dict' The segments written so far, as listed in the manifest."""
+        if self._segment_thread is None:
+            return []
+        return self._segment_thread.get_segments()
+
+    @property
+    def manifest_filename(self):
+        """ 'string' The name of the manifest-file of a segmented recording."""
+        if not self._segmented:
+            return None
+        return os.path.splitext(self._filename)[0] + '-manifest.json'
+
     def open(self, device):
         """ Opens a file-writer session.
 
@@ -73,6 +139,12 @@ class FileWriter:
             Links a 'Device' to a 'Filewriter'-instance and prepares for the
             measurement that will start.
 
+            Instead of a 'Device', a producer of processed sample-data can be
+            given, like a 'Pipeline' (e.g. the RMS-envelope of the HD-EMG
+            plotter): an object with the 'id', 'channels' and 'sample_rate' of
+            the processed sample-data and the 'device' it processes. The
+            channels and sample rate of the producer are then written.
+
             In the open-method the file-writer-object will prepare for the receipt
             of sample-data from the 'Device' as next:
                 - Retrieve the configuration (e.g. channel-list, sample_rate) from the 'Device'
@@ -81,7 +153,16 @@ class FileWriter:
                 - Create a dedicated sampling-thread, which is responsible to
                   processes during the measurement the incoming sample-data.
         """
-        self._file_writer.open(device)
+        if not hasattr(device, 'config'):
+            device = _ProducerSource(device)
+            # The poly5-format only holds an integer sample rate
+            if (self._data_format_type == FileFormat.poly5) and (device.config.sample_rate != int(device.config.sample_rate)):
+                raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        if self._segmented:
+            self._segment_thread = _SegmentThread(self, device)
+            self._segment_thread.start()
+        else:
+            self._file_writer.open(device)
 
     def close(self):
         """ Closes an ongoing file-writer session.
@@ -89,4 +170,189 @@ class FileWriter:
             Must be called AFTER a measurement is stopped.
 
         """
-        self._file_writer.close()
\ No newline at end of file
+        if self._segmented:
+            self._segment_thread.stop()
+            self._segment_thread.join()
+        else:
+            self._file_writer.close()
+
+    def rotate(self):
+        """ Closes the current segment and continues in a new segment.
+
+            Only available for a segmented recording, during an open session.
+
+            Returns:
+                <string> The name of the closed segment-file.
+        """
+        if self._segment_thread is None:
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+        return self._segment_thread.rotate()
+
+_QUEUE_SIZE = 1000
+
+
+class _ProducerConfig:
+    """ The configuration of the device, with the sample rate of a producer."""
+    def __init__(self, config, sample_rate):
+        self._config = config
+        self.sample_rate = sample_rate
+
+    def get_sample_rate(self, chan_type):
+        return self.sample_rate
+
+    def __getattr__(self, name):
+        return getattr(self._config, name)
+
+
+class _ProducerSource:
+    """ A producer of processed sample-data (e.g. a <Pipeline>) as seen by a
+        file-writer: the device of the producer, with the id, channels and
+        sample rate of the producer.
+    """
+    def __init__(self, producer):
+        self._device = producer.device
+        self.producer = producer
+        self.id = producer.id
+        table = ChannelTable(producer.channels)
+        self.channels = list(table.channels)
+        self.channel_indices = table.indices
+        self.config = _ProducerConfig(producer.device.config, producer.sample_rate)
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+
+class _SegmentSource:
+    """ The device as seen by the file-writer of one segment: all properties are
+        those of the device, except for the id. Every segment gets its own
+        producer-id, so the segmenter decides which sample-data-blocks reach
+        which segment.
+    """
+    def __init__(self, device):
+        self._device = device
+        self.id = sample_data_server.createProducerId()
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+
+class _SegmentThread(threading.Thread):
+    """ Receives the sample-data of the device and forwards it to the
+        file-writer of the current segment. Segments are rotated between 2
+        sample-data-blocks.
+    """
+    def __init__(self, file_writer, device):
+        super(_SegmentThread, self).__init__(name = 'file-writer-segments : dev-id-' + str(device.id), daemon = True)
+        self._file_writer = file_writer
+        self._device = device
+        self._q = queue.Queue(_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self.sampling = True
+
+        self._sample_rate = device.config.sample_rate
+        self._num_channels = len(device.channels)
+        counter = device.channel_indices[ChannelType.counter]
+        self._counter_index = int(counter[-1]) if len(counter) else None
+
+        self._base, self._extension = os.path.splitext(file_writer._filename)
+        self._segments = []
+        self._segment_writer = None
+        self._num_sample_sets = 0
+        self._segment_num_sample_sets = 0
+        self._segment_start = None
+        self.filename = None
+
+        with self._lock:
+            self._open_segment()
+        sample_data_server.registerConsumer(device.id, self._q, 'file-writer-segments')
+
+    def run(self):
+        while self.sampling or not self._q.empty():
+            try:
+                sd = self._q.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            with self._lock:
+                if self._segment_limit_reached():
+                    self._close_segment()
+                    self._open_segment()
+                self._write(sd)
+
+        sample_data_server.unregisterConsumer(self._device.id, self._q)
+        with self._lock:
+            self._close_segment()
+
+    def stop(self):
+        self.sampling = False
+
+    def rotate(self):
+        with self._lock:
+            if (self._segment_writer is None) or not self.sampling:
+                raise TMSiError(TMSiErrorCode.api_invalid_command)
+            filename = self._close_segment()
+            self._open_segment()
+        return filename
+
+    def get_segments(self):
+        with self._lock:
+            return [dict(segment) for segment in self._segments]
+
+    def _segment_limit_reached(self):
+        if self._segment_num_sample_sets == 0:
+            return False
+        duration = self._file_writer._segment_duration
+        if (duration is not None) and (self._segment_num_sample_sets >= duration * self._sample_rate):
+            return True
+        size = self._file_writer._segment_size
+        if (size is not None) and (self._segment_num_sample_sets * self._num_channels * 4 >= size):
+            return True
+        return False
+
+    def _write(self, sd):
+        segment = self._segments[-1]
+        if (self._segment_num_sample_sets == 0):
+            segment['start_sample_set'] = self._num_sample_sets
+            segment['start_time'] = datetime.now().isoformat()
+            if (self._counter_index is not None) and (sd.num_sample_sets > 0):
+                counter = sd.samples[self._counter_index]
+                # A sample-set filled in for lost samples has no counter value
+                segment['start_counter'] = int(counter) if (counter == counter) else None
+            self._write_manifest()
+        sample_data_server.putSampleData(self._segment_source.id, sd, 'published-segment')
+        self._num_sample_sets += sd.num_sample_sets
+        self._segment_num_sample_sets += sd.num_sample_sets
+        segment['num_sample_sets'] = self._segment_num_sample_sets
+
+    def _open_segment(self):
+        index = len(self._segments) + 1
+        self._segment_source = _SegmentSource(self._device)
+        self._segment_writer = self._file_writer._create_file_writer('{}-{:04d}{}'.format(self._base, index, self._extension))
+        self._segment_writer.open(self._segment_source)
+        self._segment_num_sample_sets = 0
+        self.filename = self._segment_writer.filename
+        self._segments.append({'segment': index,
+                               'filename': os.path.basename(self.filename),
+                               'start_sample_set': self._num_sample_sets,
+                               'start_time': None,
+                               'start_counter': None,
+                               'num_sample_sets': 0})
+
+    def _close_segment(self):
+        filename = self.filename
+        if self._segment_writer is not None:
+            self._segment_writer.close()
+            self._segment_writer = None
+            self._write_manifest()
+        return filename
+
+    def _write_manifest(self):
+        manifest = {'format': self._file_writer._data_format_type.name,
+                    'sample_rate': self._sample_rate,
+                    'channels': [channel.name for channel in self._device.channels],
+                    'segments': self._segments}
+        try:
+            with open(self._file_writer.manifest_filename, 'w') as f:
+                json.dump(manifest, f, indent = 2)
+        except OSError as e:
+            print(e)
+            raise TMSiError(TMSiErrorCode.file_writer_error)
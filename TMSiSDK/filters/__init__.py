@@ -23,4 +23,6 @@ limitations under the License.
 
 '''
 
-from .real_time_filter import RealTimeFilter
\ No newline at end of file
+from .real_time_filter import RealTimeFilter
+from .pipeline import Pipeline, Stage, SosFilterStage, ButterworthStage, FirFilterStage, NotchStage, SpatialFilterStage, DecimationStage, BandPowerStage, RmsStage
+from . import montage, decimation
@@ -0,0 +1,123 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+TMSiSDK: Sample-data of a device at a reduced sample rate
+
+Consumers that need a lower sample rate than the device (e.g. a LSL-stream at
+250 Hz) register here instead of at the sample-data-server. Per device and
+sample rate one anti-aliased, decimated stream is computed, which is shared by
+all consumers of that rate. The stream is started with its first consumer and
+stopped with its last one.
+
+Usage:
+    decimation.registerConsumer(dev, q, 250, 'my-consumer')
+    dev.start_measurement()
+    ...
+    dev.stop_measurement()
+    decimation.unregisterConsumer(dev, q, 250)
+
+'''
+
+import threading
+
+from .. import sample_data_server
+from ..device import ChannelType
+from ..error import TMSiError, TMSiErrorCode
+from .pipeline import Pipeline, DecimationStage
+
+_lock = threading.Lock()
+# Per (device-id, decimation factor) the shared stream and its consumer queues
+_streams = {}
+
+class _DecimatedStream:
+    """ The decimated stream of one device and sample rate."""
+    def __init__(self, device, factor):
+        self.pipeline = Pipeline(device, [DecimationStage(factor, ch_types = [t.name for t in ChannelType \
+                                                                         if t.value < ChannelType.status.value])],
+                                 name = 'decimation-' + str(factor), controls_measurement = False)
+        self.queues = []
+
+def _factor(device, sample_rate):
+    device_rate = device.config.get_sample_rate(ChannelType.counter)
+    factor = device_rate / sample_rate
+    if (factor != int(factor)) or (factor < 1):
+        raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+    return int(factor)
+
+def registerConsumer(device, q, sample_rate, name = None):
+    """ Registers a consumer-queue to receive the sample-data of a device at
+        a reduced sample rate. Must be called before the measurement is started.
+
+        Args:
+            device: <Device> The device.
+
+            q: <queue> The queue into which received sample-data will be put.
+
+            sample_rate: <int> The sample rate; the sample rate of the device
+                         must be an integer multiple of it.
+
+            name: <string> Optional name of the consumer.
+
+        Returns:
+            <int> The producer id of the sample-data that is put into the queue:
+            the id of the device when no decimation is needed.
+    """
+    factor = _factor(device, sample_rate)
+    if factor == 1:
+        sample_data_server.registerConsumer(device.id, q, name)
+        return device.id
+
+    with _lock:
+        key = (device.id, factor)
+        if key not in _streams:
+            stream = _DecimatedStream(device, factor)
+            stream.pipeline.start()
+            _streams[key] = stream
+        stream = _streams[key]
+        sample_data_server.registerConsumer(stream.pipeline.id, q, name)
+        stream.queues.append(q)
+        return stream.pipeline.id
+
+def unregisterConsumer(device, q, sample_rate):
+    """ Unregisters a consumer-queue that was registered with registerConsumer().
+
+        Args:
+            device: <Device> The device.
+
+            q: <queue> The queue to remove.
+
+            sample_rate: <int> The sample rate the queue was registered for.
+    """
+    factor = _factor(device, sample_rate)
+    if factor == 1:
+        sample_data_server.unregisterConsumer(device.id, q)
+        return
+
+    with _lock:
+        key = (device.id, factor)
+        stream = _streams[key]
+        sample_data_server.unregisterConsumer(stream.pipeline.id, q)
+        stream.queues.remove(q)
+        if not stream.queues:
+            stream.pipeline.stop()
+            del _streams[key]
@@ -0,0 +1,148 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+TMSiSDK: Streaming linear-phase FIR-filters
+
+A linear-phase FIR-filter does not distort the phase of the signal: all
+frequencies are delayed by the same group delay of (num_taps - 1) / 2 samples.
+Long FIR-filters are applied with FFT-convolution (overlap-save): every block
+is convolved in one FFT of the block and the history of the filter, for all
+channels at once. Short filters are applied with direct convolution.
+
+'''
+
+import numpy as np
+from scipy import signal, fft
+
+from ..error import TMSiError, TMSiErrorCode
+
+def design_fir(sample_rate, Fc_hp = None, Fc_lp = None, num_taps = None):
+    """ Designs a linear-phase FIR-filter with a Hamming-window: a high-pass
+        filter when only Fc_hp is given, a low-pass filter when only Fc_lp is
+        given and a band-pass filter when both are given.
+
+        Args:
+            sample_rate: <int> The sample rate.
+
+            Fc_hp, Fc_lp: <float> The cut-off frequencies in Hz.
+
+            num_taps: <int> The length of the filter. By default the length
+                      gives a transition band of a quarter of the lowest
+                      cut-off frequency wide, but at least 2 Hz and at most
+                      the lowest cut-off frequency.
+
+        Returns:
+            <array> The taps of the filter, which has an odd length.
+    """
+    if not (Fc_hp or Fc_lp):
+        raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+    if not num_taps:
+        lowest = min(f for f in (Fc_hp, Fc_lp) if f)
+        transition = min(max(0.25 * lowest, 2.0), lowest)
+        num_taps = int(np.ceil(3.3 * sample_rate / transition))
+    # An odd length gives a delay of a whole number of samples and is needed
+    # for a high-pass filter
+    num_taps = int(num_taps) | 1
+
+    if Fc_hp and Fc_lp:
+        return signal.firwin(num_taps, [Fc_hp, Fc_lp], pass_zero=False, fs=sample_rate)
+    elif Fc_hp:
+        return signal.firwin(num_taps, Fc_hp, pass_zero=False, fs=sample_rate)
+    return signal.firwin(num_taps, Fc_lp, fs=sample_rate)
+
+def use_fft(num_taps, block_size):
+    """ Returns True when FFT-convolution of a block of block_size samples is
+        expected to be faster than direct convolution with num_taps taps.
+    """
+    # Direct convolution recomputes the history of the filter with every
+    # block; an FFT-convolution costs a forward and inverse real FFT. The
+    # factor and the fixed cost of a direct convolution per block are
+    # measured ratios to the cost of a multiply-add of the direct convolution.
+    length = num_taps - 1 + block_size
+    direct_cost = length * num_taps + 2000
+    fft_cost = 2.0 * fft.next_fast_len(length, real=True) * np.log2(max(length, 2))
+    return fft_cost < direct_cost
+
+class FirFilter:
+    """ Streaming FIR-filter for blocks of (channels, samples). The last
+        num_taps - 1 samples of every channel are kept between blocks. The
+        convolution method is chosen per block size, unless it is forced with
+        method ('direct' or 'fft').
+
+        The filter has the next properties:
+
+        taps: <array> The taps of the filter.
+
+        group_delay: <float> The delay of the filter in samples.
+    """
+    def __init__(self, taps, method = 'auto'):
+        if method not in ('auto', 'direct', 'fft'):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        self.taps = np.asarray(taps, dtype=float)
+        self.method = method
+        self.group_delay = (len(self.taps) - 1) / 2
+        self._spectra = {}
+        self._methods = {}
+        self.reset()
+
+    def reset(self):
+        """ Clears the history of the filter."""
+        self._history = None
+
+    def uses_fft(self, block_size):
+        """ Returns True when blocks of block_size samples are convolved with FFTs."""
+        if self.method != 'auto':
+            return self.method == 'fft'
+        if block_size not in self._methods:
+            self._methods[block_size] = use_fft(len(self.taps), block_size)
+        return self._methods[block_size]
+
+    def process(self, x):
+        """ Filters one block.
+
+            Args:
+                x: <array> (channels, samples) array.
+
+            Returns:
+                <array> (channels, samples) array with the filtered block.
+        """
+        num_history = len(self.taps) - 1
+        num_samples = x.shape[1]
+        if self._history is None:
+            # Start as if the first sample was always there, so an offset does
+            # not cause a transient
+            self._history = np.repeat(x[:, :1], num_history, axis=1).astype(float)
+        x_ext = np.concatenate((self._history, x), axis=1)
+        self._history = x_ext[:, x_ext.shape[1] - num_history:]
+
+        if self.uses_fft(num_samples):
+            # Overlap-save: the first num_history outputs wrap around and are
+            # discarded, the last num_samples outputs are the filtered block
+            length = fft.next_fast_len(x_ext.shape[1], real=True)
+            if length not in self._spectra:
+                self._spectra[length] = fft.rfft(self.taps, length)
+            spectrum = fft.rfft(x_ext, length, axis=1)
+            spectrum *= self._spectra[length]
+            y = fft.irfft(spectrum, length, axis=1)
+            return y[:, num_history:num_history + num_samples]
+        return signal.lfilter(self.taps, 1.0, x_ext, axis=1)[:, num_history:]
@@ -0,0 +1,173 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+TMSiSDK: Montages for the spatial filter stage of the processing pipeline
+
+A montage is a function that builds the montage matrix for a list of channels:
+
+    matrix, names = montage(channels, bad)
+
+The matrix has one row per output channel and one column per input channel,
+names holds the names of the output channels. Bad channels (positions in the
+list of channels) are left out of the references and their output is zero.
+The matrix built without bad channels holds all non-zero positions of the
+matrices with bad channels, so excluding channels only changes its values.
+
+'''
+
+import re
+from os.path import join
+
+import numpy as np
+from scipy import sparse
+
+from .. import TMSiSDK_dir
+from ..error import TMSiError, TMSiErrorCode
+
+# Channels that hold the reference of the device: they are passed on unchanged
+# and are never part of a reference that is computed by a montage
+_REFERENCE_NAMES = ('CREF',)
+
+def _normalise(name):
+    # 'UNI 01', 'UNI 1' and 'uni1' all refer to the same channel
+    return re.sub(r'\s+|(?<!\d)0+(?=\d)', '', name).lower()
+
+def _read_headcap(filename = None):
+    # Per channel the default name, the EEG-name and the location
+    if filename is None:
+        filename = join(TMSiSDK_dir, '_resources', 'EEGchannelsTMSi3D.txt')
+    headcap = []
+    with open(filename) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 5:
+                headcap.append((fields[0], fields[1], np.array([float(v) for v in fields[2:5]])))
+    return headcap
+
+def read_channel_locations(filename = None):
+    """ Reads the 3D-locations of the EEG-channels.
+
+        Args:
+            filename: <string> Tab-separated file with per channel the default
+                      name, EEG-name and X-, Y- and Z-coordinate. By default
+                      the locations of the TMSi EEG-headcaps are read.
+
+        Returns:
+            <dict> per channel name the location as <array> (X, Y, Z). Every
+            location can be found by both its default name (e.g. 'UNI 01') and
+            its EEG-name (e.g. 'Fp1').
+    """
+    locations = {}
+    for default_name, eeg_name, location in _read_headcap(filename):
+        locations[_normalise(default_name)] = location
+        locations[_normalise(eeg_name)] = location
+    return locations
+
+def _channel_positions(channels):
+    # Per channel name the position in the list of channels. Channels can be
+    # found by their name and, for EEG-channels, by both their default name
+    # and their EEG-name
+    positions = {_normalise(ch.name): i for i, ch in enumerate(channels)}
+    for default_name, eeg_name, location in _read_headcap():
+        default_name = _normalise(default_name)
+        eeg_name = _normalise(eeg_name)
+        if (default_name in positions) and (eeg_name not in positions):
+            positions[eeg_name] = positions[default_name]
+        elif (eeg_name in positions) and (default_name not in positions):
+            positions[default_name] = positions[eeg_name]
+    return positions
+
+def common_average(channels, bad = ()):
+    """ Common average reference: the mean of all good channels is subtracted
+        from every channel.
+    """
+    num_channels = len(channels)
+    is_reference = [ch.name in _REFERENCE_NAMES for ch in channels]
+    good = [i for i in range(num_channels) if i not in bad and not is_reference[i]]
+    if not good:
+        raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+
+    matrix = np.eye(num_channels)
+    for i in range(num_channels):
+        if is_reference[i]:
+            continue
+        if i in bad:
+            matrix[i, i] = 0.0
+        else:
+            matrix[i, good] -= 1.0 / len(good)
+    return matrix, [ch.name for ch in channels]
+
+def laplacian(channels, bad = (), num_neighbours = 4, locations = None):
+    """ Surface Laplacian: the mean of the nearest good neighbours is
+        subtracted from every channel. The neighbours are the num_neighbours
+        closest channels on the headcap; bad neighbours are left out of the
+        mean. Channels without a known location are passed on unchanged.
+
+        Args:
+            locations: <dict> per channel name its location, see
+                       read_channel_locations(), which is used by default.
+    """
+    if locations is None:
+        locations = read_channel_locations()
+    else:
+        locations = {_normalise(name): np.asarray(loc) for name, loc in locations.items()}
+
+    num_channels = len(channels)
+    located = [i for i, ch in enumerate(channels) \
+               if _normalise(ch.name) in locations and ch.name not in _REFERENCE_NAMES]
+    positions = np.array([locations[_normalise(channels[i].name)] for i in located]).reshape(-1, 3)
+    distances = np.linalg.norm(positions[:, np.newaxis, :] - positions[np.newaxis, :, :], axis = 2)
+
+    matrix = sparse.lil_matrix((num_channels, num_channels))
+    for i in range(num_channels):
+        if i not in bad:
+            matrix[i, i] = 1.0
+    for k, i in enumerate(located):
+        if i in bad:
+            continue
+        # The nearest channels, excluding the channel itself
+        neighbours = [located[j] for j in np.argsort(distances[k])[1:num_neighbours + 1]]
+        neighbours = [j for j in neighbours if j not in bad]
+        for j in neighbours:
+            matrix[i, j] = -1.0 / len(neighbours)
+    return matrix.tocsr(), [ch.name for ch in channels]
+
+def bipolar(channels, bad = (), pairs = ()):
+    """ Bipolar montage: one output channel per pair of channel names
+        (a, b) with the difference a - b, named 'a-b'. EEG-channels can be
+        given by their default name (e.g. 'UNI 01') or EEG-name (e.g. 'Fp1').
+        The output of a pair with a bad channel is zero.
+    """
+    index = _channel_positions(channels)
+    matrix = sparse.lil_matrix((len(pairs), len(channels)))
+    names = []
+    for row, (a, b) in enumerate(pairs):
+        if (_normalise(a) not in index) or (_normalise(b) not in index):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        i = index[_normalise(a)]
+        j = index[_normalise(b)]
+        if (i not in bad) and (j not in bad):
+            matrix[row, i] = 1.0
+            matrix[row, j] = -1.0
+        names.append(a + '-' + b)
+    return matrix.tocsr(), names
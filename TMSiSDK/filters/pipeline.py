@@ -0,0 +1,910 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+TMSiSDK: Real-time processing pipeline of stateful DSP-stages
+
+A <Pipeline> receives the sample-data of a device, passes every block through
+a chain of stages and publishes the result to the sample-data-server under its
+own producer id (Pipeline.id). All stages run in one thread on a single
+float32-array of (channels, sample-sets) per block: no queues or copies are
+needed between the stages.
+
+Usage:
+    pipeline = filters.Pipeline(dev, [filters.ButterworthStage(Fc_hp=1, Fc_lp=100)])
+    sample_data_server.registerConsumer(pipeline.id, q)
+    pipeline.start()
+    ...
+    pipeline.stop()
+    print(pipeline.get_statistics())
+
+A stage is a subclass of <Stage>. It keeps its own state between blocks and
+may change the channels (e.g. a montage) or the sample rate (e.g. a
+decimation) of the data it passes on.
+
+'''
+
+import queue
+import threading
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal, sparse, fft
+
+from .. import sample_data, sample_data_server, latency_monitor
+from ..device import ChannelType, DeviceChannel
+from ..error import TMSiError, TMSiErrorCode
+from .real_time_filter import notch_sos
+from .fir import FirFilter, design_fir
+from . import montage as _montage
+
+# Channel types that are processed when a stage does not specify its channel types
+_ANALOGUE_TYPES = ('UNI', 'BIP', 'AUX')
+
+def _channel_rows(indices):
+    # Consecutive channels are addressed with a slice instead of an index
+    # array, so gathering and scattering them are views and plain copies
+    indices = np.asarray(indices, dtype=int)
+    if indices.size and np.all(np.diff(indices) == 1):
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+    return indices
+
+class Stage:
+    """ Base class of a processing stage of a <Pipeline>.
+
+        A stage is configured with the channels and sample rate of its input
+        before the first block is processed. Next to that, every block is
+        passed to process() as a float32-array of (channels, sample-sets).
+
+        The stage has the next properties:
+
+        name: <string> Name of the stage, used in the timing statistics.
+
+        ch_types: <list> The channel types ('UNI', 'BIP', 'AUX', 'sensor',
+                  'status' or 'counter') processed by the stage. By default
+                  the analogue channels (UNI, BIP and AUX) are processed.
+
+        rows: <slice> or <array> The rows of the block that are processed,
+              derived from ch_types when the stage is configured.
+
+        positions: <array> Set by process() of stages that change the number
+                   of sample-sets: per output sample-set the index of the
+                   input sample-set it is aligned with, relative to the
+                   last input block (negative for earlier blocks). None when
+                   every input sample-set gives one output sample-set.
+    """
+    def __init__(self, ch_types = None, name = None):
+        self.name = name if name else type(self).__name__
+        self.ch_types = list(ch_types) if ch_types else list(_ANALOGUE_TYPES)
+        self.rows = None
+        self.num_rows = 0
+        self.positions = None
+
+    def configure(self, channels, sample_rate):
+        """ Prepares the stage for the channels and sample rate of its input
+            and resets its state.
+
+            Args:
+                channels: <list of DeviceChannel> The channels of the input.
+
+                sample_rate: <int> The sample rate of the input.
+
+            Returns:
+                <tuple> The channels and sample rate of the output. The base
+                class passes both on unchanged.
+        """
+        for ch_type in self.ch_types:
+            if ch_type not in ChannelType.__members__:
+                raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        indices = [idx for idx, ch in enumerate(channels) if ch.type.name in self.ch_types]
+        self.rows = _channel_rows(indices)
+        self.num_rows = len(indices)
+        self.sample_rate = sample_rate
+        self.reset()
+        return channels, sample_rate
+
+    def reset(self):
+        """ Resets the state of the stage, e.g. after a gap in the data."""
+        pass
+
+    def process(self, samples):
+        """ Processes one block of sample-data.
+
+            Args:
+                samples: <array> float32-array of (channels, sample-sets). The
+                         stage may modify the array in place.
+
+            Returns:
+                <array> float32-array of (channels, sample-sets) of the output.
+        """
+        raise NotImplementedError
+
+class SosFilterStage(Stage):
+    """ IIR-filter, in second-order sections, that is applied to the channels
+        of the stage. The filter state is kept between blocks and initialised
+        on the first sample of the first block, so an offset does not cause a
+        transient.
+        The coefficients and state are kept in double precision: sections
+        with a low cut-off frequency relative to the sample rate are too
+        ill-conditioned for float32. The block itself stays float32.
+    """
+    def __init__(self, sos = None, ch_types = None, name = None):
+        super().__init__(ch_types, name)
+        self.sos = sos
+        self._z_sos = None
+
+    def configure(self, channels, sample_rate):
+        channels, sample_rate = super().configure(channels, sample_rate)
+        self._zi = None
+        if self.sos is not None:
+            self.sos = np.asarray(self.sos, dtype=np.float64)
+            self._zi = signal.sosfilt_zi(self.sos)
+        return channels, sample_rate
+
+    def reset(self):
+        self._z_sos = None
+
+    def process(self, samples):
+        if self.sos is None or not self.num_rows:
+            return samples
+        x = samples[self.rows]
+        if self._z_sos is None:
+            self._z_sos = self._zi[:, np.newaxis, :] * x[np.newaxis, :, 0, np.newaxis]
+        samples[self.rows], self._z_sos = signal.sosfilt(self.sos, x, zi=self._z_sos)
+        return samples
+
+class ButterworthStage(SosFilterStage):
+    """ Butterworth filter with the given order and cut-off frequency or
+        frequencies, like the filters of the <RealTimeFilter>: a high-pass
+        filter when only Fc_hp is given, a low-pass filter when only Fc_lp is
+        given and a band-pass filter when both are given.
+    """
+    def __init__(self, order = 2, Fc_hp = None, Fc_lp = None, ch_types = None, name = None):
+        if not (Fc_hp or Fc_lp):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        super().__init__(None, ch_types, name)
+        self.order = order
+        self.Fc_hp = Fc_hp
+        self.Fc_lp = Fc_lp
+
+    def configure(self, channels, sample_rate):
+        if self.Fc_hp and self.Fc_lp:
+            self.sos = signal.butter(self.order, [self.Fc_hp, self.Fc_lp], 'bandpass', fs=sample_rate, output='sos')
+        elif self.Fc_hp:
+            self.sos = signal.butter(self.order, self.Fc_hp, 'highpass', fs=sample_rate, output='sos')
+        else:
+            self.sos = signal.butter(self.order, self.Fc_lp, 'lowpass', fs=sample_rate, output='sos')
+        return super().configure(channels, sample_rate)
+
+class FirFilterStage(Stage):
+    """ Linear-phase FIR-filter that is applied to the channels of the stage:
+        a high-pass filter when only Fc_hp is given, a low-pass filter when
+        only Fc_lp is given and a band-pass filter when both are given, or the
+        given taps. Long filters are applied with FFT-convolution (overlap-
+        save), short filters with direct convolution; the method is chosen
+        per block size unless it is forced with method ('direct' or 'fft').
+
+        The stage has the next properties:
+
+        group_delay: <float> The delay of the filter in seconds, which is the
+                     same for all frequencies.
+    """
+    def __init__(self, Fc_hp = None, Fc_lp = None, num_taps = None, taps = None, method = 'auto', ch_types = None, name = None):
+        if taps is None and not (Fc_hp or Fc_lp):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        super().__init__(ch_types, name)
+        self.Fc_hp = Fc_hp
+        self.Fc_lp = Fc_lp
+        self.num_taps = num_taps
+        self.taps = taps
+        self.method = method
+        self._fir = None
+
+    @property
+    def group_delay(self):
+        return self._fir.group_delay / self.sample_rate if self._fir else None
+
+    def configure(self, channels, sample_rate):
+        taps = self.taps
+        if (self.Fc_hp or self.Fc_lp):
+            taps = design_fir(sample_rate, self.Fc_hp, self.Fc_lp, self.num_taps)
+        self._fir = FirFilter(taps, self.method)
+        return super().configure(channels, sample_rate)
+
+    def reset(self):
+        if self._fir:
+            self._fir.reset()
+
+    def process(self, samples):
+        if self.num_rows:
+            samples[self.rows] = self._fir.process(samples[self.rows])
+        return samples
+
+class NotchStage(SosFilterStage):
+    """ Notch filter bank for the power-line frequency Fc (50 or 60 Hz) and its
+        harmonics: notches at Fc, 2*Fc, ... harmonics*Fc with the same
+        bandwidth of Fc/Q Hz. All notches are cascaded into one filter, which
+        is applied to all channels of the stage in a single pass. By default
+        the UNI and BIP channels are filtered.
+    """
+    def __init__(self, Fc = 50, harmonics = 1, Q = 30, ch_types = None, name = None):
+        super().__init__(None, ch_types if ch_types else ['UNI', 'BIP'], name)
+        self.Fc = Fc
+        self.harmonics = harmonics
+        self.Q = Q
+
+    def configure(self, channels, sample_rate):
+        self.sos = notch_sos(self.Fc, sample_rate, self.harmonics, self.Q)
+        return super().configure(channels, sample_rate)
+
+class SpatialFilterStage(Stage):
+    """ Spatial filter: the channels of the stage are replaced by the product
+        of the montage matrix and these channels, computed with one matrix
+        multiplication per block. Sparse montages (e.g. a Laplacian or bipolar
+        montage) are multiplied as a sparse matrix, dense montages (e.g. a
+        common average reference) with BLAS. By default the UNI channels are
+        filtered. When the montage has another number of output channels, the
+        output channels take the place of the channels of the stage.
+
+        Args:
+            montage: A montage function of the <montage>-module, e.g.
+                     montage.common_average (the default), montage.laplacian
+                     or montage.bipolar. A matrix of (output channels, channels
+                     of the stage) can be given instead.
+
+            bad_channels: <list> Names of channels that are left out of the
+                          montage, see set_bad_channels(). EEG-channels can be
+                          given by their default name or EEG-name.
+
+            montage_args: Further arguments of the montage function, e.g.
+                          pairs=[('Fp1', 'F3')] for montage.bipolar.
+    """
+    # Montages with a larger fraction of non-zero values are multiplied dense
+    _MAX_SPARSE_DENSITY = 0.25
+
+    def __init__(self, montage = None, ch_types = None, bad_channels = (), name = None, **montage_args):
+        super().__init__(ch_types if ch_types else ['UNI'], name)
+        self.montage = montage if montage is not None else _montage.common_average
+        self.montage_args = montage_args
+        self.bad_channels = list(bad_channels)
+        self._lock = threading.Lock()
+
+    def _build(self, bad):
+        if callable(self.montage):
+            matrix, names = self.montage(self._channels, bad, **self.montage_args)
+        else:
+            # A given matrix: bad channels are left out of all outputs and 
+            # the outputs with the same position are zero
+            matrix = sparse.csr_matrix(self.montage) if sparse.issparse(self.montage) else np.array(self.montage, dtype=float)
+            if bad:
+                keep = np.ones(matrix.shape[1])
+                keep[list(bad)] = 0.0
+                rows = np.ones(matrix.shape[0])
+                rows[[i for i in bad if i < matrix.shape[0]]] = 0.0
+                matrix = sparse.diags(rows) @ matrix @ sparse.diags(keep)
+            names = [ch.name for ch in self._channels[:matrix.shape[0]]]
+            names += ['S' + str(i + 1) for i in range(len(names), matrix.shape[0])]
+        if matrix.shape[1] != len(self._channels):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        return matrix, names
+
+    def _bad_positions(self):
+        positions = _montage._channel_positions(self._channels)
+        return {positions[_montage._normalise(name)] for name in self.bad_channels \
+                if _montage._normalise(name) in positions}
+
+    def configure(self, channels, sample_rate):
+        super().configure(channels, sample_rate)
+        indices = np.arange(len(channels))[self.rows] if self.num_rows else np.array([], dtype=int)
+        self._channels = [channels[i] for i in indices]
+
+        # The matrix without bad channels holds all non-zero positions, so 
+        # excluding channels later on only changes its values
+        matrix, names = self._build(set())
+        num_values = matrix.count_nonzero() if sparse.issparse(matrix) else np.count_nonzero(matrix)
+        if num_values > self._MAX_SPARSE_DENSITY * matrix.shape[0] * matrix.shape[1]:
+            self._matrix = np.asarray(matrix.todense() if sparse.issparse(matrix) else matrix, dtype=np.float32)
+        else:
+            self._matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+            self._matrix.sort_indices()
+            coo = self._matrix.tocoo()
+            self._pattern = (coo.row, coo.col)
+        self.set_bad_channels(self.bad_channels)
+
+        # The output channels take the place of the channels of the stage
+        num_out = len(names)
+        first = int(indices[0]) if indices.size else len(channels)
+        others = [i for i in range(len(channels)) if i not in set(indices.tolist())]
+        before = [i for i in others if i < first]
+        after = [i for i in others if i >= first]
+        self._in_place = (num_out == len(indices)) and isinstance(self.rows, slice)
+        self._out_rows = slice(len(before), len(before) + num_out)
+        self._others_in = np.array(before + after, dtype=int)
+        self._others_out = np.array(list(range(len(before))) + list(range(len(before) + num_out, len(others) + num_out)), dtype=int)
+
+        unit_name = self._channels[0].unit_name if self._channels else ''
+        ch_type = self._channels[0].type if self._channels else ChannelType.UNI
+        outputs = [DeviceChannel(ch_type, sample_rate, name, unit_name, True) for name in names]
+        return [channels[i] for i in before] + outputs + [channels[i] for i in after], sample_rate
+
+    def set_bad_channels(self, bad_channels):
+        """ Sets the channels that are left out of the montage, e.g. of the
+            common average. The output of a bad channel is zero. Only the
+            values of the montage matrix are updated, so this can be done
+            while the pipeline is running.
+
+            Args:
+                bad_channels: <list> The names of the bad channels.
+        """
+        self.bad_channels = list(bad_channels)
+        if self.rows is None:
+            return
+        matrix, names = self._build(self._bad_positions())
+        with self._lock:
+            if isinstance(self._matrix, np.ndarray):
+                self._matrix[...] = matrix.todense() if sparse.issparse(matrix) else matrix
+            else:
+                matrix = sparse.csr_matrix(matrix)
+                values = np.asarray(matrix[self._pattern[0], self._pattern[1]]).ravel()
+                if np.count_nonzero(values) != matrix.count_nonzero():
+                    # Not within the non-zero positions of the montage
+                    raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+                self._matrix.data[:] = values
+
+    def process(self, samples):
+        if not self.num_rows:
+            return samples
+        with self._lock:
+            spatial = self._matrix @ samples[self.rows]
+        if self._in_place:
+            samples[self.rows] = spatial
+            return samples
+        output = np.empty((self._others_out.size + spatial.shape[0], samples.shape[1]), dtype=np.float32)
+        output[self._out_rows] = spatial
+        output[self._others_out] = samples[self._others_in]
+        return output
+
+class DecimationStage(Stage):
+    """ Anti-aliased decimation by an integer factor. The channels of the stage
+        are low-pass filtered with a linear-phase FIR-filter, which is only
+        evaluated for the sample-sets that are kept (polyphase). The other
+        channels, like STATUS and COUNTER, are not filtered: they are picked
+        with the delay of the filter, so they stay aligned with the filtered
+        channels. By default all analogue channels are filtered.
+
+        Args:
+            factor: <int> The decimation factor.
+
+            num_taps: <int> The length of the FIR-filter, by default 
+                      20 * factor + 1 (as scipy.signal.decimate). The delay of
+                      the filter is (num_taps - 1) / 2 input sample-sets.
+
+        The first output sample-set is aligned with the first input
+        sample-set, so the COUNTER-channel of the output starts at the first
+        COUNTER-value of the input and increases by factor per sample-set.
+        Before the first sample-set, the filter is started as if the first
+        sample-set was always there.
+    """
+    def __init__(self, factor, num_taps = None, ch_types = None, name = None):
+        if (int(factor) != factor) or (factor < 1):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        super().__init__(ch_types, name)
+        self.factor = int(factor)
+        # An odd length gives a delay of a whole number of sample-sets
+        self.num_taps = (num_taps if num_taps else 20 * self.factor + 1) | 1
+        taps = signal.firwin(self.num_taps, 1.0 / self.factor, window='hamming')
+        # Reversed, so the filter is a dot-product with the input window
+        self._taps = np.ascontiguousarray(taps[::-1], dtype=np.float32)
+        self._history = None
+
+    def configure(self, channels, sample_rate):
+        super().configure(channels, sample_rate)
+        if isinstance(self.rows, slice):
+            selected = np.arange(len(channels))[self.rows]
+        else:
+            selected = np.asarray(self.rows, dtype=int)
+        self._others = np.setdiff1d(np.arange(len(channels)), selected)
+
+        rate = sample_rate / self.factor
+        rate = int(rate) if rate == int(rate) else rate
+        outputs = [DeviceChannel(ch.type, rate, ch.name, ch.unit_name, True, ch.sensor) for ch in channels]
+        return outputs, rate
+
+    def reset(self):
+        self._history = None
+        self._next = 0
+
+    def process(self, samples):
+        num_history = self.num_taps - 1
+        if self._history is None:
+            # Start as if the first sample-set was always there, so an offset
+            # does not cause a transient. The first kept sample-set is the one
+            # whose window is centred on the first input sample-set
+            self._history = np.repeat(samples[:, :1], num_history, axis=1)
+            self._next = num_history + num_history // 2
+        x = np.concatenate((self._history, samples), axis=1)
+
+        # Positions in x of the kept sample-sets: a window of num_taps input
+        # sample-sets ends at every position
+        positions = np.arange(self._next, x.shape[1], self.factor)
+        output = np.empty((samples.shape[0], positions.size), dtype=np.float32)
+        if positions.size:
+            if self.num_rows:
+                windows = sliding_window_view(x[self.rows], self.num_taps, axis=1)
+                windows = windows[:, positions[0] - num_history::self.factor]
+                output[self.rows] = windows @ self._taps
+            output[self._others] = x[self._others][:, positions - num_history // 2]
+            self._next = positions[-1] + self.factor
+        self._next -= samples.shape[1]
+        # The output is aligned with the centre of the windows
+        self.positions = positions - num_history // 2 - num_history
+        self._history = x[:, x.shape[1] - num_history:].copy()
+        return output
+
+class BandPowerStage(Stage):
+    """ Sliding-window spectral stage: every hop seconds the power in the
+        frequency bands of the channels of the stage is computed over the last
+        window seconds, with Welch's method (Hann-windowed segments of
+        segment seconds with 50% overlap, from which their mean is
+        subtracted, like scipy.signal.welch). The segments of all channels are
+        transformed with one batched real FFT and the band powers are summed
+        with one multiplication by a precomputed (frequencies, bands) matrix.
+
+        The output holds per channel of the stage and per band a channel
+        named '<channel> <band>', followed by the other channels (e.g.
+        STATUS and COUNTER) at the end of the window. The sample rate of the
+        output is 1 / hop. No output is given until the first window is full.
+
+        Args:
+            bands: <dict> per band name the (low, high) frequencies in Hz, by
+                   default the EEG-bands delta, theta, alpha, beta and gamma.
+
+            window: <float> The length of the window in seconds.
+
+            hop: <float> The time between two outputs in seconds.
+
+            segment: <float> The length of the Welch-segments in seconds, by
+                     default the length of the window (a single segment).
+    """
+    EEG_BANDS = {'delta': (1, 4), 'theta': (4, 8), 'alpha': (8, 13), 'beta': (13, 30), 'gamma': (30, 45)}
+
+    def __init__(self, bands = None, window = 1.0, hop = 0.25, segment = None, ch_types = None, name = None):
+        super().__init__(ch_types, name)
+        self.bands = dict(bands) if bands else dict(self.EEG_BANDS)
+        self.window = window
+        self.hop = hop
+        self.segment = segment if segment else window
+
+    def configure(self, channels, sample_rate):
+        super().configure(channels, sample_rate)
+        if isinstance(self.rows, slice):
+            selected = np.arange(len(channels))[self.rows]
+        else:
+            selected = np.asarray(self.rows, dtype=int)
+        self._others = np.setdiff1d(np.arange(len(channels)), selected)
+
+        self._num_window = int(round(self.window * sample_rate))
+        self._num_hop = int(round(self.hop * sample_rate))
+        self._num_segment = min(int(round(self.segment * sample_rate)), self._num_window)
+        if (self._num_hop < 1) or (self._num_segment < 2):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        self._num_step = max(self._num_segment // 2, 1)
+        self._num_segments = (self._num_window - self._num_segment) // self._num_step + 1
+
+        # The Hann-window of a segment, scaled so the squared magnitude of the
+        # FFT is a one-sided power spectral density averaged over the segments
+        self._taper = signal.get_window('hann', self._num_segment).astype(np.float32)
+        frequencies = np.fft.rfftfreq(self._num_segment, 1.0 / sample_rate)
+        scale = np.full(frequencies.size, 2.0 / (sample_rate * np.sum(self._taper ** 2) * self._num_segments))
+        scale[0] /= 2
+        if self._num_segment % 2 == 0:
+            scale[-1] /= 2
+
+        # Band power: the sum of the density over the frequencies of the band
+        df = frequencies[1] - frequencies[0]
+        self._band_matrix = np.zeros((frequencies.size, len(self.bands)), dtype=np.float32)
+        for b, (low, high) in enumerate(self.bands.values()):
+            mask = (frequencies >= low) & (frequencies < high)
+            self._band_matrix[mask, b] = scale[mask] * df
+
+        rate = sample_rate / self._num_hop
+        outputs = [DeviceChannel(channels[i].type, rate, channels[i].name + ' ' + band, channels[i].unit_name + '²', True) \
+                   for i in selected for band in self.bands]
+        outputs += [DeviceChannel(channels[i].type, rate, channels[i].name, channels[i].unit_name, True, channels[i].sensor) \
+                    for i in self._others]
+        self._num_channels = len(channels)
+        self.reset()
+        return outputs, rate
+
+    def reset(self):
+        # Mirrored ring buffer: every sample-set is written twice, so the
+        # window is always a contiguous view
+        self._buffer = np.zeros((getattr(self, '_num_channels', 0), 2 * getattr(self, '_num_window', 0)), dtype=np.float32)
+        self._write = 0
+        self._filled = 0
+        self._until_hop = getattr(self, '_num_hop', 0)
+
+    def _band_powers(self, window):
+        segments = sliding_window_view(window[self.rows], self._num_segment, axis=1)[:, ::self._num_step][:, :self._num_segments]
+        # Remove the offset of every segment, the leakage of an offset through
+        # the taper would otherwise add to the power of the lowest bands
+        segments = segments - segments.mean(axis=2, keepdims=True)
+        spectra = fft.rfft(segments * self._taper, axis=2)
+        power = (spectra.real ** 2 + spectra.imag ** 2).sum(axis=1)
+        return (power @ self._band_matrix).ravel()
+
+    def process(self, samples):
+        outputs = []
+        ends = []
+        num_window = self._num_window
+        pos = 0
+        num_samples = samples.shape[1]
+        while pos < num_samples:
+            count = min(num_samples - pos, self._until_hop, num_window - self._write)
+            block = samples[:, pos:pos + count]
+            self._buffer[:, self._write:self._write + count] = block
+            self._buffer[:, self._write + num_window:self._write + num_window + count] = block
+            self._write = (self._write + count) % num_window
+            self._filled = min(self._filled + count, num_window)
+            self._until_hop -= count
+            pos += count
+
+            if self._until_hop == 0:
+                self._until_hop = self._num_hop
+                if self._filled == num_window:
+                    window = self._buffer[:, self._write:self._write + num_window]
+                    outputs.append(np.concatenate((self._band_powers(window), window[self._others, -1])))
+                    ends.append(pos - 1)
+
+        # The output is aligned with the end of the windows
+        self.positions = np.array(ends, dtype=int)
+        if not outputs:
+            return np.empty((self.num_rows * len(self.bands) + self._others.size, 0), dtype=np.float32)
+        return np.array(outputs, dtype=np.float32).T
+
+class RmsStage(Stage):
+    """ Moving RMS-envelope of the channels of the stage over the last window
+        seconds, e.g. of high-pass filtered EMG. The squares of the last window
+        are kept in a ring buffer next to their running sum per channel, so
+        every sample-set costs one addition and one subtraction per channel,
+        whatever the length of the window. The envelope starts at zero and
+        rises during the first window.
+
+        Args:
+            window: <float> The length of the window in seconds.
+
+            hop: <float> The time between two outputs in seconds. By default
+                 the envelope is given for every sample-set and replaces the
+                 channels of the stage; with a hop, only every hop seconds a
+                 sample-set of the envelope and the other channels is given,
+                 at a sample rate of 1 / hop.
+    """
+    def __init__(self, window = 0.25, hop = None, ch_types = None, name = None):
+        super().__init__(ch_types, name)
+        self.window = window
+        self.hop = hop
+
+    def configure(self, channels, sample_rate):
+        super().configure(channels, sample_rate)
+        self._num_window = int(round(self.window * sample_rate))
+        self._num_hop = int(round(self.hop * sample_rate)) if self.hop else 1
+        if (self._num_window < 1) or (self._num_hop < 1):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+        self.reset()
+        if not self.hop:
+            return channels, sample_rate
+
+        if isinstance(self.rows, slice):
+            selected = np.arange(len(channels))[self.rows]
+        else:
+            selected = np.asarray(self.rows, dtype=int)
+        self._others = np.setdiff1d(np.arange(len(channels)), selected)
+        rate = sample_rate / self._num_hop
+        rate = int(rate) if rate == int(rate) else rate
+        outputs = [DeviceChannel(ch.type, rate, ch.name, ch.unit_name, True, ch.sensor) for ch in channels]
+        return outputs, rate
+
+    def reset(self):
+        num_window = getattr(self, '_num_window', 0)
+        # Mirrored ring buffer of the squares: every square is written twice,
+        # so the last window, oldest first, is always a contiguous view
+        self._squares = np.zeros((self.num_rows, 2 * num_window))
+        self._sums = np.zeros(self.num_rows)
+        self._write = 0
+        self._since_sum = 0
+        self._next = getattr(self, '_num_hop', 1) - 1
+
+    def process(self, samples):
+        num_window = self._num_window
+        num_samples = samples.shape[1]
+        squares = np.square(samples[self.rows], dtype=float)
+
+        # The squares that leave the window: those of num_window sample-sets ago
+        if num_samples <= num_window:
+            dropped = self._squares[:, self._write:self._write + num_samples]
+        else:
+            dropped = np.concatenate((self._squares[:, self._write:self._write + num_window],
+                                      squares[:, :num_samples - num_window]), axis=1)
+        sums = np.cumsum(squares - dropped, axis=1)
+        sums += self._sums[:, np.newaxis]
+        self._sums = sums[:, -1].copy()
+
+        # Keep the squares of the last window
+        count = min(num_samples, num_window)
+        start = (self._write + num_samples - count) % num_window
+        first = min(count, num_window - start)
+        for offset in (0, num_window):
+            self._squares[:, offset + start:offset + start + first] = squares[:, num_samples - count:num_samples - count + first]
+            self._squares[:, offset:offset + count - first] = squares[:, num_samples - count + first:]
+        self._write = (self._write + num_samples) % num_window
+
+        # Recompute the running sums once per window, so rounding errors do
+        # not accumulate
+        self._since_sum += num_samples
+        if self._since_sum >= num_window:
+            self._sums = self._squares[:, self._write:self._write + num_window].sum(axis=1)
+            self._since_sum = 0
+
+        np.maximum(sums, 0.0, out=sums)
+        envelope = np.sqrt(sums / num_window)
+        if not self.hop:
+            samples[self.rows] = envelope
+            return samples
+
+        positions = np.arange(self._next, num_samples, self._num_hop)
+        self._next = (positions[-1] + self._num_hop if positions.size else self._next) - num_samples
+        self.positions = positions
+        output = np.empty((samples.shape[0], positions.size), dtype=np.float32)
+        output[self.rows] = envelope[:, positions]
+        output[self._others] = samples[self._others][:, positions]
+        return output
+
+class Pipeline:
+    """ A chain of processing stages that is applied to the sample-data of a
+        device. The processed sample-data is published to the sample-data
+        server: consumers register with the id of the pipeline (Pipeline.id).
+        The samples of the published SampleData are a float32 NumPy-array.
+        Start/Stop also starts/stops sampling of the device, unless
+        controls_measurement is False: the pipeline then only processes the
+        sample-data of a measurement that is started by others.
+
+        The pipeline has the next properties:
+
+        id: <int> The producer id of the processed sample-data.
+
+        stages: <list of Stage> The stages, in processing order.
+
+        channels: <list of DeviceChannel> The channels of the processed
+                  sample-data.
+
+        sample_rate: <int> The sample rate of the processed sample-data.
+    """
+    def __init__(self, device, stages = None, name = 'pipeline', controls_measurement = True):
+        self.device = device
+        self.name = name
+        self.controls_measurement = controls_measurement
+        self.stages = []
+        self.id = sample_data_server.createProducerId()
+
+        _QUEUE_SIZE = 1000
+        self.q_sample_sets = queue.Queue(_QUEUE_SIZE)
+
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._thread = None
+
+        for stage in (stages if stages else []):
+            self.add_stage(stage)
+        self.configure()
+
+    def add_stage(self, stage):
+        """ Appends a stage to the pipeline. Stages can only be added while
+            the pipeline is stopped.
+
+            Args:
+                stage: <Stage> The stage to add.
+        """
+        if self._thread is not None:
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+        # The stage names identify the stages in the timing statistics
+        names = [s.name for s in self.stages]
+        if stage.name in names:
+            stage.name = stage.name + '-' + str(len(self.stages))
+        self.stages.append(stage)
+        self.configure()
+
+    def configure(self):
+        """ Configures all stages for the current channels and sample rate of
+            the device and resets their state.
+        """
+        channels = list(self.device.channels)
+        sample_rate = self.device.config.get_sample_rate(ChannelType.counter)
+        for stage in self.stages:
+            channels, sample_rate = stage.configure(channels, sample_rate)
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self._pending_gaps = [[] for stage in self.stages]
+
+    def reset(self):
+        """ Resets the state of all stages."""
+        for stage in self.stages:
+            stage.reset()
+        self._pending_gaps = [[] for stage in self.stages]
+
+    def process(self, samples):
+        """ Passes one block through all stages.
+
+            Args:
+                samples: <array> (channels, sample-sets) array with the
+                         sample-data of the device.
+
+            Returns:
+                <array> float32-array of (channels, sample-sets) with the
+                processed sample-data.
+        """
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        timings = []
+        for stage in self.stages:
+            if not samples.shape[1]:
+                # Stages that collect sample-sets (e.g. a decimation) may not
+                # output sample-sets for every block: the next stages then
+                # have nothing to process
+                samples = np.empty((len(self.channels), 0), dtype=np.float32)
+                break
+            start = time.perf_counter()
+            samples = stage.process(samples)
+            timings.append(time.perf_counter() - start)
+
+        with self._lock:
+            for stage, duration in zip(self.stages, timings):
+                if stage.name not in self._timings:
+                    self._timings[stage.name] = latency_monitor.LatencyHistogram()
+                self._timings[stage.name].add(duration)
+            if 'total' not in self._timings:
+                self._timings['total'] = latency_monitor.LatencyHistogram()
+            self._timings['total'].add(sum(timings))
+        return samples
+
+    def _process_sample_data(self, sd):
+        # Passes a <SampleData>-object through all stages. Returns the processed
+        # <SampleData>, or None when the stages output no sample-sets
+        num_samples = sd.num_samples_per_sample_set * sd.num_sample_sets
+        if isinstance(sd.samples, np.ndarray):
+            samples = np.asarray(sd.samples, dtype=np.float32)
+        else:
+            samples = np.fromiter(sd.samples, dtype=np.float32, count=num_samples)
+        samples = samples.reshape((sd.num_sample_sets, sd.num_samples_per_sample_set)).T
+
+        samples = self.process(samples)
+        latency_monitor.stamp(sd, self.name)
+        gaps = self._map_gaps(sd.gaps, sd.num_sample_sets)
+
+        # Stages that collect sample-sets (e.g. a decimation) may not output
+        # sample-sets for every block
+        num_channels, num_sets = samples.shape
+        if num_sets == 0:
+            return None
+        processed = sample_data.SampleData(num_sets, num_channels, samples.ravel(order = 'F'))
+        processed.timestamps = latency_monitor.copy_stamps(sd)
+        processed.gaps = gaps
+        return processed
+
+    def _map_gaps(self, gaps, num_sets):
+        # Maps the gaps of the last input block to the output sample-sets of
+        # the stages: a gap moves to the first output sample-set that is
+        # aligned with, or after, the first input sample-set after the gap,
+        # and its number of lost sample-sets is converted to the output rate.
+        # A gap that is not followed by an output sample-set yet is kept for
+        # the next block
+        rates = [stage.sample_rate for stage in self.stages[1:]] + [self.sample_rate]
+        for k, stage in enumerate(self.stages):
+            if not num_sets:
+                # The stage was not passed an empty block
+                positions = np.empty(0, dtype=int)
+            elif stage.positions is not None:
+                positions = stage.positions
+            else:
+                positions = np.arange(num_sets)
+            lost = {}
+            pending = []
+            for index, num_lost in self._pending_gaps[k] + list(gaps):
+                i = int(np.searchsorted(positions, index))
+                if i < positions.size:
+                    lost[i] = lost.get(i, 0) + num_lost
+                else:
+                    pending.append((index - num_sets, num_lost))
+            self._pending_gaps[k] = pending
+            ratio = rates[k] / stage.sample_rate
+            gaps = [(i, max(int(np.ceil(num_lost * ratio)), 1)) for i, num_lost in sorted(lost.items())]
+            num_sets = positions.size
+        return gaps
+
+    def get_statistics(self):
+        """ Returns the processing time of the stages.
+
+            Returns:
+                <dict> per stage name (and 'total' for the complete pipeline)
+                the 'count', 'mean', 'p50', 'p99' and 'max' processing time of
+                a block in seconds.
+        """
+        with self._lock:
+            return {name: {'count': h.count,
+                           'mean': h.mean,
+                           'p50': h.percentile(50),
+                           'p99': h.percentile(99),
+                           'max': h.max} for name, h in self._timings.items()}
+
+    def reset_statistics(self):
+        """ Clears the collected processing times."""
+        with self._lock:
+            self._timings.clear()
+
+    def start(self):
+        """ Start the pipeline thread and device"""
+        if self._thread is not None:
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+        self.configure()
+        sample_data_server.registerConsumer(self.device.id, self.q_sample_sets, self.name)
+        self._thread = _PipelineThread(self)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the pipeline thread and device"""
+        if self._thread is None:
+            raise TMSiError(TMSiErrorCode.api_invalid_command)
+        self._thread.stop()
+        self._thread.join()
+        self._thread = None
+        sample_data_server.unregisterConsumer(self.device.id, self.q_sample_sets)
+
+class _PipelineThread(threading.Thread):
+    """ Thread that passes the sample-data of the device through the stages."""
+    def __init__(self, pipeline):
+        super().__init__(name = pipeline.name)
+        self.pipeline = pipeline
+        self.q_sample_sets = pipeline.q_sample_sets
+        self.device = pipeline.device
+        self.sampling = False
+
+    def run(self):
+        # Start measurement
+        self.sampling = True
+        if self.pipeline.controls_measurement:
+            self.device.start_measurement()
+
+        while self.sampling:
+            try:
+                sd = self.q_sample_sets.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            self.q_sample_sets.task_done()
+
+            processed = self.pipeline._process_sample_data(sd)
+            if processed is not None:
+                sample_data_server.putSampleData(self.pipeline.id, processed, 'published-' + self.pipeline.name)
+
+    def stop(self):
+        """ Stops the thread and the measurement."""
+        self.sampling = False
+        if self.pipeline.controls_measurement:
+            self.device.stop_measurement()
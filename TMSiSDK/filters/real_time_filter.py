@@ -27,23 +27,39 @@ TMSiSDK: Real-time filter that can be applied to incoming data
 
 import sys
 
-from .. import sample_data_server
+from .. import sample_data, sample_data_server, latency_monitor
 from ..device import ChannelType
+from ..error import TMSiError, TMSiErrorCode
+from .fir import FirFilter, design_fir
 
 import numpy as np
 import queue
-from copy import deepcopy
 import threading
-import time
 
 from scipy import signal, fft 
-import matplotlib.pyplot as plt
+
+def notch_sos(Fc, sample_rate, harmonics=1, Q=30):
+    """ Returns the second-order sections of a cascade of notch filters at 
+    Fc, 2*Fc, ... harmonics*Fc. All notches have the same bandwidth of Fc/Q Hz, 
+    notches above the Nyquist frequency are left out. """
+    sections=[]
+    for k in range(1, harmonics + 1):
+        if k * Fc >= sample_rate / 2:
+            break
+        b, a = signal.iirnotch(k * Fc, k * Q, fs=sample_rate)
+        sections.append(signal.tf2sos(b, a))
+    if not sections:
+        raise TMSiError(TMSiErrorCode.api_incorrect_argument)
+    return np.concatenate(sections)
 
 class RealTimeFilter:
     """ A semi-real time filter that can be used to retrieve and filter the data 
-    and send them to queue. Different filters can be used for the different 
-    analogue channel types (UNI, BIP. AUX). When no filter is generated/enabled 
-    data remains unfiltered.
+    and publish them to the sample data server. Different filters can be used 
+    for the different analogue channel types (UNI, BIP. AUX). When no filter is 
+    generated/enabled data remains unfiltered.
+    Consumers of the filtered data register at the sample data server with the 
+    id of the filter (RealTimeFilter.id) instead of the id of the device. The 
+    samples of the published SampleData are a NumPy-array.
     Start/Stop also starts/stops sampling of the device
     """
     def __init__(self, device):
@@ -53,96 +69,161 @@ class RealTimeFilter:
         self.num_channels = np.size(self.device.channels,0)
         self.sample_rate = self.device.config.get_sample_rate(ChannelType.counter)
         
-        _UNI=[]
-        _BIP=[]
-        _AUX=[]
-        
-        for idx, ch in enumerate(device.channels):
-            if (ch.type == ChannelType.UNI):
-                _UNI.append(idx)
-            elif (ch.type == ChannelType.BIP):
-                _BIP.append(idx)
-            elif (ch.type == ChannelType.AUX):
-                _AUX.append(idx)
-    
-        self.channels={'UNI': _UNI,
-                      'BIP': _BIP, 
-                      'AUX': _AUX}
-        self.filter_specs={'UNI': {'Order': None, 'Fc_hp': None, 'Fc_lp': None, 'Enabled': False},
-                      'BIP': {'Order': None, 'Fc_hp': None, 'Fc_lp': None,'Enabled': False}, 
-                      'AUX': {'Order': None, 'Fc_hp': None, 'Fc_lp': None, 'Enabled': False}}
-        self._filter_details={'UNI': {'sos': None, 'z_sos': None},
-                              'BIP': {'sos': None, 'z_sos': None}, 
-                              'AUX': {'sos': None, 'z_sos': None}}
-        
-        # Prepare Queues
+        channel_indices = device.channel_indices
+        self.channels={'UNI': channel_indices[ChannelType.UNI].tolist(),
+                      'BIP': channel_indices[ChannelType.BIP].tolist(), 
+                      'AUX': channel_indices[ChannelType.AUX].tolist()}
+        self.filter_specs={ch_type: {'Type': 'iir', 'Order': None, 'Num_taps': None, 
+                                     'Fc_hp': None, 'Fc_lp': None, 
+                                     'Fc_notch': None, 'Harmonics': None, 'Q': None, 
+                                     'Enabled': False} for ch_type in self.channels}
+        self._filter_details={ch_type: {'sos': None, 'z_sos': None, 'taps': None, 'fir_history': None} for ch_type in self.channels}
+        # Channel types that share the same filter are filtered together
+        self._filter_groups = []
+        
+        # Producer id of the filtered sample data
+        self.id = sample_data_server.createProducerId()
+        
+        # Prepare Queue
         _QUEUE_SIZE = 1000
         self.q_sample_sets = queue.Queue(_QUEUE_SIZE)
         
-        _MAX_SIZE_FILTER_QUEUE=50
-        self.q_filtered_sample_sets=queue.Queue(_MAX_SIZE_FILTER_QUEUE)
-        
         self.filter_thread = FilterThread(self)
         # self.filter_thread.start()
     
-    def generateFilter(self, order=2, Fc_hp=None, Fc_lp=None, ch_types=None, show=False):
+    def generateFilter(self, order=2, Fc_hp=None, Fc_lp=None, ch_types=None, show=False, ftype='iir', num_taps=None):
         """ Generate filter with given order and cut-off frequency/frequencies. 
         Generates a high-pass filter when only Fc_hp is specified,a low-pass 
         filter when only Fc_lp is specified or a band-pass when both Fc_hp and 
         Fc_lp are given.
+        With ftype='iir' a Butterworth filter of the given order is generated. 
+        With ftype='fir' a linear-phase FIR-filter of num_taps taps is generated
+        (the order is not used), which delays all frequencies by the same 
+        group delay, see getGroupDelay. By default its length gives a 
+        transition band of a quarter of the lowest cut-off frequency. Long 
+        FIR-filters are applied with FFT-convolution.
         Filter is applied to the specified channel types or to all analogue 
         channels when no channels types are given.
         Use show to inspect the frequency response of the filter """
+        if ftype not in ('iir', 'fir'):
+            raise TMSiError(TMSiErrorCode.api_incorrect_argument)
         if not ch_types:
             ch_types=list(self.channels.keys())
             
         for ch_type in ch_types:
-            self.filter_specs[ch_type]['Order']=order
+            self.filter_specs[ch_type]['Type']=ftype
+            self.filter_specs[ch_type]['Order']=order if ftype == 'iir' else None
+            self.filter_specs[ch_type]['Num_taps']=num_taps if ftype == 'fir' else None
             self.filter_specs[ch_type]['Fc_hp']=Fc_hp
             self.filter_specs[ch_type]['Fc_lp']=Fc_lp
-            
-            chan=self.channels[ch_type]
-            
-            if not (Fc_hp or Fc_lp) or not chan:
-                sos=None
-                z_sos=None
-                self.filter_specs[ch_type]['Enabled']=False
-            else:
-                if Fc_hp and Fc_lp:
-                    sos=signal.butter(order, [Fc_hp, Fc_lp], 'bandpass', fs=self.sample_rate, output='sos')
-                elif Fc_hp:
-                    sos=signal.butter(order, Fc_hp, 'highpass', fs=self.sample_rate, output='sos')
-                elif Fc_lp:
-                    sos=signal.butter(order, Fc_lp, 'lowpass', fs=self.sample_rate, output='sos')
-                 
-                z_sos0 = signal.sosfilt_zi(sos)
-                z_sos=np.repeat(z_sos0[:, np.newaxis, :], len(chan), axis=1)
-                self.filter_specs[ch_type]['Enabled']=True
-            
-            self._filter_details[ch_type]['sos']=sos
-            self._filter_details[ch_type]['z_sos']=z_sos
+            self._design_filter(ch_type)
+        self._update_filter_groups(reset=ch_types)
         
         if show:
-            # Show the frequency response of the filter
-            w, h = signal.sosfreqz(sos, worN=fft.next_fast_len(self.sample_rate*10))
-            plt.figure()
-            plt.subplot(2, 1, 1)
-            db = 20*np.log10(np.maximum(np.abs(h), 1e-5))
-            plt.plot((self.sample_rate/2)*(w/np.pi), db, label = ch_type)
-            plt.ylim(-50, 5)
-            plt.grid(True)
-            plt.yticks([0, -20, -40])
-            plt.ylabel('Gain [dB]')
-            plt.title('Frequency Response')
-            plt.subplot(2, 1, 2)
-            plt.plot((self.sample_rate/2)*(w/np.pi), np.angle(h), label = ch_type)
-            plt.grid(True)
-            plt.yticks([-np.pi, -0.5*np.pi, 0, 0.5*np.pi, np.pi],
-                       [r'$-\pi$', r'$-\pi/2$', '0', r'$\pi/2$', r'$\pi$'])
-            plt.ylabel('Phase [rad]')
-            plt.xlabel('Frequency [Hz]')
-            plt.show()
+            self._show_response(ch_type)
+    
+    def generateNotch(self, Fc=50, harmonics=1, Q=30, ch_types=None, show=False):
+        """ Generate a notch filter for the power-line frequency Fc (50 or 60 Hz)
+        and its harmonics: notches at Fc, 2*Fc, ... harmonics*Fc. The notches 
+        are cascaded with the filter of generateFilter, so both are applied in 
+        the same pass. All notches have the same bandwidth of Fc/Q Hz, notches 
+        above the Nyquist frequency are left out. Use Fc=None to remove the 
+        notch filter.
+        Filter is applied to the specified channel types or to the UNI and BIP
+        channels when no channels types are given.
+        Use show to inspect the frequency response of the filter """
+        if not ch_types:
+            ch_types=['UNI', 'BIP']
+        
+        for ch_type in ch_types:
+            self.filter_specs[ch_type]['Fc_notch']=Fc
+            self.filter_specs[ch_type]['Harmonics']=harmonics if Fc else None
+            self.filter_specs[ch_type]['Q']=Q if Fc else None
+            self._design_filter(ch_type)
+        self._update_filter_groups(reset=ch_types)
+        
+        if show:
+            self._show_response(ch_type)
+    
+    def _design_filter(self, ch_type):
+        # Design the FIR-filter or the cascade of the Butterworth filter and 
+        # the notch filter of the channel type and reset its state. A notch 
+        # filter is also applied after a FIR-filter.
+        spec=self.filter_specs[ch_type]
+        chan=self.channels[ch_type]
+        
+        taps=None
+        sections=[]
+        if spec['Type'] == 'fir':
+            if spec['Fc_hp'] or spec['Fc_lp']:
+                taps=design_fir(self.sample_rate, spec['Fc_hp'], spec['Fc_lp'], spec['Num_taps'])
+                spec['Num_taps']=len(taps)
+        elif spec['Fc_hp'] and spec['Fc_lp']:
+            sections.append(signal.butter(spec['Order'], [spec['Fc_hp'], spec['Fc_lp']], 'bandpass', fs=self.sample_rate, output='sos'))
+        elif spec['Fc_hp']:
+            sections.append(signal.butter(spec['Order'], spec['Fc_hp'], 'highpass', fs=self.sample_rate, output='sos'))
+        elif spec['Fc_lp']:
+            sections.append(signal.butter(spec['Order'], spec['Fc_lp'], 'lowpass', fs=self.sample_rate, output='sos'))
+        if spec['Fc_notch']:
+            sections.append(notch_sos(spec['Fc_notch'], self.sample_rate, spec['Harmonics'], spec['Q']))
+        
+        if not chan:
+            taps=None
+            sections=[]
+        sos=None
+        z_sos=None
+        if sections:
+            sos=np.concatenate(sections)
+            z_sos0 = signal.sosfilt_zi(sos)
+            z_sos=np.repeat(z_sos0[:, np.newaxis, :], len(chan), axis=1)
+        spec['Enabled']=(sos is not None) or (taps is not None)
+        
+        self._filter_details[ch_type]['sos']=sos
+        self._filter_details[ch_type]['z_sos']=z_sos
+        self._filter_details[ch_type]['taps']=taps
+        self._filter_details[ch_type]['fir_history']=None
+        
+    def getGroupDelay(self, ch_type):
+        """ Returns the group delay in seconds of the FIR-filter of the given 
+        channel type, which is the same for all frequencies. Returns 0 when no 
+        FIR-filter is generated. A Butterworth or notch filter has no constant 
+        group delay: None is returned when one of them is generated. """
+        if self._filter_details[ch_type]['sos'] is not None:
+            return None
+        taps=self._filter_details[ch_type]['taps']
+        if taps is None:
+            return 0
+        return ((len(taps) - 1) / 2) / self.sample_rate
         
+    def _show_response(self, ch_type):
+        # Show the frequency response of the filter
+        import matplotlib.pyplot as plt
+        worN=fft.next_fast_len(self.sample_rate*10)
+        h=np.ones(worN, dtype=complex)
+        if self._filter_details[ch_type]['taps'] is not None:
+            w, h_fir = signal.freqz(self._filter_details[ch_type]['taps'], worN=worN)
+            h=h*h_fir
+        if self._filter_details[ch_type]['sos'] is not None:
+            w, h_sos = signal.sosfreqz(self._filter_details[ch_type]['sos'], worN=worN)
+            h=h*h_sos
+        plt.figure()
+        plt.subplot(2, 1, 1)
+        db = 20*np.log10(np.maximum(np.abs(h), 1e-5))
+        plt.plot((self.sample_rate/2)*(w/np.pi), db, label = ch_type)
+        plt.ylim(-50, 5)
+        plt.grid(True)
+        plt.yticks([0, -20, -40])
+        plt.ylabel('Gain [dB]')
+        plt.title('Frequency Response')
+        plt.subplot(2, 1, 2)
+        plt.plot((self.sample_rate/2)*(w/np.pi), np.angle(h), label = ch_type)
+        plt.grid(True)
+        plt.yticks([-np.pi, -0.5*np.pi, 0, 0.5*np.pi, np.pi],
+                   [r'$-\pi$', r'$-\pi/2$', '0', r'$\pi/2$', r'$\pi$'])
+        plt.ylabel('Phase [rad]')
+        plt.xlabel('Frequency [Hz]')
+        plt.show()
+
     def disableFilter(self, *ch_types):
         """ Disable the filters for the given channel types. All filters are disabled 
         when no channel types are given"""
@@ -151,6 +232,7 @@ class RealTimeFilter:
             
         for ch_type in ch_types:
             self.filter_specs[ch_type]['Enabled']=False
+        self._update_filter_groups()
             
     def enableFilter(self, *ch_types):
         """ Enable the filters for the given channel types. All filters are enabled 
@@ -159,8 +241,7 @@ class RealTimeFilter:
             ch_types=list(self.channels.keys())
         
         for ch_type in ch_types:
-            chan=self.channels[ch_type]
-            if chan:
+            if (self._filter_details[ch_type]['sos'] is not None) or (self._filter_details[ch_type]['taps'] is not None):
                 self.filter_specs[ch_type]['Enabled']=True
                 self.reset(ch_type)
 
@@ -174,10 +255,60 @@ class RealTimeFilter:
         for ch_type in ch_types:
             chan=self.channels[ch_type]
             if self.filter_specs[ch_type]['Enabled']:
-                z_sos0 = signal.sosfilt_zi(self._filter_details[ch_type]['sos'])
-                z_sos=np.repeat(z_sos0[:, np.newaxis, :], len(chan), axis=1)
-                self._filter_details[ch_type]['z_sos']=z_sos
-            
+                if self._filter_details[ch_type]['sos'] is not None:
+                    z_sos0 = signal.sosfilt_zi(self._filter_details[ch_type]['sos'])
+                    z_sos=np.repeat(z_sos0[:, np.newaxis, :], len(chan), axis=1)
+                    self._filter_details[ch_type]['z_sos']=z_sos
+                self._filter_details[ch_type]['fir_history']=None
+        self._update_filter_groups(reset=ch_types)
+
+    def _update_filter_groups(self, reset=()):
+        # Group the enabled channel types with the same filter, so all their
+        # channels are filtered in one sosfilt-pass. The filter state of the 
+        # group is shared with the channel types: their 'z_sos' refers to their
+        # part of the state of the group. Coefficients and state are kept in 
+        # double precision: notches and low cut-off frequencies put the poles
+        # too close to the unit circle for float32, and float32 is not faster.
+        # The history of a FIR-filter is handed over to the channel types,
+        # except for the channel types that are reset.
+        for group in self._filter_groups:
+            if group.fir is not None and group.fir._history is not None:
+                offset = 0
+                for ch_type in group.ch_types:
+                    num_channels = len(self.channels[ch_type])
+                    if ch_type not in reset:
+                        self._filter_details[ch_type]['fir_history'] = group.fir._history[offset:offset + num_channels]
+                    offset += num_channels
+        
+        groups = {}
+        for ch_type, spec in self.filter_specs.items():
+            if spec['Enabled']:
+                key = (spec['Type'], spec['Order'], spec['Num_taps'], spec['Fc_hp'], spec['Fc_lp'], 
+                       spec['Fc_notch'], spec['Harmonics'], spec['Q'])
+                groups.setdefault(key, []).append(ch_type)
+        
+        filter_groups = []
+        for ch_types in groups.values():
+            details = [self._filter_details[ch_type] for ch_type in ch_types]
+            sos = None
+            z_sos = None
+            if details[0]['sos'] is not None:
+                z_sos = np.concatenate([d['z_sos'] for d in details], axis=1).astype(float)
+                offset = 0
+                for ch_type, d in zip(ch_types, details):
+                    num_channels = len(self.channels[ch_type])
+                    d['z_sos'] = z_sos[:, offset:offset + num_channels, :]
+                    offset += num_channels
+                sos = details[0]['sos'].astype(float)
+            fir = None
+            if details[0]['taps'] is not None:
+                fir = FirFilter(details[0]['taps'])
+                if all(d['fir_history'] is not None for d in details):
+                    fir._history = np.concatenate([d['fir_history'] for d in details])
+            indices = np.concatenate([self.channels[ch_type] for ch_type in ch_types]).astype(int)
+            filter_groups.append(_FilterGroup(sos, indices, z_sos, fir, ch_types))
+        self._filter_groups = filter_groups
+
     def start(self):
         """ Start the filter thread and device""" 
         self.filter_thread.start()
@@ -188,6 +319,23 @@ class RealTimeFilter:
         sample_data_server.unregisterConsumer(self.device.id, self.filter_thread.q_sample_sets)
 
 
+class _FilterGroup:
+    """ The channels that are filtered with the same filter: a FIR-filter
+        and/or second-order sections. When the channels are consecutive they 
+        are addressed with a slice instead of an index array, so gathering and 
+        scattering them are plain copies.
+    """
+    def __init__(self, sos, indices, z_sos, fir=None, ch_types=()):
+        self.sos = sos
+        self.z_sos = z_sos
+        self.fir = fir
+        self.ch_types = ch_types
+        if indices.size and np.all(np.diff(indices) == 1):
+            self.rows = slice(int(indices[0]), int(indices[-1]) + 1)
+        else:
+            self.rows = indices
+
+
 class FilterThread(threading.Thread):
     """A semi-real time filter"""
     
@@ -196,16 +344,17 @@ class FilterThread(threading.Thread):
         """
         super(FilterThread,self).__init__()
         
-        self.q_filtered_sample_sets=main_class.q_filtered_sample_sets
+        self.id=main_class.id
         self.q_sample_sets =main_class.q_sample_sets
         
         self.channels=main_class.channels
         self._filter_details=main_class._filter_details
         self.filter_specs=main_class.filter_specs
         self.device=main_class.device
+        self._real_time_filter=main_class
         
         # Register the consumer to the sample data server
-        sample_data_server.registerConsumer(main_class.device.id, self.q_sample_sets)
+        sample_data_server.registerConsumer(main_class.device.id, self.q_sample_sets, 'real-time-filter')
                 
 
     def run(self): 
@@ -213,30 +362,50 @@ class FilterThread(threading.Thread):
             the desired format and filters the samples.
         """
         # Start measurement
-        self.device.start_measurement()
         self.sampling = True
+        self.device.start_measurement()
         
+        # Process all pending blocks as fast as possible, pacing (e.g. of a
+        # plot) is up to the consumers
         while self.sampling:
-            while not self.q_sample_sets.empty():
-                
-                #Read samples from queue 
-                sd = self.q_sample_sets.get()
-                self.q_sample_sets.task_done()
-                
-                # Reshape the samples retrieved from the queue
-                samples = np.reshape(sd.samples, (sd.num_samples_per_sample_set, sd.num_sample_sets), order = 'F')
-                
-                #Filter data 
-                for ch_type, ch_filter in self._filter_details.items():
-                    if self.filter_specs[ch_type]['Enabled']:
-                        # filter the data
-                        samples[self.channels[ch_type]], self._filter_details[ch_type]['z_sos']=signal.sosfilt(self._filter_details[ch_type]['sos'], samples[self.channels[ch_type]], zi=self._filter_details[ch_type]['z_sos'])
-
-                # Output sample data to queue
-                self.q_filtered_sample_sets.put(deepcopy(samples))
-                
-                # Pause the thread for a bit to update the plot
-                time.sleep(0.01)
+            try:
+                sd = self.q_sample_sets.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            self.q_sample_sets.task_done()
+            
+            samples = self._filter(sd)
+
+            latency_monitor.stamp(sd, 'filtered')
+
+            # Publish the filtered sample data: the filtered block is a new
+            # array, so it is passed on without a copy
+            filtered = sample_data.SampleData(sd.num_sample_sets, sd.num_samples_per_sample_set, samples.ravel(order = 'F'))
+            filtered.timestamps = latency_monitor.copy_stamps(sd)
+            filtered.gaps = sd.gaps
+            sample_data_server.putSampleData(self.id, filtered, 'published-filter')
+        
+    def _filter(self, sd):
+        """ Method that reshapes the samples of a <SampleData>-object into
+            a (channels, sample-sets) matrix and filters them.
+        """
+        # Reshape the samples retrieved from the queue into a new array, which
+        # is filtered in place (np.fromiter converts a list faster than np.array)
+        num_samples = sd.num_samples_per_sample_set * sd.num_sample_sets
+        samples = np.fromiter(sd.samples, dtype = float, count = num_samples)
+        samples = np.reshape(samples, (sd.num_samples_per_sample_set, sd.num_sample_sets), order = 'F')
+        
+        #Filter data: one pass per group of channel types with the same filter
+        for group in self._real_time_filter._filter_groups:
+            filtered = samples[group.rows]
+            if group.fir is not None:
+                filtered = group.fir.process(filtered)
+            if group.sos is not None:
+                filtered, z_sos = signal.sosfilt(group.sos, filtered, zi=group.z_sos)
+                group.z_sos[...] = z_sos
+            samples[group.rows] = filtered
+        
+        return samples
         
     def stop(self):
         """ Method that is executed when the thread is terminated. 
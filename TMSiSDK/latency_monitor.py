@@ -0,0 +1,218 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+TMSiSDK: Latency instrumentation of the acquisition pipeline
+
+When enabled, every <SampleData>-object is stamped with a timestamp at each
+stage boundary it passes (acquisition, conversion, distribution by the
+sample-data-server, filtering, writing, plotting). The time elapsed since
+acquisition is collected per stage into a latency histogram. Next to that
+the depth of the queues between the stages is tracked.
+
+Usage:
+    latency_monitor.enable()
+    ...
+    print(latency_monitor.get_statistics())
+    latency_monitor.dump('../measurements/latency.json')
+
+'''
+
+import json
+import threading
+import time
+import numpy as np
+
+# Histogram bins: logarithmically spaced from 1 micro-second up to 100 seconds,
+# 100 bins per decade (~2.3% resolution)
+_BIN_EDGES = np.logspace(-6, 2, 8 * 100 + 1)
+
+_enabled = False
+_lock = threading.Lock()
+_histograms = {}
+_queue_depths = {}
+
+class LatencyHistogram:
+    """ <LatencyHistogram> collects latency values (in seconds) into
+        logarithmically spaced bins. It has the next properties:
+
+        count: <int> The number of collected values.
+
+        max: <float> The largest collected value.
+
+        mean: <float> The mean of the collected values.
+    """
+    def __init__(self):
+        self.counts = np.zeros(len(_BIN_EDGES) + 1, dtype=np.int64)
+        self.count = 0
+        self.max = 0.0
+        self._sum = 0.0
+
+    @property
+    def mean(self):
+        return self._sum / self.count if self.count else 0.0
+
+    def add(self, value):
+        """ Adds one latency value (in seconds) to the histogram."""
+        self.counts[np.searchsorted(_BIN_EDGES, value)] += 1
+        self.count += 1
+        self._sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """ Returns the p-th percentile (0-100) of the collected values. The
+            value is the upper edge of the bin holding the percentile, limited
+            to the largest collected value.
+        """
+        if self.count == 0:
+            return 0.0
+        idx = np.searchsorted(np.cumsum(self.counts), np.ceil(self.count * p / 100.0))
+        return min(float(_BIN_EDGES[min(idx, len(_BIN_EDGES) - 1)]), self.max)
+
+class QueueDepthGauge:
+    """ <QueueDepthGauge> tracks the depth of a queue between 2 stages."""
+    def __init__(self):
+        self.current = 0
+        self.max = 0
+
+    def update(self, depth):
+        self.current = depth
+        if depth > self.max:
+            self.max = depth
+
+def enable():
+    """ Enables the stamping of sample-data and collection of statistics."""
+    global _enabled
+    _enabled = True
+
+def disable():
+    """ Disables the stamping of sample-data. Collected statistics are kept."""
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    """ Returns True when the latency instrumentation is enabled."""
+    return _enabled
+
+def reset():
+    """ Clears all collected statistics."""
+    with _lock:
+        _histograms.clear()
+        _queue_depths.clear()
+
+def stamp(sd, stage, timestamp = None):
+    """ Stamps a <SampleData>-object at a stage boundary.
+
+        The first stamp of a <SampleData>-object marks its origin. For all next
+        stamps, the time elapsed since the origin is added to the latency
+        histogram of the stage.
+
+        Args:
+            sd: <SampleData> The sample-data passing the stage boundary.
+
+            stage: <string> Name of the stage, e.g. 'converted' or 'poly5_writer'.
+
+            timestamp: <float> Time of the stage boundary (time.perf_counter()).
+                       By default the current time is used.
+    """
+    if not _enabled:
+        return
+    if timestamp is None:
+        timestamp = time.perf_counter()
+
+    # Consumers of the same <SampleData>-object stamp it from their own
+    # threads: the stamps are read and written under the lock
+    with _lock:
+        if sd.timestamps:
+            origin = next(iter(sd.timestamps.values()))
+            if stage not in _histograms:
+                _histograms[stage] = LatencyHistogram()
+            _histograms[stage].add(timestamp - origin)
+        sd.timestamps[stage] = timestamp
+
+def copy_stamps(sd):
+    """ Returns a copy of the stamps of a <SampleData>-object, for sample-data
+        that is derived from it (e.g. filtered sample-data). The derived
+        sample-data is stamped on its own, while consumers may still stamp the
+        original.
+
+        Args:
+            sd: <SampleData> The original sample-data.
+
+        Returns:
+            <dict> The stamps per stage.
+    """
+    with _lock:
+        return dict(sd.timestamps)
+
+def record_queue_depth(name, q):
+    """ Records the current depth of a queue.
+
+        Args:
+            name: <string> Name of the queue.
+
+            q: <queue> The queue. Objects without a qsize()-method are ignored.
+    """
+    if not _enabled or not hasattr(q, 'qsize'):
+        return
+    depth = q.qsize()
+    with _lock:
+        if name not in _queue_depths:
+            _queue_depths[name] = QueueDepthGauge()
+        _queue_depths[name].update(depth)
+
+def get_statistics():
+    """ Returns the collected statistics.
+
+        Returns:
+            <dict> with:
+                'latency': per stage the 'count', 'mean', 'p50', 'p99' and 'max'
+                           latency in seconds since acquisition.
+                'queue_depth': per queue the 'current' and 'max' depth.
+    """
+    with _lock:
+        latency = {stage: {'count': h.count,
+                           'mean': h.mean,
+                           'p50': h.percentile(50),
+                           'p99': h.percentile(99),
+                           'max': h.max} for stage, h in _histograms.items()}
+        queue_depth = {name: {'current': g.current,
+                              'max': g.max} for name, g in _queue_depths.items()}
+    return {'latency': latency, 'queue_depth': queue_depth}
+
+def dump(filename):
+    """ Writes the collected statistics, including the non-empty histogram
+        bins per stage, to a json-file.
+
+        Args:
+            filename: <string> The path and name of the file.
+    """
+    statistics = get_statistics()
+    with _lock:
+        for stage, h in _histograms.items():
+            idx = np.nonzero(h.counts)[0]
+            edges = np.concatenate(([0.0], _BIN_EDGES, [np.inf]))
+            statistics['latency'][stage]['histogram'] = [[float(edges[i]), float(edges[i + 1]), int(h.counts[i])] for i in idx]
+    with open(filename, 'w') as f:
+        json.dump(statistics, f, indent=2)
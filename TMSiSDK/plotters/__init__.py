@@ -23,6 +23,14 @@ limitations under the License.
 
 '''
 
-from .plotter import RealTimePlot
-from .impedance_plotter import ImpedancePlot
-from .plotter_hd_emg import HDEMGPlot
\ No newline at end of file
+# The plotters depend on PySide2 and pyqtgraph: the plotter-modules are only
+# imported when a plotter is used.
+_plotters = {'RealTimePlot' : 'plotter',
+             'ImpedancePlot' : 'impedance_plotter',
+             'HDEMGPlot' : 'plotter_hd_emg'}
+
+def __getattr__(name):
+    if name in _plotters:
+        from importlib import import_module
+        return getattr(import_module('.' + _plotters[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -339,7 +339,7 @@ class SamplingThread(QtCore.QObject):
         self.q_sample_sets = queue.Queue(1000)
         
         # Register the consumer to the sample server
-        sample_data_server.registerConsumer(self.device.id, self.q_sample_sets)
+        sample_data_server.registerConsumer(self.device.id, self.q_sample_sets, 'impedance-plot')
         
         # Start measurement
         self.device.start_measurement(MeasurementType.impedance)
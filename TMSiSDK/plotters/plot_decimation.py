@@ -0,0 +1,136 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+TMSiSDK: Min/max decimation of sample data for plotting
+
+A plot can not show more points than it has pixel-columns: the sample data is
+reduced to the minimum and maximum of every column of samples, so spikes and
+artefacts remain visible. The columns are kept in a pyramid of levels; every
+level has columns of twice as many samples as the level below. A plot picks
+the level that fits its time range. All levels are updated incrementally with
+every block of sample data, so only the new columns have to be computed.
+
+'''
+
+import numpy as np
+
+class MinMaxDecimator:
+    """ Min/max pyramid of the last buffer_size seconds of sample data.
+
+        The decimator has the next properties:
+
+        samples_per_column: <int> Number of samples in a column of level 0.
+
+        num_columns: <list> Per level the number of completed columns since
+                     the start. Column j of level k holds samples
+                     j * column_width(k) up to (j + 1) * column_width(k).
+
+        Args:
+            num_channels: <int> The number of channels.
+
+            sample_rate: <int> The sample rate.
+
+            samples_per_column: <int> Number of samples in a column of level 0.
+
+            buffer_size: <float> Length in seconds of the kept columns.
+
+            num_levels: <int> The number of levels of the pyramid.
+    """
+    def __init__(self, num_channels, sample_rate, samples_per_column, buffer_size = 10, num_levels = 4):
+        self.num_channels = num_channels
+        self.sample_rate = sample_rate
+        self.samples_per_column = max(int(samples_per_column), 1)
+        self.num_levels = num_levels
+        self._num_kept = [int(np.ceil(buffer_size * sample_rate / self.column_width(k))) for k in range(num_levels)]
+        self._mins = [np.full((num_channels, n), np.nan, dtype=np.float32) for n in self._num_kept]
+        self._maxs = [np.full((num_channels, n), np.nan, dtype=np.float32) for n in self._num_kept]
+        self.num_columns = [0] * num_levels
+        # Samples of the column of level 0 that is not complete yet
+        self._partial = np.empty((num_channels, 0), dtype=np.float32)
+
+    def column_width(self, level):
+        """ Returns the number of samples in a column of a level."""
+        return self.samples_per_column << level
+
+    def level_for(self, num_samples, max_columns):
+        """ Returns the lowest level at which num_samples samples take no more
+            than max_columns columns.
+        """
+        for level in range(self.num_levels):
+            if num_samples / self.column_width(level) <= max_columns:
+                return level
+        return self.num_levels - 1
+
+    def add(self, samples):
+        """ Adds a block of (channels, samples) sample data and updates the
+            columns of all levels that are completed by it.
+        """
+        samples = np.concatenate((self._partial, np.asarray(samples, dtype=np.float32)), axis=1)
+        num_new = samples.shape[1] // self.samples_per_column
+        num_used = num_new * self.samples_per_column
+        self._partial = samples[:, num_used:]
+        if not num_new:
+            return
+
+        columns = samples[:, :num_used].reshape(self.num_channels, num_new, self.samples_per_column)
+        start = self.num_columns[0]
+        self._write(0, start, columns.min(axis=2), columns.max(axis=2))
+
+        # Every level combines pairs of completed columns of the level below
+        for level in range(1, self.num_levels):
+            stop = self.num_columns[level - 1] // 2
+            start = max(self.num_columns[level], stop - self._num_kept[level])
+            if stop <= start:
+                break
+            below = (2 * np.arange(start, stop))[:, np.newaxis] + np.arange(2)
+            below %= self._num_kept[level - 1]
+            mins = self._mins[level - 1][:, below].min(axis=2)
+            maxs = self._maxs[level - 1][:, below].max(axis=2)
+            self._write(level, start, mins, maxs)
+
+    def _write(self, level, start, mins, maxs):
+        # Only the last columns fit in the buffer
+        num_kept = self._num_kept[level]
+        if mins.shape[1] > num_kept:
+            start += mins.shape[1] - num_kept
+            mins = mins[:, -num_kept:]
+            maxs = maxs[:, -num_kept:]
+        positions = np.arange(start, start + mins.shape[1]) % num_kept
+        self._mins[level][:, positions] = mins
+        self._maxs[level][:, positions] = maxs
+        self.num_columns[level] = start + mins.shape[1]
+
+    def columns(self, level, start, stop):
+        """ Returns the minima and maxima of columns start up to stop of a
+            level, as two (channels, columns) arrays. Columns that are not
+            (or no longer) available are NaN.
+        """
+        num_kept = self._num_kept[level]
+        indices = np.arange(start, stop)
+        available = (indices >= self.num_columns[level] - num_kept) & (indices < self.num_columns[level]) & (indices >= 0)
+        positions = indices % num_kept
+        mins = self._mins[level][:, positions]
+        maxs = self._maxs[level][:, positions]
+        mins[:, ~available] = np.nan
+        maxs[:, ~available] = np.nan
+        return mins, maxs
@@ -30,17 +30,26 @@ import numpy as np
 import pyqtgraph as pg
 import time
 import queue
-from copy import copy
+import threading
 
 import sys
 
 
 from .. import tmsi_device
-from .. import sample_data_server
+from .. import sample_data_server, latency_monitor
 from ..plotters.plotter_gui import Ui_MainWindow 
+from ..plotters.plot_decimation import MinMaxDecimator
 from ..device import DeviceInterfaceType, ChannelType
 
 
+# Maximum number of min/max-columns per channel in the time range of the plot
+_MAX_PLOT_COLUMNS = 1250
+# Maximum number of times per second the plot is redrawn
+_FRAME_RATE = 30
+# Number of curves the sweep is split in, a frame only redraws the curves
+# with new columns
+_NUM_SEGMENTS = 32
+
 class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
     """ A GUI that displays the signals on the screen. The GUI handles the 
         incoming data and is able to apply scaling. Furthermore, the GUI handles
@@ -60,19 +69,29 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         self.setWindowTitle(figurename)
         self.filter_app = filter_app
 
+        # A pipeline (see TMSiSDK.filters.pipeline) can change the channels
+        # and the sample rate of the data, in that case plot its output
+        if hasattr(filter_app, 'configure'):
+            self._channels = filter_app.channels
+            self.sample_rate = filter_app.sample_rate
+        else:
+            self._channels = self.device.channels
+            self.sample_rate = self.device.config.get_sample_rate(ChannelType.counter)
+        # The COUNTER channel keeps counting the sample-sets of the device
+        self._counter_rate = self.device.config.get_sample_rate(ChannelType.counter)
         
         # Create a list of displayed channels. The counter channel is never displayed
         if not channel_selection:
-            self._channel_selection = np.arange(0, np.size(self.device.channels,0)-1)
+            self._channel_selection = np.arange(0, np.size(self._channels,0)-1)
 
         else:
             for i in channel_selection:
                 # When indices are selected that correspond to the STATUS channel,
                 # or the COUNTER channel, remove them from the channel_selection parameter
-                if (i == np.size(self.device.channels,0)-2):
+                if (i == np.size(self._channels,0)-2):
                     _idx = channel_selection.index(i)
                     channel_selection = channel_selection[:_idx]
-            self._channel_selection = np.hstack((channel_selection, np.size(self.device.channels,0)-2))
+            self._channel_selection = np.hstack((channel_selection, np.size(self._channels,0)-2))
         
         # Set up UI and thread
         self.initUI()
@@ -90,11 +109,12 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         
         # Configuration settings
         self.num_channels = np.size(self._channel_selection,0)
-        self.active_channels = np.size(self.device.channels,0)
+        self.active_channels = np.size(self._channels,0)
         self.window_size = 5 # seconds
-        self.sample_rate = self.device.config.get_sample_rate(ChannelType.counter)
         
-        self._downsampling_factor = int(self.sample_rate / 500)
+        # The plot shows the minimum and maximum of every column of samples,
+        # 250 columns per second at the highest resolution
+        self._samples_per_column = max(int(self.sample_rate // 250), 1)
         
         # Set channel list checkboxes
         self._gridbox = QtWidgets.QGridLayout()
@@ -103,14 +123,14 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         # Create checkboxes for the active channels so that they can be selected
         self._checkboxes = []
         for i in range(self.active_channels - 2):
-            _checkBox = QtWidgets.QCheckBox(self.device.channels[i].name)
+            _checkBox = QtWidgets.QCheckBox(self._channels[i].name)
             if i in self._channel_selection:
                 _checkBox.setChecked(True)
             self._gridbox.addWidget(_checkBox, i%25, np.floor(i/25))
             _checkBox.clicked.connect(self._update_channel_display)
             
             # Keep track of the checkboxes and the channel type belonging to the checkbox
-            self._checkboxes.append((_checkBox,self.device.channels[i].type))
+            self._checkboxes.append((_checkBox,self._channels[i].type))
             
         
         # Virtual offset for all channels
@@ -125,13 +145,13 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         for i in range(self.num_channels):
             for j in [-1, 0, 1]:
                 if not bool(j):
-                    tick_list_left[0].append((int(self._plot_offset * i), f'{self.device.channels[self._channel_selection[i]].name: <25}' ))
+                    tick_list_left[0].append((int(self._plot_offset * i), f'{self._channels[self._channel_selection[i]].name: <25}' ))
                 else:
                     tick_list_left[0].append((int(self._plot_offset * i + -j * self._plot_offset / 3), 
                                               f'{ self._plot_diff[i]["mean"] + (self._plot_diff[i]["diff"] * j ) : .2g}') )
         
         # Display the unit name on the right-side y-axis
-        tick_list_right = [[(self._plot_offset*i, self.device.channels[self._channel_selection[i]].unit_name) for i in range(self.num_channels)]]
+        tick_list_right = [[(self._plot_offset*i, self._channels[self._channel_selection[i]].unit_name) for i in range(self.num_channels)]]
         
         # Write the ticks to the plot
         self.RealTimePlotWidget.window.getAxis('left').setTicks(tick_list_left)
@@ -147,18 +167,19 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         self.RealTimePlotWidget.window.setYRange(-self._plot_offset / 3, (self.num_channels-2/3)*self._plot_offset)
         self.RealTimePlotWidget.window.setXRange(0, self.window_size)
 
-        # Create curves and set the position of the curve on the y-axis for each channel
-        self.curve = []
-        for i in range(self.num_channels):
-            self.c = pg.PlotCurveItem(pen = 'b')
-            self.RealTimePlotWidget.window.addItem(self.c)
-            self.c.setPos(0,(i)*self._plot_offset)
-            self.curve.append(self.c)
+        # All channels are drawn by a few curves, see _build_path()
+        self._add_curve()
         
-        # Initialise buffer for the plotter (maximum of 10 seconds)
+        # Initialise the min/max-columns of the plotter (maximum of 10 seconds)
         self._buffer_size = 10 # seconds
-        self.window_buffer = np.ones((self.active_channels, int(np.ceil(self.sample_rate*self._buffer_size)))) * np.nan
-        self.samples_seen = 0
+        self._decimator = MinMaxDecimator(self.active_channels, self.sample_rate, self._samples_per_column, self._buffer_size)
+        
+        # The displayed columns, per channel interleaved minima and maxima
+        self._display = None
+        self._path_y = None
+        
+        # CPU-time of drawing the new columns of a frame
+        self._render_time = latency_monitor.LatencyHistogram()
 
         # Connect button clicks to code execution
         self.autoscale_button.clicked.connect(self._update_scale)
@@ -223,34 +244,26 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         """ Method responsible for updating the scale whenever user input is 
             provided to do so.
         """
-        # Find white-out region using the Status channel (can't be 0)
-        x,y = self.curve[-1].getData()
-        # Transformed data is plotted so convert back to original values for correct
-        # display of the values on the y-axis
-        y = ( y * -1  * self._plot_diff[-1]['diff'] + self._plot_diff[-1]['mean'] )
-        
-        # The white-out region is entered in the plot as zeros, which have to be 
-        # omitted from the scaling calculation
-        idx_data = np.ones(np.size(y), dtype=bool)
-        idx_whiteout = np.where(np.abs(y) == 0)[0]
-        idx_data[idx_whiteout] = False
-        
-        # Loop over all channels to find individual scaling factors
+        if self._display is None:
+            return
+        
+        # Loop over all channels to find individual scaling factors. The 
+        # white-out region is NaN and is omitted from the scaling calculation
         for i in range(self.num_channels):
-            x,y = self.curve[i].getData()
-            
-            # Convert to original sample data 
-            y = ( y  * -1 * self._plot_diff[i]['diff'] + self._plot_diff[i]['mean'])             
+            y = self._display[self._channel_selection[i], :]
+            if not np.isfinite(y).any():
+                continue
             
             # Find the mean and the difference between minimum and maximum
-            self._plot_diff[i]['mean'] = (np.max(y[idx_data]) + np.min(y[idx_data]))/2
-            self._plot_diff[i]['diff'] = np.abs(np.max(y[idx_data]) - np.min(y[idx_data]))
+            self._plot_diff[i]['mean'] = (np.nanmax(y) + np.nanmin(y))/2
+            self._plot_diff[i]['diff'] = np.abs(np.nanmax(y) - np.nanmin(y))
             
             # Whenever there is no difference, the difference is reset to 2^31
             if self._plot_diff[i]['diff'] == 0:
                 self._plot_diff[i]['diff'] = 2**31
                 if i == self.num_channels - 1:
                     self._plot_diff[i]['diff'] = 1
+        self._redraw()
         
         # Update the range of the displayed y-axis range
         self.RealTimePlotWidget.window.setYRange(-self._plot_offset / 3, (self.num_channels - 2/3)*self._plot_offset)
@@ -261,7 +274,7 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         for i in range(self.num_channels):
             for j in [-1, 0, 1]:
                 if not bool(j):
-                    tick_list_left[0].append((int(self._plot_offset * i), f'{self.device.channels[self._channel_selection[i]].name: <25}' ))
+                    tick_list_left[0].append((int(self._plot_offset * i), f'{self._channels[self._channel_selection[i]].name: <25}' ))
                 else:
                     tick_list_left[0].append((int(self._plot_offset * i + -j * self._plot_offset / 3), 
                                               f'{ self._plot_diff[i]["mean"] + (self._plot_diff[i]["diff"] * j )  : >12.2g}') )
@@ -324,16 +337,10 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
                 self._plot_diff[i]['diff'] = copy_plot_diff[_idx_overlap[count]]['diff']
                 count += 1        
         
-        # Reset the parameter keeping track of the plotted graphis items and clear the window
-        self.curve = []
+        # Clear the window and draw the new selection of channels
         self.RealTimePlotWidget.window.clear()
-        
-        # Generate the new graphics objects required for plotting
-        for i in range(self.num_channels):
-            self.c = pg.PlotCurveItem(pen = 'b')
-            self.RealTimePlotWidget.window.addItem(self.c)
-            self.c.setPos(0,(i)*self._plot_offset)
-            self.curve.append(self.c)
+        self._add_curve()
+        self._redraw()
         
         # Update the range of the displayed y-axis range so that all channels are included in the plot
         self.RealTimePlotWidget.window.setYRange(-self._plot_offset / 3, (self.num_channels - 2/3)*self._plot_offset)
@@ -344,7 +351,7 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         for i in range(self.num_channels):
             for j in [-1, 0, 1]:
                 if not bool(j):
-                    tick_list_left[0].append((int(self._plot_offset * i), f'{self.device.channels[self._channel_selection[i]].name: <25}' ))
+                    tick_list_left[0].append((int(self._plot_offset * i), f'{self._channels[self._channel_selection[i]].name: <25}' ))
                 else:
                     tick_list_left[0].append((int(self._plot_offset * i + -j * self._plot_offset / 3), 
                                               f'{ self._plot_diff[i]["mean"] + (self._plot_diff[i]["diff"] * j )  : >12.2g}') )
@@ -527,58 +534,151 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         self._update_channel_display()        
 
         
-    @QtCore.Slot(object)
+    def _add_curve(self):
+        """ Adds the curves that draw all displayed channels to the plot: one
+            curve per segment of the sweep.
+        """
+        self.curves = []
+        for i in range(_NUM_SEGMENTS):
+            curve = pg.PlotCurveItem(pen = 'b', connect = 'finite')
+            self.RealTimePlotWidget.window.addItem(curve)
+            self.curves.append(curve)
+    
+    def _build_path(self):
+        """ Builds the path of all displayed columns: per channel the scaled
+            columns. The sweep is split in _NUM_SEGMENTS segments of columns, 
+            each drawn by its own curve: per channel the points of the 
+            segment, followed by a NaN that breaks the path between channels.
+            A segment ends with the first point of the next segment, so the 
+            path of a channel is not interrupted between segments. The 
+            NaN-values of the white-out region break the path as well.
+        """
+        num_points = self._display.shape[1]
+        
+        # Scaling (multiply with negative 1, needed due to inverted y axis) and 
+        # offset of every channel
+        self._path_scale = -1 / np.array([[diff['diff']] for diff in self._plot_diff])
+        self._path_offset = np.array([[self._plot_offset * i - diff['mean'] * self._path_scale[i, 0]] \
+                                      for i, diff in enumerate(self._plot_diff)])
+        self._path_y = self._display[self._channel_selection, :] * self._path_scale + self._path_offset
+        
+        # The first point of every segment, and the x-values of the segments
+        self._segment_starts = np.linspace(0, num_points, _NUM_SEGMENTS + 1).astype(int)
+        self._segment_x = []
+        for i in range(_NUM_SEGMENTS):
+            start, stop = self._segment_points(i)
+            x = np.full((self.num_channels, stop - start + 1), np.nan)
+            x[:, :-1] = self._time_axis[start:stop]
+            self._segment_x.append(x.ravel())
+    
+    def _segment_points(self, segment):
+        """ Returns the first and (exclusive) last point of a segment."""
+        start = self._segment_starts[segment]
+        return start, min(self._segment_starts[segment + 1] + 1, self._display.shape[1])
+    
+    def _draw_segments(self, segments):
+        """ Passes the path of the given segments to their curves."""
+        for i in segments:
+            start, stop = self._segment_points(i)
+            y = np.full((self.num_channels, stop - start + 1), np.nan)
+            y[:, :-1] = self._path_y[:, start:stop]
+            self.curves[i].setData(self._segment_x[i], y.ravel(), connect = 'finite')
+    
+    def _redraw(self):
+        """ Rebuilds the path of the curves, e.g. after a change of the scaling 
+            or of the displayed channels, and draws it.
+        """
+        self._path_y = None
+        if self._display is not None:
+            self._build_path()
+            self._draw_segments(range(_NUM_SEGMENTS))
+    
+    def _render(self):
+        """ Method that is called by the frame timer: draws the columns that 
+            are new since the previous frame. When drawing falls behind, the 
+            timer skips frames and the next frame draws all new columns.
+        """
+        start = time.thread_time()
+        data = self.worker.take_columns()
+        if data is None:
+            return
+        self.update_plot(data)
+        self._render_time.add(time.thread_time() - start)
+    
     def update_plot(self, data):
-        """ Method that receives the data from the sampling thread and writes
-            it to the GUI window.
+        """ Method that writes the new min/max-columns from the sampling thread
+            to the GUI window. Only the path of the new columns and of the 
+            white-out region after them is updated, and only the curves of the
+            segments that hold them are redrawn.
         """
+        column_width, start, mins, maxs, full = data
+        window_samples = int(round(self.window_size * self.sample_rate))
+        num_columns = int(np.ceil(window_samples / column_width))
+        
+        # The displayed columns are rebuilt when the time range or the level of
+        # the columns changes. The minimum and maximum of a column are drawn at
+        # the start and the middle of the column
+        if full or self._display is None or self._display.shape[1] != 2 * num_columns:
+            self._display = np.full((self.active_channels, 2 * num_columns), np.nan)
+            self._time_axis = np.arange(2 * num_columns) * column_width / (2 * self.sample_rate)
+            self._path_y = None
+        if not mins.shape[1]:
+            return
         
-        # PyQtGraph can't handle NaN-values, therefore the WhiteOut has to be implemented differently.
-        # This is done using a boolean array that states which points should not be connected (NaN values)        
-        con = np.isfinite(data)
-        data[~con] = 0
+        # Write the new columns at their position in the sweep
+        positions = (np.arange(start, start + mins.shape[1]) * column_width % window_samples) // column_width
+        self._display[:, 2 * positions] = mins
+        self._display[:, 2 * positions + 1] = maxs
         
-        # Find final index for updating values in right-side yticks list
-        idx_final = np.where(con[0,:] == False)
-        # Check whether the vector is not empty (can occur upon rescaling) and 
-        # stop the plot update when this is the case
-        if not idx_final[0].any():
-            return
+        # Add a White out region after the newest column to show the update of the samples
+        white_out = (positions[-1] + 1 + np.arange(int(np.floor(num_columns * 0.04)))) % num_columns
+        self._display[:, 2 * white_out] = np.nan
+        self._display[:, 2 * white_out + 1] = np.nan
         
-        # The last added value is the value before the White-out region.
-        # As the white-out region resets each time the end of the window is reached,
-        # different logic is needed when the white-out region lies around the wrapping points of the window
-        if idx_final[0][0] != 0:
-            idx_final = idx_final[0][0]-1
-        elif idx_final[0][0] == 0 and idx_final[0][-1] != (self.window_size * self.sample_rate)/self._downsampling_factor - 1:
-            idx_final = (self.window_size * self.sample_rate)/self._downsampling_factor - 1
+        if self._path_y is None:
+            self._build_path()
+            self._draw_segments(range(_NUM_SEGMENTS))
         else:
-            dummy_idx = np.where(idx_final[0][:] > 0.9 * (self.window_size * self.sample_rate)/self._downsampling_factor)
-            idx_final = idx_final[0][dummy_idx[0][0]]-1
-        
+            changed = np.concatenate((positions, white_out))
+            changed = np.concatenate((2 * changed, 2 * changed + 1))
+            self._path_y[:, changed] = self._display[self._channel_selection[:, np.newaxis], changed] * self._path_scale + self._path_offset
+            # The segments of the changed points; the first point of a segment
+            # is the last point of the previous segment as well
+            segments = np.searchsorted(self._segment_starts, changed, side = 'right') - 1
+            segments = np.concatenate((segments, np.searchsorted(self._segment_starts, changed, side = 'left') - 1))
+            self._draw_segments(np.unique(segments[(segments >= 0) & (segments < _NUM_SEGMENTS)]))
         
         # Update the x-axis ticks so that the time base is reflected correctly on the x-axis
-        t_end = int(np.nanmax(data[-1,:] / self.sample_rate))
+        t_end = int(np.nanmax(self._display[-1,:]) / self._counter_rate)
         bottom_ticks = [[(val % self.window_size, str(val)) for val in np.arange(t_end-(self.window_size-1), t_end+1, dtype=int)]]
         self.RealTimePlotWidget.window.getAxis('bottom').setTicks(bottom_ticks)
         
-        # Ensure right amount of data points are plotted (window_size * sample_rate)
-        time_axis = np.arange(0, self.window_size, self._downsampling_factor/self.sample_rate)        
-        
-        # Try to update the plot, due to user actions plotting might result in a warning
-        # for that specific plot instance, hence the try-except statement
-        try:
-            for i in range(self.num_channels):
-                # Draw data (apply scaling and multiply with negative 1 (needed due to inverted y axis))
-                self.curve[i].setData(time_axis, (data[self._channel_selection[i],:] - self._plot_diff[i]['mean']) / self._plot_diff[i]['diff'] * -1,
-                                      connect = np.logical_and(con[i,:], np.roll(con[i,:], -1)))
-            
-            # Update the ticks on the right side of the plot
-            tick_list_right = [[(int(self._plot_offset*i), f'{data[self._channel_selection[i],int(idx_final)]:< 10.2f} {self.device.channels[self._channel_selection[i]].unit_name}') \
-                                for i in range(self.num_channels)]]        
-            self.RealTimePlotWidget.window.getAxis('right').setTicks(tick_list_right)
-        except Exception:
-            pass
+        # Update the ticks on the right side of the plot with the centre of the newest column
+        last_values = (mins[:, -1] + maxs[:, -1]) / 2
+        tick_list_right = [[(int(self._plot_offset*i), f'{last_values[self._channel_selection[i]]:< 10.2f} {self._channels[self._channel_selection[i]].unit_name}') \
+                            for i in range(self.num_channels)]]        
+        self.RealTimePlotWidget.window.getAxis('right').setTicks(tick_list_right)
+    
+    def get_statistics(self):
+        """ Returns the CPU-time used by the plot.
+        
+            Returns:
+                <dict> for 'decimation' (per block of sample data, in the 
+                sampling thread) and 'render' (per drawn frame, in the GUI 
+                thread) the 'count', 'mean', 'p50', 'p99' and 'max' CPU-time 
+                in seconds and the 'load': the CPU-time as fraction of the time
+                since the start of the plot.
+        """
+        elapsed = max(time.time() - self._start_time, 1e-9)
+        statistics = {}
+        for name, h in (('decimation', self.worker.decimation_time), ('render', self._render_time)):
+            statistics[name] = {'count': h.count,
+                                'mean': h.mean,
+                                'p50': h.percentile(50),
+                                'p99': h.percentile(99),
+                                'max': h.max,
+                                'load': h.mean * h.count / elapsed}
+        return statistics
         
     def setupThread(self):
         """ Method that initialises the sampling thread of the device
@@ -591,36 +691,36 @@ class RealTimePlot(QtWidgets.QMainWindow, Ui_MainWindow):
         # Move the worker to a Thread
         self.worker.moveToThread(self.thread)
         
-        # Connect signals to slots depending on whether the plotter is active
-        if self.filter_app:
-            self.thread.started.connect(self.worker.update_filtered_samples)
-        else:
-            self.thread.started.connect(self.worker.update_samples)
-        self.worker.output.connect(self.update_plot)
+        # Connect signals to slots
+        self.thread.started.connect(self.worker.update_samples)
         
         # Start the thread
         self.thread.start()
+        self._start_time = time.time()
+        
+        # The plot is redrawn by a timer. A timer does not queue its timeouts,
+        # so frames are dropped when drawing falls behind
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._render)
+        self._timer.start(int(1000 / _FRAME_RATE))
 
     def closeEvent(self,event):
         """ Method that redefines the default close event of the GUI. This is
             needed to close the sampling thread when the figure is closed.
         """
-        # Stop the worker and the thread
+        # Stop the frame timer, the worker and the thread
+        self._timer.stop()
         self.worker.stop()
         self.thread.terminate()
         self.thread.wait()
         
-        # Unregister the Consumer from the sample data server. The RealTimeFilter object
-        # takes care of this action itself. 
-        if not self.filter_app:
-            sample_data_server.unregisterConsumer(self.device.id, self.worker.q_sample_sets)
+        # Unregister the Consumer from the sample data server
+        sample_data_server.unregisterConsumer(self.worker.source_id, self.worker.q_sample_sets)
         
 
 class SamplingThread(QtCore.QObject):
     """ Class responsible for sampling and preparing data for the GUI window.
     """
-    # Initialise the ouptut object
-    output = QtCore.Signal(object)
     def __init__(self, main_class):
         """ Setting up the class' properties that were passed from the GUI thread
         """
@@ -629,25 +729,30 @@ class SamplingThread(QtCore.QObject):
         self.num_channels = main_class.num_channels
         self.sample_rate = main_class.sample_rate
         self.window_size = main_class.window_size
-        self.window_buffer = main_class.window_buffer
-        self._buffer_size = main_class._buffer_size
-        self.samples_seen = main_class.samples_seen
+        self._decimator = main_class._decimator
         self.device = main_class.device
-        self._downsampling_factor = main_class._downsampling_factor
+        # The level, time range and next column of the drawn columns
+        self._emitted = None
+        self._next_column = 0
+        # The decimator is updated by this thread and read by the GUI thread
+        self._lock = threading.Lock()
+        # CPU-time of the decimation of a block of sample data
+        self.decimation_time = latency_monitor.LatencyHistogram()
         self.filter_app=main_class.filter_app
         
-        # Register to filter_app or sample data server and start measurement
+        # Prepare Queue
+        _QUEUE_SIZE = 1000
+        self.q_sample_sets = queue.Queue(_QUEUE_SIZE)
+        
+        # Register the consumer to the sample data server, for the sample data
+        # of the filter_app or of the device
+        self.source_id = self.filter_app.id if self.filter_app else self.device.id
+        sample_data_server.registerConsumer(self.source_id, self.q_sample_sets, 'real-time-plot')
+        
         if  self.filter_app:
             # Start the measurement using the filter thread
             self.filter_app.start()
         else:
-            # Prepare Queue
-            _QUEUE_SIZE = 1000
-            self.q_sample_sets = queue.Queue(_QUEUE_SIZE)
-        
-            # Register the consumer to the sample data server
-            sample_data_server.registerConsumer(self.device.id, self.q_sample_sets)
-        
             # Start measurement using the device thread
             self.device.start_measurement()
         
@@ -658,134 +763,54 @@ class SamplingThread(QtCore.QObject):
     @QtCore.Slot()
     def update_samples(self): 
         """ Method that retrieves samples from the queue and processes the samples.
-            Processing includes reshaping the data into the desired format, adding
-            white out region to show the refresh rate of the plot.
+            Processing is reshaping the data and updating the min/max-columns,
+            which are drawn by the frame timer of the GUI. The decimation keeps
+            up with the sample data, so the queue does not have to be trimmed.
         """
-        lag = False
         while self.sampling:
-            while not self.q_sample_sets.empty():
-                # If the sample_data_server queue contains more than 10 items, the queue is trimmed so that the plotter 
-                # has a lower delay
-                if self.q_sample_sets.qsize() > 10:
-                    lag = True
-                    print('The plotter skipped some samples to compensate for lag..')
-
-                elif self.q_sample_sets.qsize() < 6:
-                    lag = False
-                
-                
-                # Retrieve sample data from the sample_data_server queue
-                sd = self.q_sample_sets.get()
-                self.q_sample_sets.task_done()
-                
-                # Reshape the samples retrieved from the queue
-                samples = np.reshape(sd.samples, (sd.num_samples_per_sample_set, sd.num_sample_sets), order = 'F')
-                
-                # Add a White out region to show the update of the samples
-                white_out = int(np.floor(self.window_size*self.sample_rate*0.04))
-                plot_indices = (self.samples_seen + (np.arange(np.size(samples,1) + white_out) ) ) % \
-                    (self.sample_rate * self._buffer_size) 
-                
-                # Write sample data to the plot buffer
-                self.window_buffer[:,plot_indices[:-white_out]] = samples
-                self.window_buffer[:,plot_indices[-white_out:]] = np.nan
-                
-                # Update number of samples seen by the plotter
-                self.samples_seen += np.size(samples,1)
-                
-                # When the plotter lags, don't output the sample data to the plotter until (most of) the lag is gone
-                if lag:
-                    time.sleep(0.001)
-                else:
-    
-                    # The indices to be plotted ranges until the final index of the white out region,
-                    # and has a total number of samples equal to the window size
-                    indices = np.arange(((self.samples_seen + white_out)  - \
-                                     (self.window_size * self.sample_rate)) , \
-                                        (self.samples_seen + white_out) , dtype = int)
-                    
-                    # The indices have to match with the indices of the window buffer
-                    scroll_idx = (indices) % (self.sample_rate * self._buffer_size)
+            # Retrieve sample data from the sample_data_server queue
+            try:
+                sd = self.q_sample_sets.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            self.q_sample_sets.task_done()
+            
+            # Reshape the samples retrieved from the queue
+            samples = np.reshape(sd.samples, (sd.num_samples_per_sample_set, sd.num_sample_sets), order = 'F')
+            
+            # Update the min/max-columns of all levels with the new samples
+            start = time.thread_time()
+            with self._lock:
+                self._decimator.add(samples)
+                self.decimation_time.add(time.thread_time() - start)
+            latency_monitor.stamp(sd, 'plot')
     
-                    # The buffer indices have a wrapping point (e.g. in a buffer of 4000 samples, the wrapping point is from 3999 to 0)
-                    # As the window size might not line up with this exactly,
-                    # the wrapping point needs to be identified to ensure that the plot does not 'jump'.
-                    split_idx = np.where(indices % (self.sample_rate * self.window_size) == 1)[0][0]
-                    
-                    # Retrieve the correct sample data that needs to be plotted
-                    plot_data = np.hstack((self.window_buffer[:, scroll_idx[split_idx:]], \
-                                           self.window_buffer[:, scroll_idx[0:split_idx]]))
-                    
-                    plot_data = plot_data[:,::self._downsampling_factor]
-                        
-                    # Output sample data
-                    self.output.emit(plot_data)
-                
-                    # Pause the thread for a small time so that plot can be updated before receiving next data chunk
-                    # Pause should be long enough to have the screen update itself
-                    time.sleep(0.03)
+    def take_columns(self):
+        """ Returns the min/max-columns that are new since the previous call, 
+            at the level that fits the time range of the plot, or None when 
+            there are no new columns. All columns in the time range are 
+            returned when the time range or level changes.
             
-    @QtCore.Slot()
-    def update_filtered_samples(self): 
-        """ Method that retrieves samples from the queue and processes the samples.
-            Processing includes reshaping the data into the desired format, adding
-            white out region to show the refresh rate of the plot.
+            Returns:
+                <tuple> The width of a column in samples, the index of the 
+                first column, the minima and maxima as (channels, columns) 
+                arrays, and whether all columns in the time range are returned.
         """
-        lag=False
-        while self.sampling:
-            while not self.filter_app.q_filtered_sample_sets.empty():
-                if self.filter_app.q_filtered_sample_sets.qsize() > 10:
-                    lag = True
-                    print('The plotter skipped some samples to compensate for lag..')
-
-                elif self.filter_app.q_filtered_sample_sets.qsize() < 6:
-                    lag = False
-
-                sd = self.filter_app.q_filtered_sample_sets.get()
-                self.filter_app.q_filtered_sample_sets.task_done()
-                samples = copy(sd)
-
-                # Add a White out region to show the update of the samples
-                white_out = int(np.floor(self.window_size*self.sample_rate*0.04))
-                plot_indices = (self.samples_seen + (np.arange(np.size(samples,1) + white_out) ) ) % \
-                    (self.sample_rate * self._buffer_size) 
-                
-                # Write sample data to the plot buffer
-                self.window_buffer[:,plot_indices[:-white_out]] = samples
-                self.window_buffer[:,plot_indices[-white_out:]] = np.nan
-                
-                # Update number of samples seen by the plotter
-                self.samples_seen += np.size(samples,1)
-                
-                if lag:
-                        time.sleep(0.001)
-                else:    
-                    # The indices to be plotted ranges until the final index of the white out region,
-                    # and has a total number of samples equal to the window size
-                    indices = np.arange(((self.samples_seen + white_out)  - \
-                                     (self.window_size * self.sample_rate)) , \
-                                        (self.samples_seen + white_out) , dtype = int)
-                    
-                    # The indices have to match with the indices of the window buffer
-                    scroll_idx = (indices) % (self.sample_rate * self._buffer_size)
-    
-                    # The buffer indices have a wrapping point (e.g. in a buffer of 4000 samples, the wrapping point is from 3999 to 0)
-                    # As the window size might not line up with this exactly,
-                    # the wrapping point needs to be identified to ensure that the plot does not 'jump'.
-                    split_idx = np.where(indices % (self.sample_rate * self.window_size) == 1)[0][0]
-                    
-                    # Retrieve the correct sample data that needs to be plotted
-                    plot_data = np.hstack((self.window_buffer[:, scroll_idx[split_idx:]], \
-                                           self.window_buffer[:, scroll_idx[0:split_idx]]))
-                    
-                    plot_data = plot_data[:,::self._downsampling_factor]
-                        
-                    # Output sample data
-                    self.output.emit(plot_data)
-                
-                    # Pause the thread for a small time so that plot can be updated before receiving next data chunk
-                    # Pause should be long enough to have the screen update itself
-                    time.sleep(0.03)
+        window_samples = int(round(self.window_size * self.sample_rate))
+        with self._lock:
+            level = self._decimator.level_for(window_samples, _MAX_PLOT_COLUMNS)
+            column_width = self._decimator.column_width(level)
+            stop = self._decimator.num_columns[level]
+            first = stop - int(np.ceil(window_samples / column_width))
+            
+            full = self._emitted != (level, self.window_size)
+            start = first if full else max(self._next_column, first)
+            if not stop or ((stop <= start) and not full):
+                return None
+            mins, maxs = self._decimator.columns(level, start, stop)
+        self._emitted = (level, self.window_size)
+        self._next_column = stop
+        return column_width, start, mins, maxs, full
             
     def stop(self):
         """ Method that is executed when the thread is terminated. 
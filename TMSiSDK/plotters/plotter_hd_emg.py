@@ -31,15 +31,55 @@ import numpy as np
 import pyqtgraph as pg
 import time
 import queue
-from scipy import signal, interpolate
+from scipy import sparse
 import sys
 
 from .. import tmsi_device
-from .. import sample_data_server
+from .. import sample_data_server, latency_monitor
+from ..filters.pipeline import Pipeline, ButterworthStage, RmsStage
 
 from ..device import DeviceInterfaceType, ChannelType
 
 
+# Number of quarter turns of the grid per orientation of the tail
+_ROTATIONS = {'left': 0, 'up': 1, 'right': 2, 'down': 3}
+
+def _interpolation_matrix(num_channels, tail_orientation, x_interpolate, y_interpolate):
+    """ Precomputes the bilinear interpolation of the RMS-values of a grid of
+        channels (8 rows of num_channels / 8 columns, rotated according to the
+        orientation of the tail) to the pixels of the heatmap. Outside the
+        grid, the value of the nearest channel is used.
+
+        Returns:
+            <tuple> The sparse (pixels, channels) interpolation matrix and the
+            (rows, columns) shape of the heatmap.
+    """
+    rotation = _ROTATIONS[tail_orientation.lower()]
+    # The channel index of every grid position, as the RMS-values are placed
+    grid = np.rot90(np.reshape(np.arange(num_channels), (num_channels // 8, 8)).T, rotation)
+    if rotation % 2:
+        row_coords, col_coords = x_interpolate, y_interpolate
+    else:
+        row_coords, col_coords = y_interpolate, x_interpolate
+
+    def weights(coords, size):
+        coords = np.clip(coords, 0, size - 1)
+        low = np.minimum(np.floor(coords).astype(int), size - 2)
+        return low, coords - low
+
+    r0, fr = weights(np.asarray(row_coords), grid.shape[0])
+    c0, fc = weights(np.asarray(col_coords), grid.shape[1])
+    r0, c0 = np.meshgrid(r0, c0, indexing='ij')
+    fr, fc = np.meshgrid(fr, fc, indexing='ij')
+
+    columns = np.stack([grid[r0, c0], grid[r0, c0 + 1], grid[r0 + 1, c0], grid[r0 + 1, c0 + 1]], axis=-1)
+    values = np.stack([(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc], axis=-1)
+    num_pixels = r0.size
+    matrix = sparse.csr_matrix((values.ravel(), columns.ravel(), np.arange(0, 4 * num_pixels + 1, 4)),
+                               shape=(num_pixels, num_channels))
+    return matrix, r0.shape
+
+
 class HDEMGPlot(pg.GraphicsLayoutWidget):
     """ Class that creates a GUI to display the impedance values in a gridded
         layout.
@@ -81,6 +121,12 @@ class HDEMGPlot(pg.GraphicsLayoutWidget):
         # Upper limit colorbar
         self.signal_lim = signal_lim
         
+        # The RMS-envelope of the 10 Hz high-pass filtered channels over 250 ms,
+        # every 250 ms. The plot starts and stops the measurement itself
+        self.envelope = Pipeline(self.device, [ButterworthStage(order = 2, Fc_hp = 10),
+                                               RmsStage(window = 0.25, hop = 0.25)],
+                                 name = 'hd-emg-envelope', controls_measurement = False)
+        
         # Set up UI and thread
         self.initUI()
         self.setupThread()
@@ -204,7 +250,8 @@ class HDEMGPlot(pg.GraphicsLayoutWidget):
         self.thread.terminate()
         self.thread.wait()
         
-        sample_data_server.unregisterConsumer(self.device.id, self.worker.q_sample_sets)
+        sample_data_server.unregisterConsumer(self.envelope.id, self.worker.q_sample_sets)
+        self.envelope.stop()
         
 
 class SamplingThread(QtCore.QObject):
@@ -221,27 +268,21 @@ class SamplingThread(QtCore.QObject):
         self._EMG_chans = main_class._EMG_chans
         self._chan_offset = main_class._chan_offset
         
-        self.window_buffer = np.zeros((len(self.device.channels)-2-self._chan_offset, self.sample_rate * 5))
-        self.window_rms_size = self.sample_rate // 4
-        self._add_final = 0
+        # The envelope is published to the sample data server, so it can be
+        # used by other consumers (e.g. a control application) as well
+        self.envelope = main_class.envelope
         
-        self.sos = signal.butter(2, 10, 'highpass', fs=self.sample_rate, output='sos')
-        z_sos0 = signal.sosfilt_zi(self.sos)
-        self.z_sos = np.repeat(z_sos0[:, np.newaxis, :], len(self.device.channels)-2-self._chan_offset, axis=1)
-        
-        self._x_grid = np.arange(0, self._EMG_chans/8, dtype=int)
-        self._y_grid = np.arange(0, 8, dtype=int)
-        
-        self._x_interpolate = main_class._x_interpolate
-        self._y_interpolate = main_class._y_interpolate
-        
-        self.tail_orientation = main_class.tail_orientation
+        # The mapping of the RMS-values to the heatmap, including the
+        # orientation of the grid, as one sparse matrix
+        self._interpolation, self._heatmap_shape = _interpolation_matrix(self._EMG_chans, main_class.tail_orientation,
+                                                                         main_class._x_interpolate, main_class._y_interpolate)
         
         # Prepare Queue
         self.q_sample_sets = queue.Queue(1000)
         
-        # Register the consumer to the sample server
-        sample_data_server.registerConsumer(self.device.id, self.q_sample_sets)
+        # Register the consumer to the envelope at the sample server
+        self.envelope.start()
+        sample_data_server.registerConsumer(self.envelope.id, self.q_sample_sets, 'hd-emg-plot')
         
         # Start measurement
         self.device.start_measurement()
@@ -261,46 +302,12 @@ class SamplingThread(QtCore.QObject):
                 
                 # Reshape the samples retrieved from the queue
                 samples = np.reshape(sd.samples, (sd.num_samples_per_sample_set, sd.num_sample_sets), order = 'F')
-                self.new_samples = sd.num_sample_sets
-                
-                self.window_buffer[:, self._add_final:(self._add_final + self.new_samples)] = samples[self._chan_offset:-2,:]
                 
-                if self._add_final + self.new_samples > self.window_rms_size:
-                    filt_data, self.z_sos = signal.sosfilt(self.sos, self.window_buffer[:, 0:self.window_rms_size], zi = self.z_sos)
-                    
-                    rms_data = np.sqrt(np.mean(filt_data**2, axis = 1))
-                    
-                    if self.tail_orientation == 'Left' or self.tail_orientation == 'left': 
-                        rms_data = np.reshape(rms_data, (int(self._EMG_chans/8),8)).T
-                        
-                        f = interpolate.interp2d(self._x_grid, self._y_grid, rms_data, kind='linear')
-                        output_heatmap = f(self._x_interpolate, self._y_interpolate)
-
-                    elif self.tail_orientation == 'Up' or self.tail_orientation == 'up': 
-                        rms_data = np.rot90(np.reshape(rms_data, (int(self._EMG_chans/8),8)).T, 1)
-                        
-                        f = interpolate.interp2d(self._y_grid, self._x_grid, rms_data, kind='linear')
-                        output_heatmap = f(self._y_interpolate, self._x_interpolate)
-
-                    elif self.tail_orientation == 'Right' or self.tail_orientation == 'right': 
-                        rms_data = np.rot90(np.reshape(rms_data, (int(self._EMG_chans/8),8)).T, 2)
-                        
-                        f = interpolate.interp2d(self._x_grid, self._y_grid, rms_data, kind='linear')
-                        output_heatmap = f(self._x_interpolate, self._y_interpolate)
-
-                    elif self.tail_orientation == 'Down' or self.tail_orientation == 'down': 
-                        rms_data = np.rot90(np.reshape(rms_data, (int(self._EMG_chans/8),8)).T, 3)
-                        
-                        f = interpolate.interp2d(self._y_grid, self._x_grid, rms_data, kind='linear')
-                        output_heatmap = f(self._y_interpolate, self._x_interpolate)
-                    
-                    self._add_final = 0
-
-                    self.window_buffer = np.hstack((self.window_buffer[:,self.window_rms_size:], np.zeros((len(self.device.channels)-2-self._chan_offset, self.window_rms_size)) ))
-                    self.output.emit(output_heatmap)
-                    
-                else:
-                    self._add_final += self.new_samples
+                # Interpolate the heatmaps of all RMS-values in the block at once
+                heatmaps = self._interpolation @ samples[self._chan_offset:self._chan_offset + self._EMG_chans, :]
+                for heatmap in heatmaps.T:
+                    self.output.emit(heatmap.reshape(self._heatmap_shape))
+                latency_monitor.stamp(sd, 'hd_emg_plot')
                 
             # Pause the thread so that the update does not happen too fast
             time.sleep(0.01)
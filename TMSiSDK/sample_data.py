@@ -47,8 +47,18 @@ class SampleData:
         num_samples_per_sample_set: <int> The number of samples within one sample-set.
 
         samples: <float[]> Array of samples, sequentially in sample-sets and sampling-event.
+
+        timestamps: <dict> Per pipeline-stage the time (time.perf_counter()) at
+                    which the sample-data passed the stage. Only filled when the
+                    <latency_monitor> is enabled.
+
+        gaps: <list> Detected gaps in the COUNTER-sequence as
+              (index, num_lost_sample_sets)-tuples, with the index of the
+              first sample-set after the gap within this sample-data.
     """
     def __init__(self, num_sample_sets, num_samples_per_sample_set, samples):
         self.num_sample_sets = num_sample_sets
         self.num_samples_per_sample_set = num_samples_per_sample_set
-        self.samples = samples
\ No newline at end of file
+        self.samples = samples
+        self.timestamps = {}
+        self.gaps = []
\ No newline at end of file
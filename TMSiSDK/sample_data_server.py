@@ -26,16 +26,18 @@ TMSiSDK: Sample Data Server module
 '''
 
 from . import settings
+from . import latency_monitor
 from copy import copy
 
 class SampleDataConsumer:
     """ Local class which identifies which consumer registered for what device
     """
-    def __init__(self, id, q):
+    def __init__(self, id, q, name):
         self.id = id
         self.q = q
+        self.name = name
 
-def registerConsumer(id, q):
+def registerConsumer(id, q, name = None):
     """ Registers a consumer-queue to receive the sample-data of a specific
         device.
         This method is called by sample-data-consumers.
@@ -46,8 +48,13 @@ def registerConsumer(id, q):
                 must be put into the registered <queue>
 
             q: <queue> The queue into which received sample-data will be put.
+
+            name: <string> Optional name of the consumer, used to identify its
+                queue in the statistics of the <latency_monitor>.
     """
-    settings._consumer_list.append(SampleDataConsumer(id, q))
+    if name is None:
+        name = 'consumer-' + str(next(settings._consumer_numbers))
+    settings._consumer_list.append(SampleDataConsumer(id, q, name))
 
 def unregisterConsumer(id, q):
     """ Unregisters a consumer-queue associated with a file-writer or plotter 
@@ -69,7 +76,18 @@ def unregisterConsumer(id, q):
                 idx_remove = copy(i)
     settings._consumer_list.pop(idx_remove)
 
-def putSampleData(id, data):
+def createProducerId():
+    """ Creates a unique id for a sample-data-producer which is not backed by
+        a device-handle (e.g. a replayed recording or a processing pipeline).
+        Consumers register with this id in the same way as with <Device.id>.
+
+        Returns:
+            <int> The unique producer id. The returned ids are negative, so they
+            never collide with the handle-values of opened devices.
+    """
+    return next(settings._producer_ids)
+
+def putSampleData(id, data, stage = None):
     """ Puts a <SampleData>-object, coming from device <Device.id> into the queues
         of registered consumers.
         This method is called by sample-data-producers.
@@ -79,11 +97,22 @@ def putSampleData(id, data):
                 received sample-data to the sample-data-server.
 
             data <SampleData> The sample-data.
+
+            stage: <string> Name of the stage in the statistics of the
+                <latency_monitor>, by default 'published-<id>'. Every producer
+                uses its own name, so the latency of publishing the sample-data
+                of a device is not mixed with that of filters or pipelines.
     """
-    num_consumers = len(settings._consumer_list)
-    for i in range(num_consumers):
-        if (settings._consumer_list[i].id == id):
-            settings._consumer_list[i].q.put(data)
+    # Stamp before the data is handed over: from then on consumer-threads
+    # stamp the same object
+    latency_monitor.stamp(data, stage if stage else 'published-' + str(id))
+
+    # Iterate over a copy: consumers may (un)register from other threads,
+    # e.g. when a file-writer is opened or closed during a measurement
+    for consumer in list(settings._consumer_list):
+        if (consumer.id == id):
+            consumer.q.put(data)
+            latency_monitor.record_queue_depth(consumer.name, consumer.q)
 
 
 
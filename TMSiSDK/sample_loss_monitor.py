@@ -0,0 +1,170 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+TMSiSDK: Sample-loss detection based on the COUNTER-channel
+
+The COUNTER-channel of a measurement increments by one for every sample-set
+taken by the device. Every received block of sample-sets is checked on jumps
+in the counter-sequence: each jump is recorded as a gap with its position and
+the number of lost sample-sets. Running loss statistics are kept for the
+complete measurement.
+
+Usage:
+    monitor = device.sample_loss
+    ...
+    print(monitor.get_statistics())
+
+'''
+
+import threading
+import numpy as np
+
+# The COUNTER is an unsigned 32-bits value that wraps around
+_COUNTER_RANGE = 2**32
+
+class Gap:
+    """ <Gap> represents a jump in the COUNTER-sequence. It has the next properties:
+
+        sample_set_index: <int> Index, within all received sample-sets of the
+                          measurement, of the first sample-set after the gap.
+
+        counter: <int> COUNTER-value of the first sample-set after the gap.
+
+        num_lost_sample_sets: <int> The number of sample-sets missing in the gap.
+    """
+    def __init__(self, sample_set_index, counter, num_lost_sample_sets):
+        self.sample_set_index = sample_set_index
+        self.counter = counter
+        self.num_lost_sample_sets = num_lost_sample_sets
+
+    def __repr__(self):
+        return 'Gap(sample_set_index={}, counter={}, num_lost_sample_sets={})'.format(
+            self.sample_set_index, self.counter, self.num_lost_sample_sets)
+
+class SampleLossMonitor:
+    """ <SampleLossMonitor> tracks the integrity of the COUNTER-sequence of one
+        measurement. It has the next properties:
+
+        num_received: <int> The number of received sample-sets.
+
+        num_lost: <int> The number of lost sample-sets.
+
+        num_discontinuities: <int> The number of times the COUNTER repeated a
+                             value or jumped backwards. These are not counted
+                             as lost sample-sets.
+
+        gaps: <list of Gap> The detected gaps, the most recent <max_gaps> are kept.
+    """
+    def __init__(self, sample_rate = 0, last_counter = 0, max_gaps = 10000):
+        """ Args:
+                sample_rate: <int> Sample rate of the measurement, used to express
+                             the lost sample-sets in seconds.
+
+                last_counter: <int> The COUNTER-value preceding the measurement.
+                              The COUNTER of a measurement starts at 1.
+
+                max_gaps: <int> The maximum number of gaps to keep.
+        """
+        self.sample_rate = sample_rate
+        self.max_gaps = max_gaps
+        self._lock = threading.Lock()
+        self._last_counter = last_counter
+        self.num_received = 0
+        self.num_lost = 0
+        self.num_discontinuities = 0
+        self.largest_gap = 0
+        self._num_gaps = 0
+        self._gaps = []
+
+    @property
+    def num_gaps(self):
+        """ 'int' : The total number of detected gaps."""
+        return self._num_gaps
+
+    @property
+    def gaps(self):
+        with self._lock:
+            return list(self._gaps)
+
+    @property
+    def loss_ratio(self):
+        """ 'float' : The fraction of the sample-sets that got lost."""
+        total = self.num_received + self.num_lost
+        return self.num_lost / total if total else 0.0
+
+    def update(self, counter):
+        """ Checks the COUNTER-values of a block of received sample-sets.
+
+            Args:
+                counter: <array> The COUNTER-values of the sample-sets in the block.
+
+            Returns:
+                <list> of (index, num_lost_sample_sets)-tuples: per gap the index
+                within the block of the first sample-set after the gap.
+        """
+        counter = np.asarray(counter, dtype=np.int64)
+        if counter.size == 0:
+            return []
+
+        steps = np.diff(counter, prepend=self._last_counter) % _COUNTER_RANGE
+        idx = np.flatnonzero(steps != 1)
+
+        block_gaps = []
+        with self._lock:
+            for i in idx:
+                step = int(steps[i])
+                if (step == 0) or (step > _COUNTER_RANGE // 2):
+                    self.num_discontinuities += 1
+                    continue
+                num_lost = step - 1
+                block_gaps.append((int(i), num_lost))
+                self.num_lost += num_lost
+                self.largest_gap = max(self.largest_gap, num_lost)
+                self._num_gaps += 1
+                self._gaps.append(Gap(self.num_received + int(i), int(counter[i]), num_lost))
+            if len(self._gaps) > self.max_gaps:
+                del self._gaps[:len(self._gaps) - self.max_gaps]
+            self.num_received += counter.size
+            self._last_counter = int(counter[-1])
+        return block_gaps
+
+    def get_statistics(self):
+        """ Returns the loss statistics.
+
+            Returns:
+                <dict> with the number of received and lost sample-sets, the
+                number of gaps, the largest gap, the loss ratio and, when the
+                sample rate is known, the lost time in seconds.
+        """
+        with self._lock:
+            statistics = {'num_received': self.num_received,
+                          'num_lost': self.num_lost,
+                          'num_gaps': self._num_gaps,
+                          'num_discontinuities': self.num_discontinuities,
+                          'largest_gap': self.largest_gap,
+                          'loss_ratio': self.loss_ratio}
+        if self.sample_rate:
+            statistics['lost_seconds'] = statistics['num_lost'] / self.sample_rate
+            statistics['largest_gap_seconds'] = statistics['largest_gap'] / self.sample_rate
+        return statistics
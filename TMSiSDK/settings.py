@@ -25,6 +25,12 @@ TMSiSDK: module for SDK 'locally' used settings
 
 '''
 
+import itertools
+import os
+
+# Directory of the caches which are kept between sessions, like the device-discovery
+_cache_dir = os.path.join(os.path.expanduser('~'), '.TMSiSDK')
+
 def _initialize():
     """
     Instantiates and initializes 'local' static variables fro SDK-modules.
@@ -37,3 +43,9 @@ def _initialize():
     """
     global _consumer_list # used in <sample_data_server.py> : list of registered
     _consumer_list = []   # consumer for receipt of sample-data
+
+    global _producer_ids  # used in <sample_data_server.py> : source of unique ids
+    _producer_ids = itertools.count(-2, -1) # for producers that are not a device-handle
+
+    global _consumer_numbers # used in <sample_data_server.py> : source of unique
+    _consumer_numbers = itertools.count()  # default names of consumers
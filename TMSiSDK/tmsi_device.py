@@ -30,6 +30,7 @@ from enum import Enum
 from .error import TMSiError, TMSiErrorCode
 from .device import DeviceInterfaceType
 from .devices.saga.saga_device import SagaDevice
+from .devices.saga import saga_device
 
 from . import settings
 
@@ -37,12 +38,14 @@ class DeviceType(Enum):
     none = 0
     saga = 1
 
+
 def initialize():
     """Initializes the TMSi-SDK environment.
         This must be done once before starting using the SDK.
     """
     settings._initialize()
 
+
 def create(dev_type, dr_interface, ds_interface = DeviceInterfaceType.none):
     """Creates a Device-object to interface with a TMSI measurement system.
 
@@ -69,4 +72,23 @@ def create(dev_type, dr_interface, ds_interface = DeviceInterfaceType.none):
     else:
         raise TMSiError(TMSiErrorCode.api_incorrect_argument)
 
-    return dev
\ No newline at end of file
+    return dev
+
+
+def discover(dev_type, use_cache = True):
+    """Discovers the attached measurement systems on all supported interfaces.
+
+        Args:
+            dev_type : <DeviceType> The measurement-system type.
+                       Momentarily only the SAGA system is supported.
+
+            use_cache : <bool> Return the devices found by an earlier discovery
+                        immediately and refresh them in the background.
+
+        Returns:
+            <list> The information (interfaces and serial numbers) of the
+            found systems.
+    """
+    if (dev_type == DeviceType.saga):
+        return saga_device.discover(use_cache = use_cache)
+    raise TMSiError(TMSiErrorCode.api_incorrect_argument)
@@ -0,0 +1,168 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+Benchmark : Import-time and memory usage of the modules a headless acquisition
+            application uses. Every module is imported in a fresh interpreter,
+            which also reports the GUI-, plotting- and analysis-packages (Qt,
+            tkinter, matplotlib, MNE, pandas, ...) the import has loaded.
+            These packages must only be loaded by the features that use them;
+            the benchmark exits with a non-zero status when a headless module
+            loads one of them.
+
+            Run from the 'benchmarks'-directory, e.g. :
+
+                python benchmark_imports.py --repeat 5 --output imports.json
+
+            Results of different commits can be compared with :
+
+                python benchmark_imports.py --output new.json --baseline old.json
+
+'''
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules used by a headless acquisition application
+HEADLESS_MODULES = ['TMSiSDK.tmsi_device',
+                    'TMSiSDK.devices.replay.replay_device',
+                    'TMSiSDK.devices.multi.multi_device',
+                    'TMSiSDK.file_writer',
+                    'TMSiSDK.file_formats.poly5_file_writer',
+                    'TMSiSDK.file_formats.xdf_file_writer',
+                    'TMSiSDK.file_readers',
+                    'TMSiSDK.filters',
+                    'TMSiSDK.plotters']
+
+# Packages that only the GUI-, plotting- and analysis-features may load
+HEAVY_PACKAGES = ['tkinter', 'matplotlib', 'PySide2', 'pyqtgraph', 'mne', 'pandas', 'pyxdf']
+
+_CHILD = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+import_time = time.perf_counter() - start
+try:
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+except ImportError:
+    max_rss = None
+print(json.dumps({{'import_time': import_time, 'max_rss': max_rss,
+                  'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def run_module(module, repeat):
+    """ Imports a module 'repeat' times, every time in a fresh interpreter.
+
+        Returns:
+            <dict> with the median import-time, the peak resident memory and the
+            heavy packages that were loaded, or the reason why the module is skipped.
+    """
+    result = {'module': module}
+    runs = []
+    for _ in range(repeat):
+        code = _CHILD.format(root = _ROOT, module = module, heavy = HEAVY_PACKAGES)
+        process = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True)
+        if process.returncode != 0:
+            lines = process.stderr.strip().splitlines()
+            result['skipped'] = lines[-1] if lines else 'exit status ' + str(process.returncode)
+            return result
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    result['import_time'] = statistics.median(r['import_time'] for r in runs)
+    result['max_rss'] = runs[-1]['max_rss']
+    result['heavy'] = runs[-1]['heavy']
+    return result
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'date': datetime.now().isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor()}
+
+
+def print_results(results, baseline = None):
+    baseline_time = {}
+    if baseline:
+        for r in baseline['results']:
+            if 'import_time' in r:
+                baseline_time[r['module']] = r['import_time']
+
+    print(f"\n{'module':<42}{'import [ms]':>12}{'RSS [MB]':>10}" + (f"{'vs baseline':>13}" if baseline else '') + '  heavy packages')
+    for r in results:
+        line = f"{r['module']:<42}"
+        if 'skipped' in r:
+            print(line + '   skipped (' + r['skipped'] + ')')
+            continue
+        line += f"{r['import_time'] * 1000:>12.1f}"
+        line += f"{r['max_rss'] / 2**20:>10.1f}" if r['max_rss'] is not None else f"{'-':>10}"
+        if baseline:
+            if r['module'] in baseline_time:
+                line += f"{r['import_time'] / baseline_time[r['module']]:>12.2f}x"
+            else:
+                line += f"{'':>13}"
+        print(line + '  ' + (', '.join(r['heavy']) if r['heavy'] else '-'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark the import-time of the headless modules.')
+    parser.add_argument('--modules', nargs = '+', default = HEADLESS_MODULES, help = 'modules to import')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'number of imports per module')
+    parser.add_argument('--output', help = 'json-file to write the results to')
+    parser.add_argument('--baseline', help = 'json-file with results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules:
+        results.append(run_module(module, args.repeat))
+        print('.', end = '', flush = True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'metadata': _metadata(), 'results': results}, f, indent = 2)
+
+    # Fail when a headless module loads a GUI-, plotting- or analysis-package
+    if any(r.get('heavy') for r in results):
+        sys.exit(1)
@@ -0,0 +1,444 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+Benchmark : Throughput, CPU-load and peak memory usage of the stages of the 
+            acquisition pipeline: sample conversion, fan-out by the 
+            sample-data-server, real-time filtering and the Poly5/XDF file-writers.
+            The stages are driven by synthetic sample-data of configurable 
+            channel counts and sample rates. No device is needed.
+
+            Run from the 'benchmarks'-directory, e.g. :
+
+                python benchmark_pipeline.py --channels 32 64 136 --rates 500 4096 --output results.json
+
+            Results of different commits can be compared with :
+
+                python benchmark_pipeline.py --output new.json --baseline old.json
+
+'''
+
+import sys
+sys.path.append("../")
+
+import argparse
+import ctypes
+import json
+import os
+import platform
+import queue
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime
+
+import numpy as np
+
+from TMSiSDK import settings, sample_data, sample_data_server
+from TMSiSDK.device import DeviceChannel, ChannelType
+from TMSiSDK.devices.replay.replay_device import ReplayDevice
+
+# A SAGA-system delivers the sample-data every 100 milli-seconds
+_BLOCK_DURATION = 0.1
+_NUM_BIP_CHANNELS = 4
+_NUM_AUX_CHANNELS = 9
+
+
+class SyntheticData:
+    """ Synthetic sample-data with the channel layout of a SAGA-system: 
+        CREF, UNI-channels, BIP-channels, AUX-channels, STATUS and COUNTER.
+    """
+    def __init__(self, num_channels, sample_rate, duration):
+        self.num_channels = num_channels
+        self.sample_rate = sample_rate
+        self.duration = duration
+        self.num_sample_sets = int(sample_rate * duration)
+
+        num_uni = num_channels - 2 - _NUM_BIP_CHANNELS - _NUM_AUX_CHANNELS
+        types = [ChannelType.UNI] * num_uni + [ChannelType.BIP] * _NUM_BIP_CHANNELS + \
+                [ChannelType.AUX] * _NUM_AUX_CHANNELS + [ChannelType.status, ChannelType.counter]
+        names = ['CREF'] + ['UNI ' + str(i) for i in range(1, num_uni)] + \
+                ['BIP ' + str(i) for i in range(1, _NUM_BIP_CHANNELS + 1)] + \
+                ['AUX ' + str(i) for i in range(1, _NUM_AUX_CHANNELS + 1)] + ['STATUS', 'COUNTER']
+        self.channels = [DeviceChannel(t, sample_rate, n, '-' if t.value >= ChannelType.status.value else 'µVolt', True) \
+                         for t, n in zip(types, names)]
+
+        # 10 Hz sine wave plus noise on the analogue channels, a running COUNTER
+        rng = np.random.default_rng(0)
+        t = np.arange(self.num_sample_sets) / sample_rate
+        self.samples = (50 * np.sin(2 * np.pi * 10 * t) + 10 * rng.standard_normal((num_channels, self.num_sample_sets))).astype(np.float32)
+        self.samples[-2] = 0
+        self.samples[-1] = np.arange(1, self.num_sample_sets + 1)
+
+        # Split the sample-data into the blocks as delivered by the device
+        self.num_sets_per_block = int(sample_rate * _BLOCK_DURATION)
+        self.blocks = []
+        for pos in range(0, self.num_sample_sets, self.num_sets_per_block):
+            block = self.samples[:, pos:pos + self.num_sets_per_block]
+            self.blocks.append(sample_data.SampleData(block.shape[1], num_channels, block.flatten('F').tolist()))
+
+    def create_device(self):
+        return ReplayDevice.from_samples(self.samples, self.sample_rate, self.channels)
+
+
+def setup_conversion(data):
+    """ Conversion of raw device buffers into <SampleData> by the _ConversionThread."""
+    from TMSiSDK.devices.saga.saga_device import _ConversionThread
+    from TMSiSDK.devices.saga.saga_types import SagaChannel, SagaCalibrationTable
+
+    channels = []
+    for ch in data.channels:
+        saga_channel = SagaChannel()
+        saga_channel.type = ch.type
+        saga_channel.exp = -6 if ch.type.value < ChannelType.status.value else 0
+        channels.append(saga_channel)
+
+    sampling_thread = types.SimpleNamespace(channels = channels,
+                                            _device_handle = ctypes.c_void_p(0),
+                                            conversion_queue = queue.Queue(),
+                                            num_samples_per_set = data.num_channels,
+                                            sample_conversion = True,
+                                            calibration = SagaCalibrationTable(channels, True))
+    conversion_thread = _ConversionThread(sampling_thread)
+    buffers = [(np.ctypeslib.as_ctypes(np.array(sd.samples, dtype=np.float32)), sd.num_sample_sets) for sd in data.blocks]
+
+    def run():
+        for buffer, num_sets in buffers:
+            conversion_thread._process(buffer, num_sets)
+    return run, None
+
+
+def setup_fan_out(data, num_consumers = 4):
+    """ Distribution of <SampleData> to the queues of registered consumers."""
+    device_id = sample_data_server.createProducerId()
+    queues = [queue.Queue() for i in range(num_consumers)]
+    for q in queues:
+        sample_data_server.registerConsumer(device_id, q)
+
+    def run():
+        for sd in data.blocks:
+            sample_data_server.putSampleData(device_id, sd)
+
+    def cleanup():
+        for q in queues:
+            sample_data_server.unregisterConsumer(device_id, q)
+    return run, cleanup
+
+
+def setup_filter(data):
+    """ Filtering by the RealTimeFilter: band-pass on all analogue channels."""
+    from TMSiSDK.filters import RealTimeFilter
+
+    dev = data.create_device()
+    filter_appl = RealTimeFilter(dev)
+    filter_appl.generateFilter(order = 2, Fc_hp = 1, Fc_lp = min(100, data.sample_rate / 4))
+
+    def run():
+        for sd in data.blocks:
+            filter_appl.filter_thread._filter(sd)
+
+    def cleanup():
+        sample_data_server.unregisterConsumer(dev.id, filter_appl.filter_thread.q_sample_sets)
+    return run, cleanup
+
+
+def setup_notch_filter(data):
+    """ Filtering by the RealTimeFilter: band-pass on all analogue channels,
+        cascaded with a 50 Hz notch and its 2nd and 3rd harmonic on the UNI-
+        and BIP-channels. Compare with the 'filter'-stage for the cost of the
+        notches.
+    """
+    from TMSiSDK.filters import RealTimeFilter
+
+    dev = data.create_device()
+    filter_appl = RealTimeFilter(dev)
+    filter_appl.generateFilter(order = 2, Fc_hp = 1, Fc_lp = min(100, data.sample_rate / 4))
+    filter_appl.generateNotch(Fc = 50, harmonics = 3)
+
+    def run():
+        for sd in data.blocks:
+            filter_appl.filter_thread._filter(sd)
+
+    def cleanup():
+        sample_data_server.unregisterConsumer(dev.id, filter_appl.filter_thread.q_sample_sets)
+    return run, cleanup
+
+
+def _setup_fir_filter(data, method):
+    from TMSiSDK.filters import RealTimeFilter
+
+    dev = data.create_device()
+    filter_appl = RealTimeFilter(dev)
+    filter_appl.generateFilter(Fc_lp = min(100, data.sample_rate / 4), ftype = 'fir')
+    for group in filter_appl._filter_groups:
+        group.fir.method = method
+
+    def run():
+        for sd in data.blocks:
+            filter_appl.filter_thread._filter(sd)
+
+    def cleanup():
+        sample_data_server.unregisterConsumer(dev.id, filter_appl.filter_thread.q_sample_sets)
+    return run, cleanup
+
+
+def setup_fir_direct(data):
+    """ Filtering by the RealTimeFilter: linear-phase FIR low-pass on all 
+        analogue channels, applied with direct convolution.
+    """
+    return _setup_fir_filter(data, 'direct')
+
+
+def setup_fir_fft(data):
+    """ Filtering by the RealTimeFilter: linear-phase FIR low-pass on all 
+        analogue channels, applied with FFT-convolution (overlap-save).
+    """
+    return _setup_fir_filter(data, 'fft')
+
+
+def setup_dsp_pipeline(data):
+    """ Processing by a Pipeline: band-pass on all analogue channels, followed
+        by a 50 Hz notch and its 2nd and 3rd harmonic on the UNI- and BIP-channels.
+    """
+    from TMSiSDK.filters import Pipeline, ButterworthStage, NotchStage
+
+    dev = data.create_device()
+    pipeline = Pipeline(dev, [ButterworthStage(order = 2, Fc_hp = 1, Fc_lp = min(100, data.sample_rate / 4)),
+                              NotchStage(Fc = 50, harmonics = 3)])
+
+    def run():
+        for sd in data.blocks:
+            pipeline._process_sample_data(sd)
+    return run, None
+
+
+def setup_band_power(data):
+    """ Processing by a Pipeline: the EEG band powers of the UNI-channels over
+        a window of 1 second, every 250 ms.
+    """
+    from TMSiSDK.filters import Pipeline, BandPowerStage
+
+    dev = data.create_device()
+    pipeline = Pipeline(dev, [BandPowerStage(window = 1.0, hop = 0.25, ch_types = ['UNI'])])
+
+    def run():
+        for sd in data.blocks:
+            pipeline._process_sample_data(sd)
+    return run, None
+
+
+def setup_rms_envelope(data):
+    """ Processing by a Pipeline, as for the HD-EMG heatmap: 10 Hz high-pass
+        on all analogue channels, followed by their RMS-envelope over 250 ms.
+    """
+    from TMSiSDK.filters import Pipeline, ButterworthStage, RmsStage
+
+    dev = data.create_device()
+    pipeline = Pipeline(dev, [ButterworthStage(order = 2, Fc_hp = 10), RmsStage(window = 0.25)])
+
+    def run():
+        for sd in data.blocks:
+            pipeline._process_sample_data(sd)
+    return run, None
+
+
+def setup_plot_decimation(data):
+    """ Min/max decimation of all channels for the RealTimePlot, with the
+        reshaping of the sample-data as done by its sampling thread.
+    """
+    from TMSiSDK.plotters.plot_decimation import MinMaxDecimator
+
+    decimator = MinMaxDecimator(data.num_channels, data.sample_rate, max(data.sample_rate // 250, 1))
+
+    def run():
+        for sd in data.blocks:
+            decimator.add(np.reshape(sd.samples, (sd.num_samples_per_sample_set, sd.num_sample_sets), order = 'F'))
+    return run, None
+
+
+def _setup_file_writer(data, file_writer, directory):
+    dev = data.create_device()
+
+    def run():
+        file_writer.open(dev)
+        for sd in data.blocks:
+            sample_data_server.putSampleData(dev.id, sd)
+        file_writer.close()
+        file_writer._sampling_thread.join()
+
+    def cleanup():
+        shutil.rmtree(directory, ignore_errors = True)
+    return run, cleanup
+
+
+def setup_poly5_writer(data):
+    """ Writing the sample-data to a Poly5-file."""
+    from TMSiSDK.file_formats.poly5_file_writer import Poly5Writer
+
+    directory = tempfile.mkdtemp()
+    file_writer = Poly5Writer(os.path.join(directory, 'benchmark.poly5'))
+    return _setup_file_writer(data, file_writer, directory)
+
+
+def setup_xdf_writer(data):
+    """ Writing the sample-data to a XDF-file."""
+    from TMSiSDK.file_formats.xdf_file_writer import XdfWriter
+
+    directory = tempfile.mkdtemp()
+    file_writer = XdfWriter(os.path.join(directory, 'benchmark.xdf'), False)
+    return _setup_file_writer(data, file_writer, directory)
+
+
+STAGES = {'conversion': setup_conversion,
+          'fan_out': setup_fan_out,
+          'filter': setup_filter,
+          'notch_filter': setup_notch_filter,
+          'fir_direct': setup_fir_direct,
+          'fir_fft': setup_fir_fft,
+          'dsp_pipeline': setup_dsp_pipeline,
+          'band_power': setup_band_power,
+          'rms_envelope': setup_rms_envelope,
+          'plot_decimation': setup_plot_decimation,
+          'poly5_writer': setup_poly5_writer,
+          'xdf_writer': setup_xdf_writer}
+
+
+def _is_missing_dependency(e):
+    # A stage is skipped when a package or library it needs is not available:
+    # an ImportError, an OSError when loading a library, or the NameError that
+    # the SAGA-modules raise when the SagaSDK-library could not be loaded
+    if isinstance(e, (ImportError, OSError)):
+        return True
+    return isinstance(e, NameError) and getattr(e, 'name', None) == 'SagaSDK'
+
+
+def run_stage(stage, data):
+    """ Runs one stage twice: once to measure the throughput and CPU-time and
+        once with memory tracing enabled to measure the peak memory usage.
+
+        Returns:
+            <dict> with the results, or the reason why the stage is skipped.
+    """
+    result = {'stage': stage, 'channels': data.num_channels, 'sample_rate': data.sample_rate, 'duration': data.duration}
+    try:
+        run, cleanup = STAGES[stage](data)
+    except Exception as e:
+        if not _is_missing_dependency(e):
+            raise
+        result['skipped'] = type(e).__name__ + ': ' + str(e)
+        return result
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    run()
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    if cleanup:
+        cleanup()
+
+    run, cleanup = STAGES[stage](data)
+    tracemalloc.start()
+    try:
+        run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if cleanup:
+        cleanup()
+
+    result['wall_time'] = wall_time
+    result['throughput'] = data.num_sample_sets / wall_time
+    result['realtime_factor'] = data.duration / wall_time
+    result['cpu_per_realtime_second'] = cpu_time / data.duration
+    result['peak_memory'] = peak_memory
+    return result
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = ''
+    import scipy
+    return {'date': datetime.now().isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor()}
+
+
+def print_results(results, baseline = None):
+    baseline_throughput = {}
+    if baseline:
+        for r in baseline['results']:
+            if 'throughput' in r:
+                baseline_throughput[(r['stage'], r['channels'], r['sample_rate'])] = r['throughput']
+
+    print(f"\n{'stage':<14}{'channels':>9}{'rate [Hz]':>11}{'sets/s':>14}{'x real-time':>13}{'CPU/s':>9}{'peak [kB]':>11}" + \
+          (f"{'vs baseline':>13}" if baseline else ''))
+    for r in results:
+        line = f"{r['stage']:<14}{r['channels']:>9}{r['sample_rate']:>11}"
+        if 'skipped' in r:
+            print(line + '   skipped (' + r['skipped'] + ')')
+            continue
+        line += f"{r['throughput']:>14.0f}{r['realtime_factor']:>13.1f}{r['cpu_per_realtime_second']:>9.4f}{r['peak_memory'] / 1024:>11.0f}"
+        key = (r['stage'], r['channels'], r['sample_rate'])
+        if key in baseline_throughput:
+            line += f"{r['throughput'] / baseline_throughput[key]:>12.2f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark the stages of the acquisition pipeline.')
+    parser.add_argument('--channels', type = int, nargs = '+', default = [32, 64, 136], help = 'total number of channels')
+    parser.add_argument('--rates', type = int, nargs = '+', default = [500, 2000, 4096], help = 'sample rates in Hz')
+    parser.add_argument('--duration', type = float, default = 10.0, help = 'seconds of synthetic sample-data per run')
+    parser.add_argument('--stages', nargs = '+', default = list(STAGES.keys()), choices = list(STAGES.keys()))
+    parser.add_argument('--output', help = 'json-file to write the results to')
+    parser.add_argument('--baseline', help = 'json-file with results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    settings._initialize()
+
+    results = []
+    for num_channels in args.channels:
+        for sample_rate in args.rates:
+            data = SyntheticData(num_channels, sample_rate, args.duration)
+            for stage in args.stages:
+                results.append(run_stage(stage, data))
+                print('.', end = '', flush = True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'metadata': _metadata(), 'results': results}, f, indent = 2)
@@ -0,0 +1,72 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+Example : This example shows how to record without a GUI with the acquisition 
+            daemon. The measurement keeps running, while the recording is 
+            started, continued in a new file and stopped. The same operations
+            are available through the local control-API when the daemon is 
+            started as a service:
+
+                python -m TMSiSDK.acquisition_daemon --directory ../measurements --rotate 3600 --record
+
+'''
+
+import sys
+sys.path.append("../")
+import time
+
+from TMSiSDK import tmsi_device
+from TMSiSDK.device import DeviceInterfaceType
+from TMSiSDK.file_writer import FileFormat
+from TMSiSDK.acquisition_daemon import AcquisitionDaemon
+from TMSiSDK.error import TMSiError
+
+
+try:
+    # Initialise the TMSi-SDK first before starting using it
+    tmsi_device.initialize()
+    
+    # Create the device object to interface with the SAGA-system and open it
+    dev = tmsi_device.create(tmsi_device.DeviceType.saga, DeviceInterfaceType.docked, DeviceInterfaceType.usb)
+    dev.open()
+    
+    # Create the daemon, which writes Poly5-files into the measurements-directory
+    daemon = AcquisitionDaemon(dev, "../measurements", FileFormat.poly5, prefix = "example_acquisition_daemon")
+    daemon.start()
+    
+    # Record for 10 seconds, continue in a new file and record for 10 more seconds
+    print(daemon.start_recording())
+    time.sleep(10)
+    print(daemon.rotate())
+    time.sleep(10)
+    print(daemon.stop_recording())
+    
+    # Throughput and sample-loss of the measurement
+    print(daemon.metrics())
+    
+    daemon.stop()
+    dev.close()
+    
+except TMSiError as e:
+    print("!!! TMSiError !!! : ", e.code)
@@ -0,0 +1,94 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+Example : This example shows how to compute the power in the EEG-bands 
+            (delta, theta, alpha, beta and gamma) of the UNI channels with a
+            pipeline. Every 250 ms the band powers over the last second are
+            published to the sample data server; the alpha power of the 
+            first UNI channel is printed.
+
+'''
+
+import sys
+sys.path.append("../")
+
+import queue
+import time
+
+from TMSiSDK import tmsi_device
+from TMSiSDK import filters
+from TMSiSDK import sample_data_server
+from TMSiSDK.device import DeviceInterfaceType, ChannelType
+from TMSiSDK.error import TMSiError, TMSiErrorCode, DeviceErrorLookupTable
+
+
+try:
+    # Initialise the TMSi-SDK first before starting using it
+    tmsi_device.initialize()
+    
+    # Create the device object to interface with the SAGA-system.
+    dev = tmsi_device.create(tmsi_device.DeviceType.saga, DeviceInterfaceType.docked, DeviceInterfaceType.usb)
+    
+    # Find and open a connection to the SAGA-system
+    dev.open()
+    
+    # Set the sample rate to 500 Hz
+    dev.config.base_sample_rate = 4000
+    dev.config.set_sample_rate(ChannelType.all_types, 8)
+    
+    # Define the pipeline: a high-pass filter on the UNI channels, followed by
+    # the band powers of the UNI channels over a window of 1 second, computed
+    # with 2 Welch-segments of 0.5 seconds, every 0.25 seconds
+    pipeline = filters.Pipeline(dev, [filters.ButterworthStage(Fc_hp=1, ch_types=['UNI']),
+                                      filters.BandPowerStage(window=1.0, hop=0.25, segment=0.5, ch_types=['UNI'])])
+    pipeline.configure()
+    alpha = [ch.name.endswith(' alpha') for ch in pipeline.channels].index(True)
+    
+    # Register a queue for the band powers and start the pipeline, which 
+    # starts the measurement
+    q_band_powers = queue.Queue(1000)
+    sample_data_server.registerConsumer(pipeline.id, q_band_powers, 'band-powers')
+    pipeline.start()
+    
+    end_time = time.time() + 10
+    while time.time() < end_time:
+        try:
+            sd = q_band_powers.get(timeout = 0.5)
+        except queue.Empty:
+            continue
+        for i in range(sd.num_sample_sets):
+            sample_set = sd.samples[i * sd.num_samples_per_sample_set:(i + 1) * sd.num_samples_per_sample_set]
+            print(pipeline.channels[alpha].name, ':', round(float(sample_set[alpha]), 2), pipeline.channels[alpha].unit_name)
+    
+    # Stop the pipeline and the measurement
+    pipeline.stop()
+    sample_data_server.unregisterConsumer(pipeline.id, q_band_powers)
+    
+    # Close the connection to the SAGA device
+    dev.close()
+    
+except TMSiError as e:
+    print("!!! TMSiError !!! : ", e.code)
+    if (e.code == TMSiErrorCode.device_error) :
+        print("  => device error : 0x", hex(dev.status.error))
+        DeviceErrorLookupTable(hex(dev.status.error))
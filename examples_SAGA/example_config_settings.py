@@ -57,22 +57,23 @@ try:
     print('Sync out configuration: \t', dev.config.get_sync_out_config())
     print('Triggers:\t\t\t\t\t', dev.config.triggers )
     
-    # Update the different configuration options:
-    
-    # Set base sample rate: either 4000 Hz (default)or 4096 Hz.
-    dev.config.base_sample_rate = 4000
-    
-    # Set sample rate to 2000 Hz (base_sample_rate/2)
-    dev.config.set_sample_rate(ChannelType.all_types, 2)
-    
-    # Specify the reference method and reference switch method that are used during sampling 
-    dev.config.reference_method = ReferenceMethod.common,ReferenceSwitch.fixed
-    
-    # Set the trigger settings
-    dev.config.triggers=True
-    
-    # Set the sync out configuration
-    dev.config.set_sync_out_config(marker=False, freq=1, duty_cycle=50)
+    # Update the different configuration options. The changes made within the
+    # batch are uploaded to the device together, when the batch ends:
+    with dev.config.batch():
+        # Set base sample rate: either 4000 Hz (default)or 4096 Hz.
+        dev.config.base_sample_rate = 4000
+        
+        # Set sample rate to 2000 Hz (base_sample_rate/2)
+        dev.config.set_sample_rate(ChannelType.all_types, 2)
+        
+        # Specify the reference method and reference switch method that are used during sampling 
+        dev.config.reference_method = ReferenceMethod.common,ReferenceSwitch.fixed
+        
+        # Set the trigger settings
+        dev.config.triggers=True
+        
+        # Set the sync out configuration
+        dev.config.set_sync_out_config(marker=False, freq=1, duty_cycle=50)
 
     # Print new device configuation
     print('\n\nNew device configuration:')
@@ -0,0 +1,102 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+Example : This example shows how to process the sample data with a pipeline
+            of DSP-stages. All stages run in one thread, the processed data 
+            is published to the sample data server and shown in the plotter.
+            After the plotter is closed, the processing time per stage and
+            the CPU-load of the plotter are printed.
+
+'''
+
+import sys
+sys.path.append("../")
+
+from PySide2 import QtWidgets
+
+from TMSiSDK import tmsi_device
+from TMSiSDK import plotters
+from TMSiSDK import filters
+from TMSiSDK.device import DeviceInterfaceType, ChannelType
+from TMSiSDK.error import TMSiError, TMSiErrorCode, DeviceErrorLookupTable
+
+
+try:
+    # Initialise the TMSi-SDK first before starting using it
+    tmsi_device.initialize()
+    
+    # Create the device object to interface with the SAGA-system.
+    dev = tmsi_device.create(tmsi_device.DeviceType.saga, DeviceInterfaceType.docked, DeviceInterfaceType.usb)
+    
+    # Find and open a connection to the SAGA-system
+    dev.open()
+    
+    # Set the sample rate to 1000 Hz
+    dev.config.base_sample_rate = 4000
+    dev.config.set_sample_rate(ChannelType.all_types, 4)
+    
+    # Define the pipeline: a band-pass filter on the UNI channels, followed by
+    # a low-pass filter on the BIP channels and a common average reference of 
+    # the UNI channels. The 4th UNI channel is left out of the common average
+    pipeline = filters.Pipeline(dev, [filters.ButterworthStage(Fc_hp=1, Fc_lp=100, ch_types=['UNI']),
+                                      filters.ButterworthStage(order=4, Fc_lp=20, ch_types=['BIP']),
+                                      filters.SpatialFilterStage(filters.montage.common_average, bad_channels=['UNI 4'])])
+    
+    # Check if there is already a plotter application in existence
+    plotter_app = QtWidgets.QApplication.instance()
+    
+    # Initialise the plotter application if there is no other plotter application
+    if not plotter_app:
+        plotter_app = QtWidgets.QApplication(sys.argv)
+    
+    # Define the GUI object and show it. The pipeline starts and stops the 
+    # measurement in the same way as a RealTimeFilter
+    plot_window = plotters.RealTimePlot(figurename = 'A RealTimePlot', 
+                                        device = dev, 
+                                        channel_selection = [0, 1, 2], 
+                                        filter_app = pipeline)
+    plot_window.show()
+    
+    # Enter the event loop
+    plotter_app.exec_()
+    
+    # Quit and delete the Plotter application
+    QtWidgets.QApplication.quit()
+    del plotter_app
+    
+    # Print the processing time of the stages
+    for stage, timing in pipeline.get_statistics().items():
+        print(stage, ': mean', round(timing['mean'] * 1000, 3), 'ms, max', round(timing['max'] * 1000, 3), 'ms')
+    
+    # Print the CPU-time used by the plot, as fraction of one CPU-core
+    for part, timing in plot_window.get_statistics().items():
+        print('plot', part, ': mean', round(timing['mean'] * 1000, 3), 'ms, CPU-load', round(timing['load'] * 100, 1), '%')
+    
+    # Close the connection to the SAGA device
+    dev.close()
+    
+except TMSiError as e:
+    print("!!! TMSiError !!! : ", e.code)
+    if (e.code == TMSiErrorCode.device_error) :
+        print("  => device error : 0x", hex(dev.status.error))
+        DeviceErrorLookupTable(hex(dev.status.error))
@@ -85,6 +85,9 @@ try:
     filter_appl = filters.RealTimeFilter(dev)
     filter_appl.generateFilter(Fc_hp=5, Fc_lp=100)
     
+    # Suppress the power-line interference: a notch at 50 Hz and its 2nd harmonic
+    filter_appl.generateNotch(Fc=50, harmonics=2)
+    
     # Check if there is already a plotter application in existence
     plotter_app = QtWidgets.QApplication.instance()
     
@@ -0,0 +1,79 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+
+Example : This example shows how to record with two SAGA-systems at the same 
+            time, e.g. for a 128+ channel setup. Both systems are started 
+            together and their sample-data is aligned on the COUNTER-channels 
+            into one measurement, which is written to one XDF-file. For an 
+            accurate alignment, feed a common trigger to the sync-inputs of 
+            both systems and pass the name of the trigger channel as 
+            'sync_channel'.
+
+'''
+
+import sys
+sys.path.append("../")
+import time
+
+from TMSiSDK import tmsi_device
+from TMSiSDK.device import DeviceInterfaceType
+from TMSiSDK.devices.multi.multi_device import MultiDevice
+from TMSiSDK.file_writer import FileWriter, FileFormat
+from TMSiSDK.error import TMSiError
+
+
+try:
+    # Initialise the TMSi-SDK first before starting using it
+    tmsi_device.initialize()
+    
+    # Create a device object for each of the SAGA-systems and open them
+    dev1 = tmsi_device.create(tmsi_device.DeviceType.saga, DeviceInterfaceType.docked, DeviceInterfaceType.usb)
+    dev2 = tmsi_device.create(tmsi_device.DeviceType.saga, DeviceInterfaceType.docked, DeviceInterfaceType.usb)
+    dev1.open()
+    dev2.open()
+    
+    # Both systems must run at the same sample rate
+    dev1.config.base_sample_rate = 4000
+    dev2.config.base_sample_rate = 4000
+    
+    # Combine the systems into one device. Use sync_channel = None to align
+    # on the COUNTER-channels only
+    dev = MultiDevice([dev1, dev2], sync_channel = None)
+    dev.open()
+    
+    # Initialise a file-writer class (XDF-format) and state its file path
+    file_writer = FileWriter(FileFormat.xdf, "../measurements/example_multi_device.xdf")
+    file_writer.open(dev)
+    
+    # Start the measurement on both systems and record 30 seconds
+    dev.start_measurement()
+    time.sleep(30)
+    dev.stop_measurement()
+    
+    # Close the file writer and the connection to both systems
+    file_writer.close()
+    dev.close()
+    
+except TMSiError as e:
+    print("!!! TMSiError !!! : ", e.code)
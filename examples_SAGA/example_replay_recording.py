@@ -0,0 +1,73 @@
+'''
+Copyright 2021 Twente Medical Systems international B.V., Oldenzaal The Netherlands
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+#######  #     #   #####   #  ######      #     #
+   #     ##   ##  #        #  #     #     #     #
+   #     # # # #  #        #  #     #     #     #
+   #     #  #  #   #####   #  ######       #   #
+   #     #     #        #  #  #     #      #   #
+   #     #     #        #  #  #     #       # #
+   #     #     #  #####    #  ######   #     #     #
+
+Example : This example shows how to replay a recorded measurement. The 
+            recording is forwarded to the sample-data-server as if it were a 
+            measurement of an attached system, so the same file-writers, filters 
+            and plotters can be used. Here the recording is filtered and written
+            to a new Poly5-file at 10 times real-time speed.
+
+'''
+
+import sys
+sys.path.append("../")
+import time
+
+from TMSiSDK import tmsi_device
+from TMSiSDK import filters
+from TMSiSDK.devices.replay.replay_device import ReplayDevice
+from TMSiSDK.file_writer import FileWriter, FileFormat
+from TMSiSDK.error import TMSiError
+
+
+try:
+    # Initialise the TMSi-SDK first before starting using it
+    tmsi_device.initialize()
+    
+    # Create the replay device. Use speed = None to replay as fast as possible
+    dev = ReplayDevice("../measurements/example_EEG_workflow.poly5", speed = 10.0)
+    
+    # Read the channel list, sample rate and samples from the recording
+    dev.open()
+    
+    # Initialise a file-writer class (Poly5-format) and state its file path
+    file_writer = FileWriter(FileFormat.poly5, "../measurements/example_replay_recording.poly5")
+    file_writer.open(dev)
+    
+    # Initialise the filter, starting the filter also starts the replay
+    filter_appl = filters.RealTimeFilter(dev)
+    filter_appl.generateFilter(Fc_hp=1, Fc_lp=100)
+    filter_appl.start()
+    
+    # Wait until the complete recording has been replayed
+    dev.wait()
+    time.sleep(1)
+    
+    # Stop the filter (and the replay) and close the file writer
+    filter_appl.stop()
+    file_writer.close()
+    
+    dev.close()
+    
+except TMSiError as e:
+    print("!!! TMSiError !!! : ", e.code)